@@ -0,0 +1,291 @@
+"""
+Season-wide sales analytics over the CSV ledger (order_logs/orders_*.csv).
+
+    python analytics.py revenue [--by hour|day|weekday|week|weekend|month|season]
+                                [--from YYYY-MM-DD] [--to YYYY-MM-DD]
+    python analytics.py top [--per day|weekday|week|weekend|month|season] [--category NAME]
+                            [--rank quantity|revenue] [--limit 3] [--from ...] [--to ...]
+    python analytics.py cache                              build the column cache for every day
+
+e.g. the best-selling cocktail per weekend is `top --per weekend --category Cocktails
+--limit 1`, revenue by hour across August `revenue --by hour --from 2026-08-01
+--to 2026-08-31`.
+
+Each day file is parsed once into NumPy columns - one row per order (time, seat,
+payment, total) and one per item line (order, item, quantity, unit price) - with
+item names and seats dictionary-encoded as int32 codes. The columns are saved to
+order_logs/analytics/orders_<day>.npz together with the CSV's size and mtime, so
+later runs only parse a day whose file has changed (usually just today). A query
+loads the cached days in range, maps their dictionaries onto one for the season and
+aggregates with np.unique/np.bincount, never looping over rows in Python.
+
+Torn or unreadable rows and an order cut off at the end of a file are left out, as
+in `ledger_cli.py check`. Needs NumPy, which the POS app itself does not.
+"""
+import argparse
+import csv
+import io
+import os
+import sys
+
+import numpy as np
+
+import app31
+
+CACHE_FORMAT = 1
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+BUCKETS = ('hour', 'day', 'weekday', 'week', 'weekend', 'month', 'season')
+
+
+def cache_dir():
+    return app31.LEDGER_DIR / 'analytics'
+
+
+def parse_day(csv_file, size):
+    """Parses the first `size` bytes of a day file into a dict of columns and dictionaries."""
+    with open(csv_file, mode='rb') as f:
+        text = f.read(size).decode('utf-8', errors='replace')
+    seats, items = {}, {}
+    order_time, order_seat, order_card, order_cents = [], [], [], []
+    line_order, line_item, line_quantity, line_cents = [], [], [], []
+    open_items = []  # (item, quantity, cents) since the last ORDER TOTAL
+    for row in csv.DictReader(io.StringIO(text, newline='')):
+        if None in row or None in row.values() or row['item_name'] in app31.SUMMARY_ITEM_NAMES:
+            continue
+        try:
+            if row['item_name'] != 'ORDER TOTAL':
+                open_items.append((items.setdefault(row['item_name'], len(items)), app31._row_quantity(row),
+                                   app31._to_cents(row['price'] or 0)))
+                continue
+            time = np.datetime64(row['timestamp'].replace(' ', 'T'), 's')
+            cents = app31._to_cents(row['price'] or 0)
+        except ValueError:
+            if row['item_name'] == 'ORDER TOTAL':
+                open_items = []
+            continue
+        for item, quantity, unit_cents in open_items:
+            line_order.append(len(order_time))
+            line_item.append(item)
+            line_quantity.append(quantity)
+            line_cents.append(unit_cents)
+        order_time.append(time)
+        order_seat.append(seats.setdefault(row['seat'], len(seats)))
+        order_card.append(row['payment_method'] == 'CARD')
+        order_cents.append(cents)
+        open_items = []
+    return {
+        'order_time': np.array(order_time, dtype='datetime64[s]'),
+        'order_seat': np.array(order_seat, dtype=np.int32),
+        'order_card': np.array(order_card, dtype=bool),
+        'order_cents': np.array(order_cents, dtype=np.int64),
+        'line_order': np.array(line_order, dtype=np.int32),
+        'line_item': np.array(line_item, dtype=np.int32),
+        'line_quantity': np.array(line_quantity, dtype=np.int32),
+        'line_cents': np.array(line_cents, dtype=np.int64),
+        'seat_names': np.array(list(seats), dtype=str),
+        'item_names': np.array(list(items), dtype=str),
+    }
+
+
+def load_day(csv_file):
+    """The columns of one day file, from the cache if it was built for the file as it is now."""
+    st = csv_file.stat()
+    source = np.array([CACHE_FORMAT, st.st_size, st.st_mtime_ns], dtype=np.int64)
+    cache_file = cache_dir() / f"{csv_file.stem}.npz"
+    try:
+        with np.load(cache_file) as cached:
+            if np.array_equal(cached['source'], source):
+                return {name: cached[name] for name in cached.files if name != 'source'}
+    except (FileNotFoundError, ValueError, KeyError, OSError):
+        pass
+
+    columns = parse_day(csv_file, st.st_size)
+    cache_dir().mkdir(parents=True, exist_ok=True)
+    temp_file = cache_file.with_suffix(f'.{os.getpid()}.tmp')
+    with open(temp_file, mode='wb') as f:
+        np.savez(f, source=source, **columns)
+    os.replace(temp_file, cache_file)
+    return columns
+
+
+def _merge_dictionary(days, codes, names):
+    """Concatenates one dictionary-encoded column of several days onto a shared, sorted dictionary."""
+    merged = np.unique(np.concatenate([day[names] for day in days] or [np.array([], dtype=str)]))
+    return merged, np.concatenate(
+        [np.searchsorted(merged, day[names]).astype(np.int32)[day[codes]] for day in days]
+        or [np.array([], dtype=np.int32)])
+
+
+class Season:
+    """The orders and item lines of a range of days as columns, with season-wide item and seat dictionaries."""
+
+    def __init__(self, days):
+        def column(name, dtype):
+            return np.concatenate([day[name] for day in days]) if days else np.array([], dtype=dtype)
+
+        self.days = len(days)
+        self.order_time = column('order_time', 'datetime64[s]')
+        self.order_card = column('order_card', bool)
+        self.order_cents = column('order_cents', np.int64)
+        self.seat_names, self.order_seat = _merge_dictionary(days, 'order_seat', 'seat_names')
+        self.item_names, self.line_item = _merge_dictionary(days, 'line_item', 'item_names')
+        # Item lines point at their order within the day; make that an index into the season
+        offsets = np.cumsum([0] + [len(day['order_time']) for day in days[:-1]])
+        self.line_order = np.concatenate([day['line_order'] + offset for day, offset in zip(days, offsets)]) \
+            if days else np.array([], dtype=np.int32)
+        self.line_quantity = column('line_quantity', np.int32)
+        self.line_revenue = column('line_cents', np.int64) * self.line_quantity
+
+    def revenue(self, by='hour'):
+        """[(bucket, orders, cash_cents, card_cents)] for the orders in each time bucket."""
+        keys, mask = time_buckets(self.order_time, by)
+        card = np.where(self.order_card, self.order_cents, 0)
+        buckets, (orders, card_cents, total_cents) = group_sum(
+            keys[mask], np.ones(mask.sum(), dtype=np.int64), card[mask], self.order_cents[mask])
+        return [(bucket_label(bucket, by), int(n), int(total - card), int(card))
+                for bucket, n, card, total in zip(buckets, orders, card_cents, total_cents)]
+
+    def top_items(self, per='weekend', rank='quantity', items=None, limit=3):
+        """
+        {bucket: [(item, quantity, revenue_cents)]}: the `limit` best items of each time
+        bucket, ranked by quantity or revenue, optionally only among the item names in `items`.
+        """
+        keys, mask = time_buckets(self.order_time[self.line_order], per)
+        if items is not None:
+            mask &= np.isin(self.item_names, list(items))[self.line_item]
+        buckets, bucket_codes = np.unique(keys[mask], return_inverse=True)
+        pairs = bucket_codes.astype(np.int64) * len(self.item_names) + self.line_item[mask]
+        pair_keys, (quantity, revenue) = group_sum(pairs, self.line_quantity[mask], self.line_revenue[mask])
+        pair_bucket, pair_item = np.divmod(pair_keys, max(len(self.item_names), 1))
+        score = quantity if rank == 'quantity' else revenue
+        order = np.lexsort((pair_item, -score, pair_bucket))
+        # Position of each pair within its bucket, so the first `limit` can be taken at once
+        first = np.searchsorted(pair_bucket[order], pair_bucket[order])
+        keep = order[np.arange(len(order)) - first < limit]
+        result = {bucket_label(bucket, per): [] for bucket in buckets}
+        for b, item, q, r in zip(pair_bucket[keep], pair_item[keep], quantity[keep], revenue[keep]):
+            result[bucket_label(buckets[b], per)].append((str(self.item_names[item]), int(q), int(r)))
+        return result
+
+
+def group_sum(keys, *values):
+    """Sums each values array per distinct key; returns (sorted keys, [int64 sums])."""
+    unique, inverse = np.unique(keys, return_inverse=True)
+    return unique, [np.bincount(inverse, weights=v, minlength=len(unique)).round().astype(np.int64)
+                    for v in values]
+
+
+def time_buckets(times, by):
+    """
+    (keys, mask) assigning each datetime64 to a bucket: hour of day, day, weekday
+    (0 = Monday), week (its Monday), weekend (its Saturday; mask drops Mon-Fri), month
+    or the whole season.
+    """
+    days = times.astype('datetime64[D]')
+    weekday = (days.astype(np.int64) + 3) % 7  # 1970-01-01 was a Thursday
+    mask = np.ones(len(times), dtype=bool)
+    if by == 'hour':
+        keys = (times - days).astype('timedelta64[h]').astype(np.int64)
+    elif by == 'day':
+        keys = days
+    elif by == 'weekday':
+        keys = weekday
+    elif by == 'week':
+        keys = days - weekday.astype('timedelta64[D]')
+    elif by == 'weekend':
+        mask = weekday >= 5
+        keys = days - (weekday - 5).astype('timedelta64[D]')
+    elif by == 'month':
+        keys = times.astype('datetime64[M]')
+    elif by == 'season':
+        keys = np.zeros(len(times), dtype=np.int64)
+    else:
+        raise ValueError(f"Unknown time bucket: {by}")
+    return keys, mask
+
+
+def bucket_label(key, by):
+    if by == 'hour':
+        return f"{int(key):02d}:00"
+    if by == 'weekday':
+        return WEEKDAYS[int(key)]
+    if by == 'season':
+        return 'season'
+    return str(key)
+
+
+def day_files(start=None, end=None):
+    """The day files in LEDGER_DIR, oldest first, optionally limited to start..end (inclusive)."""
+    files = []
+    for csv_file in sorted(app31.LEDGER_DIR.glob('orders_*.csv')):
+        day = csv_file.stem[len('orders_'):]
+        if (start is None or day >= start) and (end is None or day <= end):
+            files.append(csv_file)
+    return files
+
+
+def load_season(start=None, end=None):
+    return Season([load_day(csv_file) for csv_file in day_files(start, end)])
+
+
+def category_items(name):
+    """The item names in a menu category, for filtering; raises ValueError if there is no such category."""
+    category = app31.get_menu_snapshot().categories_by_name.get(name)
+    if category is None:
+        raise ValueError(f"No menu category named {name!r}")
+    return {item.name for item in category.items} | \
+        {f"{item.name} ({option.label})" for item in category.items for option in item.options}
+
+
+def cmd_revenue(args, season):
+    print(f"{'bucket':<12} {'orders':>8} {'cash':>12} {'card':>12} {'total':>12}")
+    for bucket, orders, cash, card in season.revenue(args.by):
+        print(f"{bucket:<12} {orders:>8} {cash / 100:>12.2f} {card / 100:>12.2f} {(cash + card) / 100:>12.2f}")
+    return 0
+
+
+def cmd_top(args, season):
+    items = category_items(args.category) if args.category else None
+    for bucket, ranked in season.top_items(args.per, args.rank, items, args.limit).items():
+        for place, (name, quantity, cents) in enumerate(ranked, 1):
+            print(f"{bucket:<12} {place:>2}. {name:<32} {quantity:>6} {cents / 100:>10.2f}")
+    return 0
+
+
+def cmd_cache(args, season):
+    print(f"{season.days} days cached under {cache_dir()}: {len(season.order_cents)} orders, "
+          f"{len(season.line_item)} item lines")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Season-wide sales analytics over the CSV ledger.')
+    days = argparse.ArgumentParser(add_help=False)
+    days.add_argument('--from', dest='start', help='First day (YYYY-MM-DD)')
+    days.add_argument('--to', dest='end', help='Last day (YYYY-MM-DD)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    revenue = commands.add_parser('revenue', parents=[days], help='Orders and revenue per time bucket')
+    revenue.add_argument('--by', choices=BUCKETS, default='hour')
+    revenue.set_defaults(func=cmd_revenue)
+
+    top = commands.add_parser('top', parents=[days], help='Best-selling items per time bucket')
+    top.add_argument('--per', choices=BUCKETS, default='season')
+    top.add_argument('--rank', choices=('quantity', 'revenue'), default='quantity')
+    top.add_argument('--category', help='Only items of this menu category')
+    top.add_argument('--limit', type=int, default=3)
+    top.set_defaults(func=cmd_top)
+
+    cache = commands.add_parser('cache', parents=[days], help='Parse and cache every day file')
+    cache.set_defaults(func=cmd_cache)
+
+    args = parser.parse_args(argv)
+    try:
+        return args.func(args, load_season(args.start, args.end))
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
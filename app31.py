@@ -5,133 +5,1774 @@ from datetime import datetime
 from pathlib import Path
 import xml.etree.ElementTree as ET
 import os
+import re
+import hashlib
+import io
+import json
+import math
+import queue
+import threading
+import time
+import unicodedata
+import uuid
+import zlib
+import base64
+import copy
+import sqlite3
+import tempfile
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+from xml.sax.saxutils import quoteattr
+from werkzeug.serving import is_running_from_reloader
+
+try:
+    import fcntl
+except ImportError:  # Windows: the menu write lock only covers this process
+    fcntl = None
 
 app = Flask(__name__)
 app.secret_key = 'your_secret_key_here'  # Change this to a secure random key
 
-# Printer configuration
-PRINTER_IP = '192.168.2.218'
-PRINTER_PORT = 9100
+# Printer configuration
+PRINTER_IP = '192.168.2.218'
+PRINTER_PORT = 9100
+PRINTER_TIMEOUT = 5
+PRINTER_STATUS_CHECK = False  # ask for the paper status (DLE EOT 4) before each ticket
+PRINTER_STATUS_TIMEOUT = 0.5  # seconds to wait for that answer; without one the ticket is sent anyway
+PRINTER_DRAIN_TIMEOUT = 0.5  # seconds to watch for a reset after sending
+
+# ESC/POS commands
+CUT_PAPER = b'\x1D\x56\x00'  # Full cut command
+PAPER_STATUS = b'\x10\x04\x04'  # DLE EOT 4: real-time roll paper sensor status
+PAPER_END = 0x60  # bits set in the DLE EOT 4 reply when the roll is out
+LINE_FEED = b'\n'
+
+# Menu XML file path
+MENU_FILE = 'menu.xml'
+
+# --- Menu schema ---
+# <menu schema="N"> records which migrations a menu.xml has been through; files
+# written by app28/app29 have no marker and count as schema 0. migrate_menu_file()
+# brings the file up to MENU_SCHEMA_VERSION once, at startup or through
+# `menu_cli.py migrate`, and every writer below writes the current schema, so the
+# read path never has to check or rewrite anything.
+MENU_SCHEMA_VERSION = 2
+
+
+def _migrate_category_order(root):
+    """Schema 1: every <category> has an 'order' attribute."""
+    for i, category_elem in enumerate(root.findall('category')):
+        if 'order' not in category_elem.attrib:
+            category_elem.set('order', str(i))
+
+
+def _migrate_menu_ids(root):
+    """
+    Schema 2: every <item> and <option> has a unique 'id'. Missing ids become the
+    stand-in ids the read path served for them, so clients holding those keep working.
+    """
+    seen_ids = set()
+
+    def assign(elem, fallback):
+        element_id = elem.get('id') or fallback
+        if element_id in seen_ids:
+            element_id = new_menu_id()
+        elem.set('id', element_id)
+        seen_ids.add(element_id)
+
+    for category_elem in root.findall('category'):
+        for position, item_elem in enumerate(category_elem.findall('item')):
+            assign(item_elem, _fallback_menu_id(category_elem.get('name'), position, item_elem.findtext('name')))
+            for index, option_elem in enumerate(item_elem.iterfind('options/option')):
+                assign(option_elem, _fallback_menu_id(item_elem.get('id'), index))
+
+
+# The step that takes a file from schema N-1 to N
+MENU_MIGRATIONS = {1: _migrate_category_order, 2: _migrate_menu_ids}
+
+
+def migrate_menu_file():
+    """
+    Upgrades menu.xml to MENU_SCHEMA_VERSION in one atomic write and bumps its
+    version. Returns the schema steps applied, empty if the file was already
+    current or does not exist. Raises RuntimeError for a newer schema than this app knows.
+    """
+    with menu_write_lock():
+        attrib = _menu_root_attrib()
+        if attrib is None:
+            return []
+        schema = int(attrib.get('schema', 0))
+        if schema > MENU_SCHEMA_VERSION:
+            raise RuntimeError(f"{MENU_FILE} has schema {schema}, newer than this app's {MENU_SCHEMA_VERSION}")
+        steps = list(range(schema + 1, MENU_SCHEMA_VERSION + 1))
+        if not steps:
+            return []
+
+        previous = get_menu_snapshot()
+        tree = ET.parse(MENU_FILE)
+        root = tree.getroot()
+        for step in steps:
+            MENU_MIGRATIONS[step](root)
+        root.set('version', str(int(root.get('version', 0)) + 1))
+        root.set('schema', str(MENU_SCHEMA_VERSION))
+        _write_menu_tree(tree)
+        invalidate_menu_cache()
+        record_menu_change(diff_menus(previous, get_menu_snapshot()))
+    publish_menu_change()
+    return steps
+
+
+def new_menu_id():
+    """A fresh id for a menu item or option."""
+    return uuid.uuid4().hex[:12]
+
+
+def _fallback_menu_id(*parts):
+    """A stable stand-in id for an element read before its id could be written."""
+    return 'x' + hashlib.sha1('/'.join(map(str, parts)).encode('utf-8')).hexdigest()[:11]
+
+
+# --- Menu writes ---
+# menu.xml is only ever replaced whole: the new tree goes to a temp file in the same
+# directory, is fsynced and then renamed over the old one, so a crash leaves either
+# the old or the new menu, never a truncated one. Writers serialize on an exclusive
+# flock on MENU_LOCK_FILE (plus a thread lock within the process) and bump the
+# 'version' attribute on <menu>. Readers never take the write lock; they keep
+# reading the last committed file through the cache below.
+MENU_LOCK_FILE = MENU_FILE + '.lock'
+
+_menu_write_lock = threading.RLock()
+_menu_write_state = {'depth': 0, 'lock_file': None}
+
+
+class MenuVersionConflict(Exception):
+    """A menu write was based on a version that is no longer the current one."""
+
+    def __init__(self, version, etag):
+        super().__init__(f"Menu is at version {version}")
+        self.version = version
+        self.etag = etag
+
+
+class MenuEditError(Exception):
+    """An invalid menu operation; `status` is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+@contextmanager
+def menu_write_lock(blocking=True):
+    """
+    Exclusive menu write lock, across threads and processes. Re-entrant per thread.
+    Yields True once held; with blocking=False it yields False instead of waiting.
+    """
+    if not _menu_write_lock.acquire(blocking):
+        yield False
+        return
+    try:
+        if _menu_write_state['depth'] == 0:
+            lock_file = open(MENU_LOCK_FILE, 'a')
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+                except BlockingIOError:
+                    lock_file.close()
+                    yield False
+                    return
+            _menu_write_state['lock_file'] = lock_file
+        _menu_write_state['depth'] += 1
+        try:
+            yield True
+        finally:
+            _menu_write_state['depth'] -= 1
+            if _menu_write_state['depth'] == 0:
+                # Closing the file releases the flock
+                _menu_write_state['lock_file'].close()
+                _menu_write_state['lock_file'] = None
+    finally:
+        _menu_write_lock.release()
+
+
+def _replace_menu_file(write):
+    """
+    Atomically replaces MENU_FILE with what write(binary_file) writes.
+    Caller holds menu_write_lock().
+    """
+    menu_path = os.path.abspath(MENU_FILE)
+    temp_file = f"{menu_path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_file, 'wb') as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        os.unlink(temp_file)
+        raise
+    os.replace(temp_file, menu_path)
+    # Make the rename itself durable; not possible (or needed) on every platform
+    try:
+        dir_fd = os.open(os.path.dirname(menu_path), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
+
+
+def _write_menu_tree(tree):
+    """Atomically replaces MENU_FILE with `tree`. Caller holds menu_write_lock()."""
+    _replace_menu_file(lambda f: tree.write(f, encoding='utf-8', xml_declaration=True))
+
+
+def _menu_root_attrib():
+    """The attributes of the <menu> tag, read without parsing the rest; None if there is no file."""
+    try:
+        for _, root in ET.iterparse(MENU_FILE, events=('start',)):
+            return dict(root.attrib)
+    except FileNotFoundError:
+        return None
+
+
+def _committed_menu_version():
+    """The version attribute of menu.xml, read from the root tag alone."""
+    return int((_menu_root_attrib() or {}).get('version', 0))
+
+
+def check_menu_preconditions(expected_version=None, if_match=None):
+    """Raises MenuVersionConflict if either precondition names an older menu. Caller holds the write lock."""
+    if if_match is not None:
+        version = get_menu_version()
+        _, etag = get_menu_json()
+        if not if_match.contains(etag) or (expected_version is not None and str(expected_version) != str(version)):
+            raise MenuVersionConflict(version, etag)
+    elif expected_version is not None:
+        # Only the version is needed here; don't parse the whole menu for it
+        version = _committed_menu_version()
+        if str(expected_version) != str(version):
+            raise MenuVersionConflict(version, get_menu_json()[1])
+
+
+@contextmanager
+def locked_menu(expected_version=None, if_match=None):
+    """
+    Holds the menu write lock and yields the current menu for changing; call
+    save_menu_data() inside the block to commit. expected_version (an int) and
+    if_match (werkzeug ETags from an If-Match header) are optional preconditions;
+    if either names an older menu, MenuVersionConflict is raised before any change.
+    """
+    with menu_write_lock():
+        check_menu_preconditions(expected_version, if_match)
+        yield get_menu_data()
+
+
+# --- Menu model ---
+# The committed menu is compiled once per version into a MenuSnapshot of slotted,
+# immutable MenuCategory/MenuItem/MenuOption objects with id and name indexes and
+# the serialized /api/menu body. Readers share the snapshot as is; only the write
+# path (get_menu_data) still hands out mutable dicts.
+_set_attribute = object.__setattr__
+
+
+class _MenuNode:
+    """Base of the menu model: attributes are set once in __init__ and never changed."""
+    __slots__ = ()
+
+    def _set(self, *values):
+        """Sets the __slots__ attributes, in order."""
+        for name, value in zip(self.__slots__, values):
+            _set_attribute(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+
+def format_display_price(amount, signed=False):
+    """A price as the POS shows it, e.g. '€3.50', or '+€0.50' with signed=True."""
+    if amount < 0:
+        return f"-€{-amount:.2f}"
+    return f"+€{amount:.2f}" if signed else f"€{amount:.2f}"
+
+
+class MenuOption(_MenuNode):
+    __slots__ = ('id', 'label', 'price_adjustment', 'display_price')
+
+    def __init__(self, id, label, price_adjustment):
+        self._set(id, label, price_adjustment,
+                  format_display_price(price_adjustment, signed=True) if price_adjustment else '')
+
+    def to_dict(self):
+        return {'id': self.id, 'label': self.label, 'priceAdjustment': self.price_adjustment}
+
+
+class MenuItem(_MenuNode):
+    __slots__ = ('id', 'name', 'description', 'base_price', 'icon', 'options', 'category', 'display_price')
+
+    def __init__(self, id, name, description, base_price, icon, options, category):
+        self._set(id, name, description, base_price, icon, tuple(options), category,
+                  format_display_price(base_price))
+
+    def to_dict(self):
+        return {'id': self.id, 'name': self.name, 'description': self.description, 'basePrice': self.base_price,
+                'icon': self.icon, 'options': [option.to_dict() for option in self.options]}
+
+
+class MenuCategory(_MenuNode):
+    __slots__ = ('name', 'color', 'order', 'items')
+
+    def __init__(self, name, color, order, items):
+        self._set(name, color, order, tuple(items))
+
+    def to_dict(self):
+        return {'name': self.name, 'color': self.color, 'order': self.order,
+                'items': [item.to_dict() for item in self.items]}
+
+
+_SEARCH_WORD_RE = re.compile(r'\w+')
+
+# Where a query word matched, and how much that counts towards an item's rank
+SEARCH_FIELD_WEIGHTS = {'name': 4.0, 'option': 2.0, 'category': 1.5, 'description': 1.0}
+
+
+def search_words(text):
+    """Lower-cased words of a text with accents removed: 'Frappé No3' -> ['frappe', 'no3']."""
+    text = (text or '').casefold()
+    if not text.isascii():
+        text = ''.join(ch for ch in unicodedata.normalize('NFKD', text) if not unicodedata.combining(ch))
+    return _SEARCH_WORD_RE.findall(text)
+
+
+def _search_grams(word):
+    """The index keys of a word: '^' + its first one and two letters, and its trigrams."""
+    grams = {'^' + word[:1], '^' + word[:2]}
+    grams.update(word[i:i + 3] for i in range(len(word) - 2))
+    return grams
+
+
+class MenuSearchIndex(_MenuNode):
+    """
+    Prefix/trigram index over item names, option labels, category names and
+    descriptions. `entries` holds (item, fields) per item in menu order, where fields
+    are (kind, words, option) tuples; `grams` maps each key from _search_grams() to
+    the ascending positions of the entries that contain it.
+    """
+    __slots__ = ('entries', 'grams')
+
+    def __init__(self, categories):
+        entries, grams = [], {}
+        for category in categories:
+            category_words = tuple(search_words(category.name))
+            for item in category.items:
+                fields = [('name', tuple(search_words(item.name)), None)]
+                fields.extend(('option', tuple(search_words(option.label)), option) for option in item.options)
+                fields.append(('category', category_words, None))
+                fields.append(('description', tuple(search_words(item.description)), None))
+                position = len(entries)
+                keys = set()
+                for _, words, _ in fields:
+                    for word in words:
+                        keys.update(_search_grams(word))
+                for key in keys:
+                    grams.setdefault(key, []).append(position)
+                entries.append((item, tuple(fields)))
+        self._set(tuple(entries), grams)
+
+    def _candidates(self, word):
+        """Entry positions that may contain a word starting with (or containing) `word`."""
+        if len(word) < 3:
+            return self.grams.get('^' + word, ())
+        postings = sorted((self.grams.get(word[i:i + 3], ()) for i in range(len(word) - 2)), key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates.intersection_update(posting)
+        return candidates
+
+    def search(self, query, limit=20):
+        """
+        Returns up to `limit` (score, item, option) for the items matching every word of
+        the query, best first. A word matches a whole word, the start of one, or (from
+        three letters on) the inside of one; `option` is the option whose label matched.
+        """
+        query_words = search_words(query)
+        if not query_words:
+            return []
+        candidates = None
+        for word in sorted(set(query_words), key=len, reverse=True):
+            found = self._candidates(word)
+            candidates = set(found) if candidates is None else candidates.intersection(found)
+            if not candidates:
+                return []
+
+        phrase = ' '.join(query_words)
+        results = []
+        for position in candidates:
+            item, fields = self.entries[position]
+            score, matched_option = 0.0, None
+            for word in query_words:
+                best, best_option = 0.0, None
+                for kind, words, option in fields:
+                    for candidate in words:
+                        if candidate == word:
+                            quality = 1.0
+                        elif candidate.startswith(word):
+                            quality = 0.8
+                        elif len(word) >= 3 and word in candidate:
+                            quality = 0.4
+                        else:
+                            continue
+                        if quality * SEARCH_FIELD_WEIGHTS[kind] > best:
+                            best, best_option = quality * SEARCH_FIELD_WEIGHTS[kind], option
+                if not best:
+                    break
+                score += best
+                matched_option = matched_option or best_option
+            else:
+                if ' '.join(fields[0][1]).startswith(phrase):
+                    score += 2.0
+                results.append((-score, position, item, matched_option))
+        results.sort(key=lambda result: result[:2])
+        return [(-score, item, option) for score, _, item, option in results[:limit]]
+
+
+class MenuSnapshot(_MenuNode):
+    """
+    One committed version of the menu. `items` and `options` map ids to objects,
+    `item_positions` / `option_positions` map ids to (category, item[, option])
+    positions, `categories_by_name` and `items_by_name` map names to objects (the
+    first item of a name wins). `prices` is the price table used to check orders:
+    (category, item name, option label or None) -> unit price in cents. `search` is
+    the MenuSearchIndex. `json` and `etag` are the /api/menu body and ETag.
+    """
+    __slots__ = ('version', 'categories', 'categories_by_name', 'items', 'items_by_name', 'options',
+                 'item_positions', 'option_positions', 'prices', 'search', 'json', 'etag')
+
+    def __init__(self, version, categories):
+        items, items_by_name, options, item_positions, option_positions, prices = {}, {}, {}, {}, {}, {}
+        for ci, category in enumerate(categories):
+            for ii, item in enumerate(category.items):
+                items[item.id] = item
+                items_by_name.setdefault(item.name, item)
+                item_positions[item.id] = (ci, ii)
+                prices.setdefault((category.name, item.name, None), _to_cents(item.base_price))
+                for oi, option in enumerate(item.options):
+                    options[option.id] = option
+                    option_positions[option.id] = (ci, ii, oi)
+                    prices.setdefault((category.name, item.name, option.label),
+                                      _to_cents(item.base_price + option.price_adjustment))
+        body = json.dumps([category.to_dict() for category in categories], ensure_ascii=False,
+                          separators=(',', ':')).encode('utf-8')
+        etag = hashlib.sha256(f"{version}:".encode('ascii') + body).hexdigest()[:32]
+        self._set(version, tuple(categories), {category.name: category for category in categories},
+                  items, items_by_name, options, item_positions, option_positions, prices,
+                  MenuSearchIndex(categories), body, etag)
+
+    def option_item(self, option_id):
+        """The item an option belongs to, or None."""
+        position = self.option_positions.get(option_id)
+        return None if position is None else self.categories[position[0]].items[position[1]]
+
+
+EMPTY_MENU = MenuSnapshot(0, [])
+
+
+# --- Parsed menu cache ---
+# The compiled MenuSnapshot is kept in memory and reused until save_menu_data()
+# writes or the file's (mtime, size, inode) changes on disk.
+_menu_cache = {'signature': None, 'snapshot': None}
+_menu_cache_lock = threading.Lock()
+_menu_cache_stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+
+def _menu_file_signature():
+    """Returns a (mtime, size, inode) tuple for the menu file, or None if missing."""
+    try:
+        st = os.stat(MENU_FILE)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def invalidate_menu_cache():
+    """Drops the cached menu so the next read parses menu.xml again."""
+    with _menu_cache_lock:
+        _menu_cache.update(signature=None, snapshot=None)
+        _menu_cache_stats['invalidations'] += 1
+
+
+def get_menu_cache_stats():
+    """Returns a snapshot of the menu cache hit/miss counters."""
+    with _menu_cache_lock:
+        stats = dict(_menu_cache_stats)
+        snapshot = _menu_cache['snapshot']
+        stats['etag'] = snapshot.etag if snapshot else None
+        stats['version'] = snapshot.version if snapshot else 0
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+    return stats
+
+
+def get_menu_snapshot():
+    """
+    Returns the compiled MenuSnapshot of the committed menu, parsing menu.xml only
+    if it changed. Without a menu file this is the empty EMPTY_MENU.
+    """
+    with _menu_cache_lock:
+        signature = _menu_file_signature()
+        if signature is None:
+            return EMPTY_MENU
+        if _menu_cache['signature'] == signature:
+            _menu_cache_stats['hits'] += 1
+            return _menu_cache['snapshot']
+        _menu_cache_stats['misses'] += 1
+        # Stat before parsing: a file replaced in between just makes the next read parse again
+        snapshot = _parse_menu_file()
+        _menu_cache.update(signature=signature, snapshot=snapshot)
+        return snapshot
+
+
+def get_menu_data():
+    """
+    Returns the menu as a list of category dicts for changing and passing to
+    save_menu_data(). Callers get their own copy and may mutate it freely.
+    """
+    return [category.to_dict() for category in get_menu_snapshot().categories]
+
+
+def get_menu_version():
+    """Returns the version number of the committed menu (0 for a file that never had one)."""
+    return get_menu_snapshot().version
+
+
+def menu_item_position(item_id):
+    """
+    Returns (category position, item position) of an item in the current menu, or None.
+    Inside locked_menu() the positions are valid for the yielded menu until it is changed.
+    """
+    return get_menu_snapshot().item_positions.get(item_id)
+
+
+def get_menu_item(item_id):
+    """Returns one item as a dict with its 'category' name, or None if the id is unknown."""
+    item = get_menu_snapshot().items.get(item_id)
+    return None if item is None else dict(item.to_dict(), category=item.category)
+
+
+def get_menu_option(option_id):
+    """Returns one option as a dict with its 'itemId', or None if the id is unknown."""
+    snapshot = get_menu_snapshot()
+    option = snapshot.options.get(option_id)
+    return None if option is None else dict(option.to_dict(), itemId=snapshot.option_item(option_id).id)
+
+
+def get_menu_json():
+    """Returns (body_bytes, etag) for the current menu."""
+    snapshot = get_menu_snapshot()
+    return snapshot.json, snapshot.etag
+
+
+def _parse_menu_file():
+    """
+    Read menu data from XML file, preserving order. Returns a MenuSnapshot.
+    A file that skipped migrate_menu_file() still reads; its items get stand-in ids.
+    """
+    tree = ET.parse(MENU_FILE)
+    root = tree.getroot()
+    version = int(root.get('version', 0))
+    
+    # Read categories into a list
+    categories = []
+    for category in root.findall('category'):
+        cat_name = category.get('name')
+        cat_color = category.get('color')
+        cat_order = int(category.get('order', 999))
+        
+        items = []
+        for item in category.findall('item'):
+            name = item.find('name').text
+            description_elem = item.find('description')
+            description = description_elem.text if description_elem is not None else ''
+            price = float(item.find('price').text)
+            icon_elem = item.find('icon')
+            icon = icon_elem.text if icon_elem is not None else ''
+            item_id = item.get('id') or _fallback_menu_id(cat_name, len(items), name)
+            
+            options = []
+            options_elem = item.find('options')
+            if options_elem is not None:
+                for option in options_elem.findall('option'):
+                    options.append(MenuOption(
+                        id=option.get('id') or _fallback_menu_id(item_id, len(options)),
+                        label=option.get('label'),
+                        price_adjustment=float(option.get('price_adjustment', '0'))
+                    ))
+            items.append(MenuItem(item_id, name, description, price, icon, options, cat_name))
+
+        categories.append(MenuCategory(cat_name, cat_color, cat_order, items))
+    
+    # Sort by the order attribute
+    categories.sort(key=lambda x: x.order)
+    return MenuSnapshot(version, categories)
+
+def _menu_id_allocator():
+    """Returns element_id(requested): keeps a requested id unless it is missing or already used."""
+    seen_ids = set()
+
+    def element_id(requested):
+        new_id = requested if requested and requested not in seen_ids else new_menu_id()
+        seen_ids.add(new_id)
+        return new_id
+    return element_id
+
+
+def _menu_number(value, what):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        number = float('nan')
+    if not math.isfinite(number):
+        raise MenuEditError(f"Invalid {what}: {value!r}")
+    return number
+
+
+def _category_attrs(category, index):
+    """The <category> attributes for a category dict, checking its fields."""
+    name = category.get('name')
+    if not isinstance(name, str) or not name.strip():
+        raise MenuEditError('Category name is required')
+    return {'name': name, 'color': category.get('color') or '', 'order': str(index)}
+
+
+def _check_item(item):
+    """Checks an item dict's name, price and options; returns (name, price, [(option, adjustment)])."""
+    name = item.get('name')
+    if not isinstance(name, str) or not name.strip():
+        raise MenuEditError('Item name is required')
+    price = _menu_number(item.get('basePrice'), f"price for {name}")
+    options = item.get('options') or []
+    if not isinstance(options, list) or not all(isinstance(option, dict) for option in options):
+        raise MenuEditError(f"Options for {name} must be a list of objects")
+    checked = []
+    for option in options:
+        label = option.get('label')
+        if not isinstance(label, str) or not label:
+            raise MenuEditError(f"Option label is required for {name}")
+        checked.append((option, _menu_number(option.get('priceAdjustment', 0),
+                                             f"price adjustment for {name} ({label})")))
+    return name, price, checked
+
+
+def _item_element(item, element_id):
+    """Builds the <item> element for an item dict, checking its fields on the way."""
+    name, price, options = _check_item(item)
+
+    item_elem = ET.Element('item', id=element_id(item.get('id')))
+    ET.SubElement(item_elem, 'name').text = name
+    desc_elem = ET.SubElement(item_elem, 'description')
+    desc_elem.text = item.get('description', '')
+    ET.SubElement(item_elem, 'price').text = str(price)
+    if item.get('icon'):
+        icon_elem = ET.SubElement(item_elem, 'icon')
+        icon_elem.text = item['icon']
+
+    if options:
+        options_elem = ET.SubElement(item_elem, 'options')
+        for option, adjustment in options:
+            ET.SubElement(options_elem, 'option',
+                          id=element_id(option.get('id')),
+                          label=option['label'],
+                          price_adjustment=str(adjustment))
+    return item_elem
+
+
+def save_menu_data(menu_list):
+    """
+    Save menu data list to XML file, preserving order. The file is replaced atomically
+    under the menu write lock and its version bumped; returns the new version.
+    Items and options keep their ids; missing or duplicate ids get a new one.
+    Raises MenuEditError (and writes nothing) if a name or price is invalid.
+    """
+    element_id = _menu_id_allocator()
+    category_names = set()
+
+    with menu_write_lock():
+        previous = get_menu_snapshot()
+        version = previous.version + 1
+        root = ET.Element('menu', version=str(version), schema=str(MENU_SCHEMA_VERSION))
+        
+        for index, category in enumerate(menu_list):
+            attrs = _category_attrs(category, index) # Save index as order
+            if attrs['name'] in category_names:
+                raise MenuEditError(f"Duplicate category: {attrs['name']}")
+            category_names.add(attrs['name'])
+            cat_elem = ET.SubElement(root, 'category', attrs)
+            for item in category['items']:
+                cat_elem.append(_item_element(item, element_id))
+        
+        _write_menu_tree(ET.ElementTree(root))
+        invalidate_menu_cache()
+        record_menu_change(diff_menus(previous, get_menu_snapshot()))
+    publish_menu_change()
+    return version
+
+
+# --- Menu operations ---
+# Every menu change, from a single-change endpoint or from /api/menu/batch, is one
+# of these operations applied to the list yielded by locked_menu(). They check their
+# input and raise MenuEditError before changing anything.
+MENU_BATCH_MAX_OPERATIONS = 5000
+
+
+def _find_category(menu_data, name):
+    """Returns the position of a category by name, or raises a 404 MenuEditError."""
+    position = next((i for i, c in enumerate(menu_data) if c['name'] == name), None)
+    if position is None:
+        raise MenuEditError('Category not found', 404)
+    return position
+
+
+def _item_from_request(data, item_id):
+    """The stored form of an item sent by the management UI."""
+    return {
+        'id': item_id,
+        'name': data.get('name'),
+        'description': data.get('description'),
+        'basePrice': data.get('price'),
+        'icon': data.get('icon'),
+        'options': data.get('options', [])
+    }
+
+
+def _item_position(menu_data, op):
+    """
+    Position (category, item) of the item an operation refers to: by 'id' through the
+    cached index (falling back to a scan once earlier operations in a batch have moved
+    things), or by the old (category name, list index) addressing.
+    """
+    item_id = op.get('id')
+    if item_id:
+        position = menu_item_position(item_id)
+        if position is not None:
+            ci, ii = position
+            if ci < len(menu_data) and ii < len(menu_data[ci]['items']) \
+                    and menu_data[ci]['items'][ii].get('id') == item_id:
+                return position
+        for ci, category in enumerate(menu_data):
+            for ii, item in enumerate(category['items']):
+                if item.get('id') == item_id:
+                    return ci, ii
+        raise MenuEditError('Item not found', 404)
+
+    index = op.get('index')
+    category_index = next((i for i, c in enumerate(menu_data) if c['name'] == op.get('category')), None)
+    if category_index is None or not isinstance(index, int):
+        raise MenuEditError('Invalid category or item index')
+    if index < 0 or index >= len(menu_data[category_index]['items']):
+        raise MenuEditError('Item index out of bounds')
+    return category_index, index
+
+
+def _op_add_category(menu_data, op):
+    name, color = op.get('name'), op.get('color')
+    if not name or not color:
+        raise MenuEditError('Name and color are required')
+    if any(c['name'] == name for c in menu_data):
+        raise MenuEditError('Category already exists')
+    menu_data.append({'name': name, 'color': color, 'items': []})
+    return {}
+
+
+def _op_update_category(menu_data, op):
+    category = menu_data[_find_category(menu_data, op.get('name'))]
+    new_name, color = op.get('new_name'), op.get('color')
+    if new_name and new_name != category['name'] and any(c['name'] == new_name for c in menu_data):
+        raise MenuEditError('New category name already exists')
+    if new_name:
+        category['name'] = new_name
+    if color:
+        category['color'] = color
+    return {}
+
+
+def _op_delete_category(menu_data, op):
+    del menu_data[_find_category(menu_data, op.get('name'))]
+    return {}
+
+
+def _op_reorder_category(menu_data, op):
+    """Moves a category one step 'up'/'down', or to an absolute 'position'."""
+    index = _find_category(menu_data, op.get('name'))
+    direction, position = op.get('direction'), op.get('position')
+    if direction == 'up' and index > 0:
+        target = index - 1
+    elif direction == 'down' and index < len(menu_data) - 1:
+        target = index + 1
+    elif direction is None and isinstance(position, int) and 0 <= position < len(menu_data):
+        target = position
+    else:
+        raise MenuEditError('Invalid move')
+    menu_data.insert(target, menu_data.pop(index))
+    return {}
+
+
+def _op_add_item(menu_data, op):
+    if not op.get('category'):
+        raise MenuEditError('Category is required')
+    category = menu_data[_find_category(menu_data, op.get('category'))]
+    item = _item_from_request(op, new_menu_id())
+    _check_item(item)
+    category['items'].append(item)
+    return {'id': item['id']}
+
+
+def _op_update_item(menu_data, op):
+    """Replaces an item, moving it to the end of op['category'] if that names another category."""
+    ci, ii = _item_position(menu_data, op)
+    category = menu_data[ci]
+    item = _item_from_request(op, category['items'][ii]['id'])
+    _check_item(item)
+    target_name = op.get('category')
+    if target_name and target_name != category['name']:
+        target = menu_data[_find_category(menu_data, target_name)]
+        del category['items'][ii]
+        target['items'].append(item)
+    else:
+        category['items'][ii] = item
+    return {'id': item['id']}
+
+
+def _op_delete_item(menu_data, op):
+    ci, ii = _item_position(menu_data, op)
+    item = menu_data[ci]['items'].pop(ii)
+    return {'id': item['id']}
+
+
+MENU_OPERATIONS = {
+    'add_category': _op_add_category,
+    'update_category': _op_update_category,
+    'delete_category': _op_delete_category,
+    'reorder_category': _op_reorder_category,
+    'add_item': _op_add_item,
+    'update_item': _op_update_item,
+    'delete_item': _op_delete_item,
+}
+
+
+def apply_menu_operation(menu_data, op):
+    """Applies one {'op': ..., ...} operation to menu_data in place; returns its result fields."""
+    handler = MENU_OPERATIONS.get(op.get('op'))
+    if handler is None:
+        raise MenuEditError(f"Unknown operation: {op.get('op')!r}")
+    return handler(menu_data, op)
+
+
+# --- Menu import/export ---
+# Catalogs are exchanged as one record per item: CSV rows (MENU_EXPORT_FIELDS, the
+# options as a JSON list) or JSON Lines. A record without a name declares an empty
+# category. Both directions stream: export walks menu.xml with iterparse and import
+# spools each category's items to a temporary file before assembling the new
+# menu.xml, so memory stays flat however large the catalog is. Import replaces the
+# whole menu with the same validation, lock and atomic rename as save_menu_data();
+# the upload is read and checked first, and the lock is only held to write it.
+MENU_EXPORT_FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+MENU_EXPORT_FIELDS = ['category', 'color', 'id', 'name', 'description', 'price', 'icon', 'options']
+
+
+def iter_menu_records(menu_file=None):
+    """
+    Yields one record per item (or empty category) of menu.xml, in file order.
+    Elements without an id get the same stand-in id as in get_menu_data().
+    """
+    category = None
+    emitted = 0
+    for event, elem in ET.iterparse(menu_file or MENU_FILE, events=('start', 'end')):
+        if event == 'start':
+            if elem.tag == 'category':
+                category, emitted = elem, 0
+            continue
+        if elem.tag == 'item' and category is not None:
+            description = elem.findtext('description')
+            name = elem.findtext('name')
+            item_id = elem.get('id') or _fallback_menu_id(category.get('name'), emitted, name)
+            yield {
+                'category': category.get('name'),
+                'color': category.get('color'),
+                'id': item_id,
+                'name': name,
+                'description': description or '',
+                'price': float(elem.findtext('price')),
+                'icon': elem.findtext('icon') or '',
+                'options': [{'id': o.get('id') or _fallback_menu_id(item_id, i), 'label': o.get('label'),
+                             'priceAdjustment': float(o.get('price_adjustment', '0'))}
+                            for i, o in enumerate(elem.iterfind('options/option'))],
+            }
+            emitted += 1
+            category.remove(elem)  # the item just parsed is the only child left
+        elif elem.tag == 'category':
+            if not emitted:
+                yield {'category': elem.get('name'), 'color': elem.get('color')}
+            elem.clear()
+            category = None
+
+
+def iter_menu_export(fmt, records=None):
+    """Yields the export of the menu as text chunks in 'csv' or 'jsonl' format."""
+    records = iter_menu_records() if records is None else records
+    if fmt == 'jsonl':
+        for record in records:
+            yield json.dumps(record, ensure_ascii=False) + '\n'
+        return
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=MENU_EXPORT_FIELDS)
+    writer.writeheader()
+    for count, record in enumerate(records, 1):
+        if 'options' in record:
+            record = dict(record, options=json.dumps(record['options'], ensure_ascii=False) if record['options'] else '')
+        writer.writerow(record)
+        if count % 500 == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_menu_import(stream, fmt):
+    """Yields (line number, record) from a text stream in 'csv' or 'jsonl' format."""
+    if fmt == 'jsonl':
+        for line_number, line in enumerate(stream, 1):
+            if line.strip():
+                try:
+                    yield line_number, json.loads(line)
+                except ValueError as e:
+                    raise MenuEditError(f"Line {line_number}: {e}")
+        return
+
+    reader = csv.DictReader(stream)
+    missing = {'category', 'name', 'price'} - set(reader.fieldnames or ())
+    if missing:
+        raise MenuEditError(f"CSV is missing the column(s): {', '.join(sorted(missing))}")
+    for row in reader:
+        record = {k: v for k, v in row.items() if k in MENU_EXPORT_FIELDS}
+        try:
+            record['options'] = json.loads(row['options']) if row.get('options') else []
+        except ValueError as e:
+            raise MenuEditError(f"Line {reader.line_num}: invalid options: {e}")
+        yield reader.line_num, record
+
+
+def import_menu(records, expected_version=None, if_match=None):
+    """
+    Replaces the menu with the (line number, record) pairs from iter_menu_import().
+    Categories keep the order of their first record. Returns
+    {'version', 'categories', 'items'}; raises MenuEditError naming the offending
+    line, in which case menu.xml is left untouched.
+    """
+    element_id = _menu_id_allocator()
+    # All <item> elements go to one temp file as they come (a file per category would
+    # run out of descriptors on a big menu); each category lists the [offset, length]
+    # runs of its own items in it, and write() copies them out category by category.
+    categories = OrderedDict()  # category name -> (attrs, runs)
+    spool = tempfile.TemporaryFile()
+    items = 0
+    try:
+        # Read and check the whole upload before taking the lock, so a slow client
+        # doesn't hold up other menu writes; a stale version fails fast here too
+        check_menu_preconditions(expected_version, if_match)
+        for line_number, record in records:
+            try:
+                if not isinstance(record, dict):
+                    raise MenuEditError('Record must be an object')
+                name = record.get('category')
+                if name not in categories:
+                    attrs = _category_attrs({'name': name, 'color': record.get('color')}, len(categories))
+                    categories[name] = (attrs, [])
+                attrs, runs = categories[name]
+                if not attrs['color'] and record.get('color'):
+                    attrs['color'] = record['color']
+                if not record.get('name'):
+                    continue  # empty category declaration
+                item = dict(record, basePrice=record.get('price'))
+                offset = spool.tell()
+                length = spool.write(ET.tostring(_item_element(item, element_id), encoding='utf-8'))
+                if runs and sum(runs[-1]) == offset:
+                    runs[-1][1] += length  # follows on from the category's last item
+                else:
+                    runs.append([offset, length])
+                items += 1
+            except MenuEditError as e:
+                raise MenuEditError(f"Line {line_number}: {e.message}", e.status)
+
+        with menu_write_lock():
+            check_menu_preconditions(expected_version, if_match)
+            version = _committed_menu_version() + 1
+
+            def write(f):
+                f.write(b"<?xml version='1.0' encoding='utf-8'?>\n")
+                f.write(f'<menu version="{version}" schema="{MENU_SCHEMA_VERSION}">'.encode('utf-8'))
+                for attrs, runs in categories.values():
+                    f.write(('<category ' + ' '.join(f'{k}={quoteattr(v)}' for k, v in attrs.items()) + '>')
+                            .encode('utf-8'))
+                    for offset, length in runs:
+                        spool.seek(offset)
+                        while length:
+                            chunk = spool.read(min(length, 1 << 16))
+                            f.write(chunk)
+                            length -= len(chunk)
+                    f.write(b'</category>')
+                f.write(b'</menu>')
+
+            _replace_menu_file(write)
+            invalidate_menu_cache()
+            # Not worth parsing the old menu to diff a whole import; clients reload
+            record_menu_change({'from': version - 1, 'version': version, 'reload': True})
+    finally:
+        spool.close()
+    publish_menu_change()
+    return {'version': version, 'categories': len(categories), 'items': items}
+
+
+# --- Menu changelog and live updates ---
+# Every menu write appends the delta it made to MENU_CHANGELOG_FILE while it still
+# holds the menu write lock, so the log is shared by all processes and survives
+# restarts. A delta is made against the version before it (diff_menus()):
+# categories that were added or whose colour or item list changed are sent whole,
+# items edited in place on their own, plus removed categories and the category
+# order. The file keeps the last MENU_CHANGELOG_SIZE deltas (it is trimmed once it
+# holds twice that). They are served two ways:
+#   - GET /api/menu?since=N merges the deltas after N into one;
+#   - /api/menu/stream (Server-Sent Events) sends them one by one as they happen.
+# A client older than the log, or behind an import or a change touching more than
+# MENU_DELTA_MAX_ITEMS items (a 'reload' delta), gets the whole menu instead.
+# Writes in this process wake the streams at once; the streams also re-check the log
+# on every keep-alive, so writes by other processes show up within that interval.
+# Each open stream holds a server thread for as long as it is open, so a process
+# serves at most MENU_STREAM_MAX of them and keeps its other threads for orders and
+# printing: run gunicorn with --threads above MENU_STREAM_MAX (e.g. -w 2 --threads 8
+# for up to 8 tablets). A client refused with a 503 polls GET /api/menu?since=N
+# instead and asks for a stream again later. A stream ends after
+# MENU_STREAM_LIFETIME; the browser reconnects by itself with Last-Event-ID, so the
+# slots don't stay with the tablets that happened to connect first.
+MENU_CHANGELOG_FILE = MENU_FILE + '.changes.jsonl'
+MENU_CHANGELOG_SIZE = 256
+MENU_DELTA_MAX_ITEMS = 500
+MENU_STREAM_KEEPALIVE = 15  # seconds
+MENU_STREAM_RETRY_MS = 3000
+MENU_STREAM_MAX = 4  # open streams per process
+MENU_STREAM_LIFETIME = 300  # seconds
+MENU_STREAM_REFUSED_RETRY = 30  # seconds, sent as Retry-After
+
+_menu_changelog = {'signature': None, 'deltas': (), 'lines': 0}
+_menu_changelog_lock = threading.Lock()
+_menu_events_cond = threading.Condition()
+_menu_streams = {'open': 0}
+_menu_streams_lock = threading.Lock()
+
+
+def diff_menus(old, new):
+    """
+    The delta from MenuSnapshot `old` to `new`: {'from', 'version', 'etag', 'order':
+    [[name, order], ...], 'removed': [names], 'categories': [category dicts],
+    'items': [item dicts with their 'category']}, or {'from', 'version', 'etag',
+    'reload': True} when more than MENU_DELTA_MAX_ITEMS items changed.
+    """
+    delta = {'from': old.version, 'version': new.version, 'etag': new.etag}
+    categories, items, changed = [], [], 0
+    for category in new.categories:
+        previous = old.categories_by_name.get(category.name)
+        if (previous is None or previous.color != category.color
+                or [item.id for item in previous.items] != [item.id for item in category.items]):
+            categories.append(category.to_dict())
+            changed += len(category.items) or 1
+        else:
+            for item, before in zip(category.items, previous.items):
+                if item.to_dict() != before.to_dict():
+                    items.append(dict(item.to_dict(), category=category.name))
+                    changed += 1
+        if changed > MENU_DELTA_MAX_ITEMS:
+            return dict(delta, reload=True)
+    delta.update(order=[[category.name, category.order] for category in new.categories],
+                 removed=[name for name in old.categories_by_name if name not in new.categories_by_name],
+                 categories=categories, items=items)
+    return delta
+
+
+def _load_menu_changelog():
+    """Returns the retained deltas, oldest first, re-reading MENU_CHANGELOG_FILE only when it changed."""
+    with _menu_changelog_lock:
+        try:
+            st = os.stat(MENU_CHANGELOG_FILE)
+        except FileNotFoundError:
+            _menu_changelog.update(signature=None, deltas=(), lines=0)
+            return ()
+        signature = (st.st_mtime_ns, st.st_size, st.st_ino)
+        if _menu_changelog['signature'] != signature:
+            deltas, lines = deque(maxlen=MENU_CHANGELOG_SIZE), 0
+            with open(MENU_CHANGELOG_FILE, mode='r', encoding='utf-8') as f:
+                for line in f:
+                    lines += 1
+                    try:
+                        deltas.append(json.loads(line))
+                    except ValueError:
+                        continue  # a line torn by a crash; the chain through it is broken, so clients reload
+            _menu_changelog.update(signature=signature, deltas=tuple(deltas), lines=lines)
+        return _menu_changelog['deltas']
+
+
+def record_menu_change(delta):
+    """Appends a delta to MENU_CHANGELOG_FILE, trimming the file when due. Caller holds menu_write_lock()."""
+    deltas = _load_menu_changelog()
+    line = json.dumps(delta, ensure_ascii=False, separators=(',', ':')) + '\n'
+    if _menu_changelog['lines'] + 1 < 2 * MENU_CHANGELOG_SIZE:
+        with open(MENU_CHANGELOG_FILE, mode='a+b') as f:
+            size = f.seek(0, os.SEEK_END)
+            if size:
+                f.seek(size - 1)
+                if f.read(1) != b'\n':
+                    line = '\n' + line  # end a line torn by a crash, or this one would be lost with it
+            f.write(line.encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+        return
+    temp_file = f"{MENU_CHANGELOG_FILE}.{os.getpid()}.tmp"
+    with open(temp_file, mode='w', encoding='utf-8') as f:
+        for kept in deltas[-(MENU_CHANGELOG_SIZE - 1):]:
+            f.write(json.dumps(kept, ensure_ascii=False, separators=(',', ':')) + '\n')
+        f.write(line)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_file, MENU_CHANGELOG_FILE)
+
+
+def menu_changes_since(version):
+    """
+    The deltas that take a client from `version` to the committed menu: [] if it is
+    current, None if the changelog doesn't reach back that far or has a gap after it
+    (a lost or torn entry), so the client reloads the whole menu.
+    """
+    current = get_menu_version()
+    if version == current:
+        return []
+    chain = []
+    for delta in _load_menu_changelog():
+        if delta['from'] == version:
+            chain = [delta]
+        elif chain and delta['from'] == chain[-1]['version']:
+            chain.append(delta)
+        elif chain:
+            chain = []  # the change between chain[-1] and this delta is missing
+    if not chain or chain[-1]['version'] != current:
+        return None
+    return chain
+
+
+def merge_menu_deltas(chain):
+    """Folds consecutive deltas into one with the same shape; None if any of them is a 'reload'."""
+    if any(delta.get('reload') for delta in chain):
+        return None
+    categories, items = {}, {}
+    for delta in chain:
+        for name in delta['removed']:
+            categories.pop(name, None)
+        for category in delta['categories']:
+            categories[category['name']] = copy.deepcopy(category)
+        for item in delta['items']:
+            category = categories.get(item['category'])
+            if category is None:
+                items[item['id']] = item
+                continue
+            item = {k: v for k, v in item.items() if k != 'category'}
+            category['items'] = [item if existing['id'] == item['id'] else existing
+                                 for existing in category['items']]
+        for category in delta['categories']:
+            # A category sent whole supersedes the single items changed in it before
+            items = {k: v for k, v in items.items() if v['category'] != category['name']}
+    last = chain[-1]
+    names = {name for name, _ in last['order']}
+    return {
+        'from': chain[0]['from'], 'version': last['version'], 'etag': last['etag'], 'order': last['order'],
+        'removed': sorted({name for delta in chain for name in delta['removed']} - names),
+        'categories': [categories[name] for name, _ in last['order'] if name in categories],
+        'items': [item for item in items.values() if item['category'] in names],
+    }
+
+
+def publish_menu_change():
+    """Wakes the menu streams after a write in this process."""
+    with _menu_events_cond:
+        _menu_events_cond.notify_all()
+
+
+def wait_for_menu_events(version, timeout):
+    """
+    Waits up to `timeout` seconds for menu versions after `version`. Returns their
+    deltas (empty on timeout), or None if the client has to reload the whole menu.
+    """
+    with _menu_events_cond:
+        events = menu_changes_since(version)
+        if events == []:
+            _menu_events_cond.wait(timeout)
+            events = menu_changes_since(version)
+        return events
+
+
+# --- Order pricing ---
+# The tablet sends each line's unit price and the order total as it computed them
+# from its copy of the menu, which can be stale. price_order() reprices every line
+# from the snapshot's price table (one dict lookup per line, no menu.xml parsing)
+# and recomputes the total; the server's figures are what gets printed and logged.
+# Lines that differ from the tablet, lines not on the menu (kept at the tablet's
+# price, read as a number) and a differing total are reported as the order's price check.
+def _menu_price_key(menu, line):
+    """The menu.prices key for an order line, or None if it is not on the menu."""
+    item = menu.items.get(line.get('itemId'))
+    if item is not None:
+        option = menu.options.get(line.get('optionId'))
+        if line.get('optionId') and (option is None or menu.option_item(option.id) is not item):
+            return None
+        return (item.category, item.name, option.label if option else None)
+
+    name = line.get('name') or ''
+    candidates = [(name, None)]
+    if name.endswith(')') and ' (' in name:
+        split = name.rindex(' (')
+        candidates.append((name[:split], name[split + 2:-1]))  # "Frappe (Sweet)"
+    for item_name, label in candidates:
+        category = line.get('category')
+        if not category:
+            item = menu.items_by_name.get(item_name)
+            category = item.category if item else None
+        if (category, item_name, label) in menu.prices:
+            return (category, item_name, label)
+    return None
+
+
+def _order_quantity(line):
+    quantity = line.get('quantity', 1)
+    if isinstance(quantity, bool) or not isinstance(quantity, int) or quantity < 1:
+        raise ValueError(f"Invalid quantity for {line.get('name')}: {quantity!r}")
+    return quantity
+
+
+def price_order(order_data, menu):
+    """
+    Returns (priced order, price check). The priced order is a copy of order_data with
+    each line's 'price' and the 'total' taken from `menu`; the price check is None when
+    the tablet agreed, else {'total', 'clientTotal', 'lines': [{'name', 'quantity',
+    'price', 'clientPrice', 'issue': 'price' | 'unknown'}]} with amounts as 'x.xx' text.
+    """
+    lines, issues, total_cents = [], [], 0
+    for line in order_data.get('items') or []:
+        quantity = _order_quantity(line)
+        key = _menu_price_key(menu, line)
+        try:
+            client_cents = _to_cents(line['price']) if line.get('price') is not None else None
+        except (ValueError, TypeError, OverflowError):
+            raise ValueError(f"Invalid price for {line.get('name')}: {line['price']!r}") from None
+        if key is None:
+            if client_cents is None:
+                raise ValueError(f"{line.get('name')} is not on the menu and has no price")
+            unit_cents, issue = client_cents, 'unknown'
+        else:
+            unit_cents = menu.prices[key]
+            issue = 'price' if client_cents != unit_cents else None
+        if issue:
+            issues.append({'name': line.get('name'), 'quantity': quantity, 'price': f"{unit_cents / 100:.2f}",
+                           'clientPrice': None if client_cents is None else f"{client_cents / 100:.2f}",
+                           'issue': issue})
+        lines.append(dict(line, price=unit_cents / 100))
+        total_cents += unit_cents * quantity
+
+    client_total = order_data.get('total')
+    client_total_cents = _to_cents(client_total) if client_total is not None else None
+    priced = dict(order_data, items=lines, total=total_cents / 100)
+    if not issues and client_total_cents in (None, total_cents):
+        return priced, None
+    return priced, {
+        'total': f"{total_cents / 100:.2f}",
+        'clientTotal': None if client_total_cents is None else f"{client_total_cents / 100:.2f}",
+        'lines': issues,
+    }
+
+
+# --- Order ledger ---
+# In 'append' mode every order is appended to orders_YYYY-MM-DD.csv (same columns
+# as before) and the CASH/CARD/DAILY totals live in a small JSON sidecar next to it,
+# so logging an order costs O(items in the order). 'rewrite' is the old behaviour
+# that re-reads the whole day and writes the totals as trailing CSV rows.
+#
+# With LEDGER_BACKEND = 'sqlite' orders go to LEDGER_DB instead (see below) and the
+# daily CSV is produced on demand by export_day_csv().
+#
+# An order whose prices the tablet got wrong (see price_order()) carries a
+# 'priceCheck'; it is logged next to the order, in orders_YYYY-MM-DD.prices.jsonl
+# or the price_checks table, so the CSV columns stay as they are.
+#
+# Several processes (gunicorn workers) may share LEDGER_DIR: every read-modify-write
+# of the day files and sidecars happens under ledger_lock(), an exclusive flock on
+# LEDGER_LOCK_FILE, so no worker appends or rebuilds totals from a stale view.
+LEDGER_DIR = Path("order_logs")
+LEDGER_MODE = 'append'
+LEDGER_BACKEND = 'csv'
+LEDGER_FIELDNAMES = ["timestamp", "seat", "item_name", "quantity", "price", "payment_method"]
+SUMMARY_ITEM_NAMES = {"CASH TOTAL", "CARD TOTAL", "DAILY TOTAL"}
+LEDGER_LOCK_FILE = LEDGER_DIR / "ledger.lock"
+
+_ledger_lock = threading.Lock()
+
+
+@contextmanager
+def ledger_lock():
+    """Exclusive ledger lock, across threads and processes (only threads where fcntl is missing)."""
+    with _ledger_lock:
+        LEDGER_DIR.mkdir(exist_ok=True)
+        with open(LEDGER_LOCK_FILE, 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            yield  # closing the file releases the flock
+
+
+def _ledger_paths(day):
+    """Returns (csv_file, totals_file) for a YYYY-MM-DD day string."""
+    csv_file = LEDGER_DIR / f"orders_{day}.csv"
+    return csv_file, csv_file.with_suffix('.totals.json')
+
+
+def _price_checks_append(day, entries):
+    """The journal append (path, offset, text) that adds a day's price checks to its .prices.jsonl file."""
+    price_file = _ledger_paths(day)[0].with_suffix('.prices.jsonl')
+    lines = []
+    for entry in entries:
+        order_data = entry['order']
+        record = {'timestamp': entry['time'], 'seat': order_data['seat'],
+                  'orderId': order_data.get('orderId'), **order_data['priceCheck']}
+        lines.append(json.dumps(record, ensure_ascii=False) + '\n')
+    return price_file, _ledger_file_size(price_file), ''.join(lines)
+
+
+def _sync_ledger_file(f):
+    """Flushes a ledger file to disk (fsync unless LEDGER_FSYNC is off)."""
+    f.flush()
+    if LEDGER_FSYNC:
+        os.fsync(f.fileno())
+
+
+# --- Ledger journal ---
+# Appends to the day files go through a write-ahead journal. A batch is first
+# written to LEDGER_JOURNAL_FILE as one JSON line of [file name, offset, text]
+# appends and fsynced; only then is the text written to the files, without an fsync
+# of their own. So an order is durable once its journal line is, at one fsync per
+# batch. When the journal outgrows LEDGER_JOURNAL_MAX the files are fsynced and it
+# is emptied (a checkpoint). recover_ledger() - run when a process starts its
+# ledger writer, and by `ledger_cli.py recover` - re-applies every journalled append
+# whose text isn't at its offset (the file was cut off or lost its last writes in a
+# crash or power cut), then checkpoints. A torn journal line is dropped: the crash
+# came before any of that batch reached the files, and no request was told its
+# order was logged. Rewrites of a whole day file (LEDGER_MODE = 'rewrite', legacy
+# summary rows) checkpoint first and then replace the file atomically.
+LEDGER_JOURNAL_FILE = LEDGER_DIR / "ledger.journal"
+LEDGER_JOURNAL_MAX = 4 * 1024 * 1024  # bytes
+
+
+def _ledger_file_size(path):
+    try:
+        return path.stat().st_size
+    except FileNotFoundError:
+        return 0
+
+
+def _write_ledger_at(path, offset, data):
+    """Writes bytes at an offset of a ledger file unless they are already there; returns whether it wrote."""
+    with open(os.open(path, os.O_RDWR | os.O_CREAT, 0o644), mode='r+b') as f:
+        size = f.seek(0, os.SEEK_END)
+        if size >= offset + len(data):
+            f.seek(offset)
+            if f.read(len(data)) == data:
+                return False
+        if offset > size:
+            print(f"Warning: {path} is {size} bytes, journal expected {offset}; appending at the end")
+            offset = size
+        f.seek(offset)
+        f.truncate()
+        f.write(data)
+        return True
+
+
+def _journal_ledger_appends(appends):
+    """Makes a batch of (path, offset, text) appends durable in the journal, then applies them. Caller holds ledger_lock()."""
+    if not appends:
+        return
+    line = json.dumps([[path.name, offset, text] for path, offset, text in appends], ensure_ascii=False)
+    with open(LEDGER_JOURNAL_FILE, mode='a+b') as f:
+        if f.tell():
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                f.write(b'\n')  # don't run on from a line torn by a crashed process
+        f.write(line.encode('utf-8') + b'\n')
+        _sync_ledger_file(f)
+        journal_size = f.tell()
+    for path, offset, text in appends:
+        _write_ledger_at(path, offset, text.encode('utf-8'))
+    if journal_size > LEDGER_JOURNAL_MAX:
+        _checkpoint_ledger()
+
+
+def _checkpoint_ledger(replay=False):
+    """
+    Fsyncs the files the journal covers and empties it; with replay=True it first
+    re-applies the appends missing from them. Returns {'batches', 'replayed', 'torn'}.
+    Caller holds ledger_lock().
+    """
+    stats = {'batches': 0, 'replayed': 0, 'torn': 0}
+    names = set()
+    try:
+        with open(LEDGER_JOURNAL_FILE, mode='r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    appends = json.loads(line)
+                except ValueError:
+                    stats['torn'] += 1
+                    continue
+                stats['batches'] += 1
+                for name, offset, text in appends:
+                    names.add(name)
+                    if replay and _write_ledger_at(LEDGER_DIR / name, offset, text.encode('utf-8')):
+                        stats['replayed'] += 1
+    except FileNotFoundError:
+        return stats
+    for name in names:
+        try:
+            with open(LEDGER_DIR / name, mode='rb+') as f:
+                _sync_ledger_file(f)
+        except FileNotFoundError:
+            continue
+    with open(LEDGER_JOURNAL_FILE, mode='wb') as f:
+        _sync_ledger_file(f)
+    return stats
+
+
+def recover_ledger():
+    """Replays the ledger journal after a crash; returns {'batches', 'replayed', 'torn'} as _checkpoint_ledger()."""
+    with ledger_lock():
+        return _checkpoint_ledger(replay=True)
+
+
+def _to_cents(value):
+    """Converts a price as found in the CSV/JSON to integer cents."""
+    return int(round(float(value) * 100))
+
+
+def _is_price(value):
+    """Whether _to_cents() can read a CSV price cell (an empty one counts as 0)."""
+    try:
+        _to_cents(value or 0)
+    except (ValueError, TypeError, OverflowError):
+        return False
+    return True
+
+
+def _empty_totals():
+    # items: {name: [quantity, cents]}, seats: {seat: [orders, cents]}, hours: {'HH': [orders, cents]};
+    # summary_rows: the CSV still ends with 'rewrite' mode's totals rows
+    return {'cash_cents': 0, 'card_cents': 0, 'orders': 0, 'items': {}, 'seats': {}, 'hours': {}, 'csv_size': 0,
+            'summary_rows': False}
+
+
+def _row_quantity(row):
+    quantity = row['quantity']
+    return 1 if quantity in ('', None) else int(quantity)
+
+
+def _tally_order(rows):
+    """
+    What one order adds to the day's totals, from its CSV rows: the item rows, then
+    the ORDER TOTAL row. Raises ValueError if a quantity or price doesn't parse.
+    """
+    *items, total = rows
+    return {
+        'hour': str(total['timestamp'])[11:13],
+        'seat': total['seat'],
+        'payment_method': total['payment_method'],
+        'cents': _to_cents(total['price'] or 0),
+        'items': [(row['item_name'], _row_quantity(row), _to_cents(row['price'] or 0)) for row in items],
+    }
+
+
+def _add_to_totals(totals, tally):
+    """Adds one order's _tally_order() to a day's totals."""
+    cents = tally['cents']
+    if tally['payment_method'] == 'CASH':
+        totals['cash_cents'] += cents
+    elif tally['payment_method'] == 'CARD':
+        totals['card_cents'] += cents
+    totals['orders'] += 1
+    for bucket in (totals['seats'].setdefault(tally['seat'], [0, 0]),
+                   totals['hours'].setdefault(tally['hour'], [0, 0])):
+        bucket[0] += 1
+        bucket[1] += cents
+    for name, quantity, unit_cents in tally['items']:
+        item = totals['items'].setdefault(name, [0, 0])
+        item[0] += quantity
+        item[1] += quantity * unit_cents
+
+
+def _scan_daily_totals(csv_file, on_problem=None):
+    """
+    Rebuilds the totals for a day by streaming through its CSV once, in constant
+    memory. Torn or unreadable rows, and item rows left without their ORDER TOTAL at
+    the end of the file, are skipped and passed to on_problem(line_number, message)
+    (by default printed as warnings). Returns (totals, has_summary_rows).
+    """
+    if on_problem is None:
+        on_problem = lambda line_number, message: print(f"Warning: {csv_file} line {line_number}: {message}")
+    totals = _empty_totals()
+    has_summary_rows = False
+    open_items = []  # item rows since the last ORDER TOTAL
+    with open(csv_file, mode='r', newline='', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            if None in row or None in row.values():
+                on_problem(reader.line_num, f"expected {len(LEDGER_FIELDNAMES)} fields: {row}")
+                continue
+            if row['item_name'] in SUMMARY_ITEM_NAMES:
+                has_summary_rows = True
+                continue
+            if row['item_name'] != 'ORDER TOTAL':
+                try:
+                    _row_quantity(row), _to_cents(row['price'] or 0)
+                    open_items.append(row)
+                except ValueError:
+                    on_problem(reader.line_num, f"Could not parse quantity or price for row: {row}")
+                continue
+            try:
+                _add_to_totals(totals, _tally_order(open_items + [row]))
+            except ValueError:
+                on_problem(reader.line_num, f"Could not parse price for row: {row}")
+            open_items = []
+        if open_items:
+            on_problem(reader.line_num, f"{len(open_items)} item rows at the end have no ORDER TOTAL (cut off mid-write)")
+    return totals, has_summary_rows
+
+
+def _strip_summary_rows(csv_file):
+    """One-time conversion of a day file written in 'rewrite' mode: drops the trailing totals rows."""
+    _checkpoint_ledger()
+    temp_file = csv_file.with_suffix('.tmp')
+    with open(csv_file, mode='r', newline='', encoding='utf-8') as src, \
+         open(temp_file, mode='w', newline='', encoding='utf-8') as dst:
+        writer = csv.DictWriter(dst, fieldnames=LEDGER_FIELDNAMES)
+        writer.writeheader()
+        for row in csv.DictReader(src):
+            if row.get('item_name') not in SUMMARY_ITEM_NAMES:
+                writer.writerow({k: row.get(k, '') for k in LEDGER_FIELDNAMES})
+        _sync_ledger_file(dst)
+    os.replace(temp_file, csv_file)
+
+
+def check_day_file(csv_file, on_problem=None, rebuild_totals=False):
+    """
+    Scans a day file for corrupt rows (see _scan_daily_totals()) and returns the totals
+    of its intact orders; with rebuild_totals=True they also replace its totals sidecar.
+    """
+    csv_file = Path(csv_file)
+    with ledger_lock():
+        totals, has_summary_rows = _scan_daily_totals(csv_file, on_problem)
+        if rebuild_totals:
+            if has_summary_rows:
+                _strip_summary_rows(csv_file)
+            totals['csv_size'] = csv_file.stat().st_size
+            totals['summary_rows'] = False
+            _write_daily_totals(csv_file.with_suffix('.totals.json'), totals)
+    return totals
+
+
+def _write_daily_totals(totals_file, totals):
+    temp_file = totals_file.with_suffix('.tmp')
+    with open(temp_file, mode='w', encoding='utf-8') as f:
+        json.dump(totals, f)
+    os.replace(temp_file, totals_file)
+
+
+def _load_daily_totals(csv_file, totals_file, for_append=False):
+    """
+    Returns the running totals for a day file. The sidecar is trusted only if it was
+    written for the CSV's current size; otherwise (first use, legacy file, sidecar
+    from before the report breakdowns, or a crash between the two writes) the totals
+    are rebuilt from the CSV and saved, leaving the CSV itself as it is. Only when
+    the caller is about to append (for_append) are the totals rows of a file written
+    in 'rewrite' mode dropped, so the new orders don't land after them.
+    """
+    if not csv_file.exists():
+        return _empty_totals()
+    size = csv_file.stat().st_size
+    totals = None
+    try:
+        with open(totals_file, mode='r', encoding='utf-8') as f:
+            totals = json.load(f)
+        if totals.get('csv_size') != size or 'hours' not in totals:
+            totals = None
+    except (FileNotFoundError, ValueError):
+        pass
+
+    if totals is None:
+        totals, has_summary_rows = _scan_daily_totals(csv_file)
+        totals.update(csv_size=size, summary_rows=has_summary_rows)
+        _write_daily_totals(totals_file, totals)
+    if for_append and totals.get('summary_rows'):
+        _strip_summary_rows(csv_file)
+        totals.update(csv_size=csv_file.stat().st_size, summary_rows=False)
+    return totals
+
+
+def get_daily_totals(day=None):
+    """Returns the CASH/CARD/DAILY totals for a day (default: today) as formatted strings."""
+    day = day or datetime.now().strftime("%Y-%m-%d")
+    if LEDGER_BACKEND == 'sqlite':
+        totals = _db_daily_totals(day)
+    else:
+        csv_file, totals_file = _ledger_paths(day)
+        with ledger_lock():
+            totals = _load_daily_totals(csv_file, totals_file)
+    cash, card = totals['cash_cents'], totals['card_cents']
+    return {
+        'date': day,
+        'orders': totals['orders'],
+        'cash': f"{cash / 100:.2f}",
+        'card': f"{card / 100:.2f}",
+        'total': f"{(cash + card) / 100:.2f}",
+    }
+
+
+def get_daily_report(day=None):
+    """
+    The daily report for a day (default: today): the get_daily_totals() figures plus
+    quantity and revenue per item (best sellers first), orders and revenue per seat,
+    and per hour of the day. Read from the totals sidecar, which the ledger writer
+    keeps up to date order by order and which is built once for a day that lacks it,
+    so the cost doesn't grow with the number of orders.
+    """
+    day = day or datetime.now().strftime("%Y-%m-%d")
+    if LEDGER_BACKEND == 'sqlite':
+        totals = _db_daily_report(day)
+    else:
+        csv_file, totals_file = _ledger_paths(day)
+        with ledger_lock():
+            totals = _load_daily_totals(csv_file, totals_file)
+    cash, card = totals['cash_cents'], totals['card_cents']
+    items = sorted(totals['items'].items(), key=lambda entry: (-entry[1][1], entry[0]))
+    return {
+        'date': day,
+        'orders': totals['orders'],
+        'cash': f"{cash / 100:.2f}",
+        'card': f"{card / 100:.2f}",
+        'total': f"{(cash + card) / 100:.2f}",
+        'items': [{'name': name, 'quantity': quantity, 'revenue': f"{cents / 100:.2f}"}
+                  for name, (quantity, cents) in items],
+        'seats': [{'seat': seat, 'orders': orders, 'total': f"{cents / 100:.2f}"}
+                  for seat, (orders, cents) in sorted(totals['seats'].items())],
+        'hours': [{'hour': f"{hour}:00", 'orders': orders, 'total': f"{cents / 100:.2f}"}
+                  for hour, (orders, cents) in sorted(totals['hours'].items())],
+    }
+
 
-# ESC/POS commands
-CUT_PAPER = b'\x1D\x56\x00'  # Full cut command
-LINE_FEED = b'\n'
+def _order_rows(order_data, now, payment_method):
+    """Builds the CSV rows for one order: one per item plus the ORDER TOTAL line."""
+    rows = []
+    for item in order_data['items']:
+        rows.append({
+            "timestamp": now,
+            "seat": order_data['seat'],
+            "item_name": item['name'],
+            "quantity": item.get('quantity', 1),
+            "price": item['price'],
+            "payment_method": ""  # Payment method is per-order, not per-item
+        })
+    rows.append({
+        "timestamp": now,
+        "seat": order_data['seat'],
+        "item_name": "ORDER TOTAL",
+        "quantity": "",
+        "price": order_data['total'],
+        "payment_method": payment_method
+    })
+    return rows
+
+
+def log_order_to_csv(order_data):
+    """
+    Logs an order to today's CSV file (or LEDGER_DB) using the configured LEDGER_MODE.
+    Returns once the ledger writer has made it durable; raises what writing it raised.
+    """
+    return submit_order_to_ledger(order_data).result()
 
-# Menu XML file path
-MENU_FILE = 'menu.xml'
 
-def ensure_menu_file_has_order():
-    """Reads the XML and adds an 'order' attribute if missing."""
-    if not os.path.exists(MENU_FILE):
+def _write_ledger_entries(entries):
+    """Writes a batch of ledger entries (see submit_order_to_ledger()) to the configured backend."""
+    if LEDGER_BACKEND == 'sqlite':
+        _insert_orders_db(entries)  # SQLite does its own locking between processes
         return
+    with ledger_lock():
+        days = OrderedDict()
+        for entry in entries:
+            days.setdefault(entry['day'], []).append(entry)
+        appends, sidecars = [], []
+        for day, day_entries in days.items():
+            if LEDGER_MODE == 'rewrite':
+                for entry in day_entries:
+                    _rewrite_order_csv(entry['order'])
+            else:
+                append, sidecar = _order_csv_append(day, day_entries)
+                appends.append(append)
+                sidecars.append(sidecar)
+            checked = [entry for entry in day_entries if entry['order'].get('priceCheck')]
+            if checked:
+                appends.append(_price_checks_append(day, checked))
+        _journal_ledger_appends(appends)
+        # Only once the rows are in: a sidecar is trusted when its csv_size matches the file
+        for totals_file, totals in sidecars:
+            _write_daily_totals(totals_file, totals)
 
-    tree = ET.parse(MENU_FILE)
-    root = tree.getroot()
-    
-    needs_rewrite = False
-    for i, category_elem in enumerate(root.findall('category')):
-        if 'order' not in category_elem.attrib:
-            category_elem.set('order', str(i))
-            needs_rewrite = True
-    
-    if needs_rewrite:
-        tree.write(MENU_FILE, encoding='utf-8', xml_declaration=True)
 
+def _order_csv_append(day, entries):
+    """
+    Builds the journal append (path, offset, text) that adds a day's orders to its CSV,
+    and the (totals_file, totals) its sidecar should hold afterwards.
+    """
+    csv_file, totals_file = _ledger_paths(day)
+    totals = _load_daily_totals(csv_file, totals_file, for_append=True)
+    offset = _ledger_file_size(csv_file)
 
-def get_menu_data():
-    """Read menu data from XML file, preserving order."""
-    ensure_menu_file_has_order()
-    tree = ET.parse(MENU_FILE)
-    root = tree.getroot()
-    
-    # Read categories into a list
-    categories = []
-    for category in root.findall('category'):
-        cat_name = category.get('name')
-        cat_color = category.get('color')
-        cat_order = int(category.get('order', 999))
-        
-        items = []
-        for item in category.findall('item'):
-            name = item.find('name').text
-            description_elem = item.find('description')
-            description = description_elem.text if description_elem is not None else ''
-            price = float(item.find('price').text)
-            icon_elem = item.find('icon')
-            icon = icon_elem.text if icon_elem is not None else ''
-            
-            item_dict = {
-                'name': name,
-                'description': description,
-                'basePrice': price,
-                'icon': icon,
-                'options': []
-            }
-            
-            options_elem = item.find('options')
-            if options_elem is not None:
-                for option in options_elem.findall('option'):
-                    item_dict['options'].append({
-                        'label': option.get('label'),
-                        'priceAdjustment': float(option.get('price_adjustment', '0'))
-                    })
-            items.append(item_dict)
-
-        categories.append({
-            'name': cat_name,
-            'color': cat_color,
-            'order': cat_order,
-            'items': items
-        })
-    
-    # Sort by the order attribute and return
-    categories.sort(key=lambda x: x['order'])
-    return categories
+    out = io.StringIO(newline='')
+    writer = csv.DictWriter(out, fieldnames=LEDGER_FIELDNAMES)
+    if offset == 0:
+        writer.writeheader()
+    for entry in entries:
+        writer.writerows(entry['rows'])
+    text = out.getvalue()
 
-def save_menu_data(menu_list):
-    """Save menu data list to XML file, preserving order."""
-    root = ET.Element('menu')
-    
-    for index, category in enumerate(menu_list):
-        cat_elem = ET.SubElement(root, 'category', 
-                                 name=category['name'], 
-                                 color=category['color'],
-                                 order=str(index)) # Save index as order
-        
-        for item in category['items']:
-            item_elem = ET.SubElement(cat_elem, 'item')
-            ET.SubElement(item_elem, 'name').text = item['name']
-            desc_elem = ET.SubElement(item_elem, 'description')
-            desc_elem.text = item.get('description', '')
-            ET.SubElement(item_elem, 'price').text = str(item['basePrice'])
-            if item.get('icon'):
-                icon_elem = ET.SubElement(item_elem, 'icon')
-                icon_elem.text = item['icon']
-            
-            if 'options' in item and item['options']:
-                options_elem = ET.SubElement(item_elem, 'options')
-                for option in item['options']:
-                    ET.SubElement(options_elem, 'option', 
-                                  label=option['label'], 
-                                  price_adjustment=str(option.get('priceAdjustment', 0)))
-    
-    tree = ET.ElementTree(root)
-    tree.write(MENU_FILE, encoding='utf-8', xml_declaration=True)
+    for entry in entries:
+        _add_to_totals(totals, entry['tally'])
+    totals['csv_size'] = offset + len(text.encode('utf-8'))
+    return (csv_file, offset, text), (totals_file, totals)
 
 
-def log_order_to_csv(order_data):
+def _rewrite_order_csv(order_data):
     """
     Logs an order to a daily CSV file. This function reads all existing orders for the day,
     appends the new one, recalculates the daily totals, and writes everything back to the file.
     This ensures that the summary totals are always correct.
     """
-    logs_dir = Path("order_logs")
-    logs_dir.mkdir(exist_ok=True)
-
     today = datetime.now().strftime("%Y-%m-%d")
-    csv_file = logs_dir / f"orders_{today}.csv"
+    csv_file, totals_file = _ledger_paths(today)
 
-    fieldnames = ["timestamp", "seat", "item_name", "quantity", "price", "payment_method"]
+    fieldnames = LEDGER_FIELDNAMES
     payment_method = "CARD" if order_data.get('payByCard') else "CASH"
 
     # --- Step 1: Read all existing valid order lines from the CSV ---
@@ -139,33 +1780,14 @@ def log_order_to_csv(order_data):
     if csv_file.exists():
         with open(csv_file, mode='r', newline='', encoding='utf-8') as f:
             reader = csv.DictReader(f)
-            # Define the summary lines that we need to exclude from the old data
-            summary_item_names = {"CASH TOTAL", "CARD TOTAL", "DAILY TOTAL"}
             for row in reader:
                 # Keep all lines that are not part of the final summary
-                if row.get('item_name') not in summary_item_names:
+                if row.get('item_name') not in SUMMARY_ITEM_NAMES:
                     all_order_lines.append(row)
 
     # --- Step 2: Add the new order items and total to the list in memory ---
     now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    for item in order_data['items']:
-        all_order_lines.append({
-            "timestamp": now,
-            "seat": order_data['seat'],
-            "item_name": item['name'],
-            "quantity": item.get('quantity', 1),
-            "price": item['price'],
-            "payment_method": ""  # Payment method is per-order, not per-item
-        })
-    # Append the total line for the new order
-    all_order_lines.append({
-        "timestamp": now,
-        "seat": order_data['seat'],
-        "item_name": "ORDER TOTAL",
-        "quantity": "",
-        "price": order_data['total'],
-        "payment_method": payment_method
-    })
+    all_order_lines.extend(_order_rows(order_data, now, payment_method))
 
     # --- Step 3: Recalculate daily totals from the complete list of orders ---
     daily_cash = 0.0
@@ -185,8 +1807,11 @@ def log_order_to_csv(order_data):
                 continue
 
     # --- Step 4: Atomically write everything back to the CSV file ---
-    # Overwrite the file with the updated data and new totals
-    with open(csv_file, mode='w', newline='', encoding='utf-8') as f:
+    # Write the updated data and new totals to a temp file that replaces the old one,
+    # so a crash leaves either the old or the new day, never a truncated one
+    _checkpoint_ledger()
+    temp_file = csv_file.with_suffix('.tmp')
+    with open(temp_file, mode='w', newline='', encoding='utf-8') as f:
         writer = csv.DictWriter(f, fieldnames=fieldnames)
         
         # Write the header first
@@ -208,6 +1833,358 @@ def log_order_to_csv(order_data):
             "timestamp": "", "seat": "", "item_name": "DAILY TOTAL",
             "quantity": "", "price": f"{(daily_cash + daily_card):.2f}", "payment_method": ""
         })
+        _sync_ledger_file(f)
+    os.replace(temp_file, csv_file)
+
+    # The sidecar describes an append-mode file; drop it so a later switch back rebuilds it
+    if totals_file.exists():
+        totals_file.unlink()
+
+
+# --- SQLite order store ---
+# One row per order in `orders` and one per line in `order_items`, indexed on
+# timestamp, seat and payment method so report queries don't scan whole days.
+# The database runs in WAL mode, so readers never block the /print writer.
+# quantity/price/total keep the exact text that would have gone into the CSV so
+# export_day_csv() reproduces the append-mode file byte for byte; the *_cents
+# columns are what queries add up.
+LEDGER_DB = LEDGER_DIR / "orders.sqlite3"
+
+LEDGER_SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_id TEXT,
+    timestamp TEXT NOT NULL,
+    seat TEXT NOT NULL,
+    payment_method TEXT NOT NULL,
+    total TEXT NOT NULL,
+    total_cents INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS order_items (
+    order_ref INTEGER NOT NULL REFERENCES orders(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    item_name TEXT NOT NULL,
+    quantity TEXT NOT NULL,
+    price TEXT NOT NULL,
+    price_cents INTEGER NOT NULL,
+    PRIMARY KEY (order_ref, position)
+);
+CREATE INDEX IF NOT EXISTS orders_timestamp ON orders(timestamp);
+CREATE INDEX IF NOT EXISTS orders_seat ON orders(seat, timestamp);
+CREATE INDEX IF NOT EXISTS orders_payment ON orders(payment_method, timestamp);
+CREATE UNIQUE INDEX IF NOT EXISTS orders_order_id ON orders(order_id) WHERE order_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS order_items_name ON order_items(item_name);
+CREATE TABLE IF NOT EXISTS price_checks (
+    order_ref INTEGER PRIMARY KEY REFERENCES orders(id) ON DELETE CASCADE,
+    client_total TEXT,
+    details TEXT NOT NULL
+);
+"""
+
+_ledger_db_local = threading.local()
+
+
+def _csv_text(value):
+    """The text csv.writer would write for a value."""
+    return '' if value is None else str(value)
+
+
+def get_ledger_db():
+    """Returns this thread's connection to LEDGER_DB, creating the schema on first use."""
+    conn = getattr(_ledger_db_local, 'conn', None)
+    if conn is None:
+        LEDGER_DIR.mkdir(exist_ok=True)
+        conn = sqlite3.connect(LEDGER_DB, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA foreign_keys=ON')
+        conn.executescript(LEDGER_SCHEMA)
+        _ledger_db_local.conn = conn
+    return conn
+
+
+def _day_range(day):
+    """The (first, last) timestamps of a YYYY-MM-DD day, for range queries on orders.timestamp."""
+    return f"{day} 00:00:00", f"{day} 23:59:59"
+
+
+def _store_order(conn, timestamp, seat, payment_method, total, lines, order_id=None):
+    """
+    Inserts one order and its (item_name, quantity, price) lines. Caller commits.
+    Every price is parsed before anything is inserted, so a bad one raises ValueError
+    or TypeError without leaving a half-written order in the transaction.
+    """
+    total_cents = _to_cents(total or 0)
+    items = [(position, name, _csv_text(quantity), _csv_text(price), _to_cents(price or 0))
+             for position, (name, quantity, price) in enumerate(lines)]
+    cursor = conn.execute(
+        'INSERT INTO orders (order_id, timestamp, seat, payment_method, total, total_cents) '
+        'VALUES (?, ?, ?, ?, ?, ?)',
+        (order_id, timestamp, seat, payment_method, _csv_text(total), total_cents))
+    conn.executemany(
+        'INSERT INTO order_items (order_ref, position, item_name, quantity, price, price_cents) '
+        'VALUES (?, ?, ?, ?, ?, ?)',
+        [(cursor.lastrowid,) + item for item in items])
+    return cursor.lastrowid
+
+
+def _insert_orders_db(entries):
+    """Writes a batch of ledger entries to LEDGER_DB in a single transaction."""
+    conn = get_ledger_db()
+    # WAL with synchronous=NORMAL may lose the last commits on power loss; FULL syncs each one
+    conn.execute(f"PRAGMA synchronous={'FULL' if LEDGER_FSYNC else 'NORMAL'}")
+    with conn:
+        for entry in entries:
+            order_data = entry['order']
+            lines = [(row['item_name'], row['quantity'], row['price']) for row in entry['rows'][:-1]]
+            order_ref = _store_order(conn, entry['time'], order_data['seat'], entry['payment_method'],
+                                     order_data['total'], lines, order_data.get('orderId'))
+            if order_data.get('priceCheck'):
+                conn.execute('INSERT INTO price_checks (order_ref, client_total, details) VALUES (?, ?, ?)',
+                             (order_ref, order_data['priceCheck']['clientTotal'],
+                              json.dumps(order_data['priceCheck'], ensure_ascii=False)))
+
+
+def _db_daily_report(day):
+    """Same shape as the CSV sidecar totals, with the report breakdowns, computed from LEDGER_DB."""
+    conn = get_ledger_db()
+    totals = _db_daily_totals(day)
+    totals['items'] = {row[0]: [row[1], row[2]] for row in conn.execute(
+        'SELECT item_name, SUM(CAST(quantity AS INTEGER)), SUM(CAST(quantity AS INTEGER) * price_cents) '
+        'FROM order_items JOIN orders ON orders.id = order_items.order_ref '
+        'WHERE orders.timestamp BETWEEN ? AND ? GROUP BY item_name', _day_range(day))}
+    for key, column in (('seats', 'seat'), ('hours', 'substr(timestamp, 12, 2)')):
+        totals[key] = {row[0]: [row[1], row[2]] for row in conn.execute(
+            f'SELECT {column}, COUNT(*), SUM(total_cents) FROM orders '
+            f'WHERE timestamp BETWEEN ? AND ? GROUP BY 1', _day_range(day))}
+    return totals
+
+
+def _db_daily_totals(day):
+    """Same shape as the CSV sidecar totals, computed from LEDGER_DB."""
+    row = get_ledger_db().execute(
+        "SELECT COALESCE(SUM(CASE WHEN payment_method = 'CASH' THEN total_cents END), 0) AS cash_cents, "
+        "       COALESCE(SUM(CASE WHEN payment_method = 'CARD' THEN total_cents END), 0) AS card_cents, "
+        "       COUNT(*) AS orders "
+        "FROM orders WHERE timestamp BETWEEN ? AND ?", _day_range(day)).fetchone()
+    return {'cash_cents': row['cash_cents'], 'card_cents': row['card_cents'], 'orders': row['orders']}
+
+
+def query_orders(day=None, seat=None, payment_method=None, start=None, end=None):
+    """
+    Returns the orders matching the filters from LEDGER_DB, oldest first, each with its
+    items and price_check (None unless the tablet's prices were off). start/end are 'YYYY-MM-DD HH:MM:SS' (or a prefix) and bound the timestamp.
+    """
+    clauses, params = [], []
+    if day:
+        clauses.append('timestamp BETWEEN ? AND ?')
+        params.extend(_day_range(day))
+    if start:
+        clauses.append('timestamp >= ?')
+        params.append(start)
+    if end:
+        clauses.append('timestamp <= ?')
+        params.append(end)
+    if seat:
+        clauses.append('seat = ?')
+        params.append(seat)
+    if payment_method:
+        clauses.append('payment_method = ?')
+        params.append(payment_method.upper())
+    where = ' WHERE ' + ' AND '.join(clauses) if clauses else ''
+
+    conn = get_ledger_db()
+    orders = [dict(row) for row in conn.execute(
+        f'SELECT id, order_id, timestamp, seat, payment_method, total, total_cents FROM orders{where} ORDER BY id',
+        params)]
+    by_id = {order['id']: order for order in orders}
+    for order in orders:
+        order['items'] = []
+        order['price_check'] = None
+    if by_id:
+        rows = conn.execute(
+            f"SELECT order_ref, item_name, quantity, price FROM order_items "
+            f"WHERE order_ref IN ({','.join('?' * len(by_id))}) ORDER BY order_ref, position",
+            list(by_id))
+        for row in rows:
+            by_id[row['order_ref']]['items'].append(
+                {'name': row['item_name'], 'quantity': row['quantity'], 'price': row['price']})
+        rows = conn.execute(
+            f"SELECT order_ref, details FROM price_checks WHERE order_ref IN ({','.join('?' * len(by_id))})",
+            list(by_id))
+        for row in rows:
+            by_id[row['order_ref']]['price_check'] = json.loads(row['details'])
+    return orders
+
+
+def export_day_csv(day, out):
+    """
+    Writes a day from LEDGER_DB to the text stream `out` in the append-mode CSV format
+    (header, then each order's item rows followed by its ORDER TOTAL row).
+    Open `out` with newline='' so the CSV line endings are kept.
+    """
+    writer = csv.DictWriter(out, fieldnames=LEDGER_FIELDNAMES)
+    writer.writeheader()
+    for order in query_orders(day=day):
+        for item in order['items']:
+            writer.writerow({
+                "timestamp": order['timestamp'],
+                "seat": order['seat'],
+                "item_name": item['name'],
+                "quantity": item['quantity'],
+                "price": item['price'],
+                "payment_method": "",
+            })
+        writer.writerow({
+            "timestamp": order['timestamp'],
+            "seat": order['seat'],
+            "item_name": "ORDER TOTAL",
+            "quantity": "",
+            "price": order['total'],
+            "payment_method": order['payment_method'],
+        })
+
+
+def import_csv_day(csv_file):
+    """
+    Loads one orders_YYYY-MM-DD.csv into LEDGER_DB and returns the number of orders
+    imported. Summary rows from 'rewrite' mode are skipped. A day that already has
+    orders in the database is left alone and 0 is returned.
+    """
+    day = csv_file.stem[len('orders_'):]
+    conn = get_ledger_db()
+    if conn.execute('SELECT 1 FROM orders WHERE timestamp BETWEEN ? AND ? LIMIT 1',
+                    _day_range(day)).fetchone():
+        return 0
+
+    imported = 0
+    rows = []  # (line number, row) of the order being read, ending with its ORDER TOTAL row
+    with conn, open(csv_file, mode='r', newline='', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            name = row.get('item_name')
+            if name in SUMMARY_ITEM_NAMES:
+                continue
+            rows.append((reader.line_num, row))
+            if name != 'ORDER TOTAL':
+                continue
+            order_rows, rows = rows, []
+            bad = next(((line_number, bad_row) for line_number, bad_row in order_rows
+                        if not _is_price(bad_row.get('price'))), None)
+            if bad:
+                print(f"Warning: {csv_file}:{bad[0]}: could not parse price for row: {bad[1]}; "
+                      f"order of {len(order_rows) - 1} item(s) skipped")
+                continue
+            _store_order(conn, row['timestamp'], row['seat'], row.get('payment_method', ''),
+                         row.get('price', ''),
+                         [(item['item_name'], item.get('quantity', ''), item.get('price', ''))
+                          for _, item in order_rows[:-1]])
+            imported += 1
+    if rows:
+        print(f"Warning: {csv_file} ends with {len(rows)} item row(s) without an ORDER TOTAL; skipped")
+    return imported
+
+
+def import_csv_ledger(csv_dir=None):
+    """One-shot import of every daily CSV under csv_dir (default LEDGER_DIR). Returns {day: orders}."""
+    csv_dir = Path(csv_dir or LEDGER_DIR)
+    return {csv_file.stem[len('orders_'):]: import_csv_day(csv_file)
+            for csv_file in sorted(csv_dir.glob('orders_*.csv'))}
+
+
+# --- Ledger writer ---
+# /print doesn't write the ledger itself: log_order_to_csv() hands the order to one
+# writer thread through a bounded queue and waits on a Future. The writer takes the
+# first order plus whatever arrives within LEDGER_COMMIT_WINDOW (up to
+# LEDGER_COMMIT_BATCH orders) and commits them together - one append and one fsync
+# per day file, or one SQLite transaction - before resolving their Futures. So a
+# successful /print still means the order is on disk, but in a rush the orders share
+# an fsync instead of each waiting for its own.
+LEDGER_QUEUE_SIZE = 1000
+LEDGER_COMMIT_WINDOW = 0.005  # seconds
+LEDGER_COMMIT_BATCH = 64
+LEDGER_FSYNC = True  # False keeps orders only as safe as the OS page cache (benchmarks, tests)
+LEDGER_SUBMIT_TIMEOUT = 30  # seconds to wait for room in a full queue
+
+_ledger_queue = queue.Queue(maxsize=LEDGER_QUEUE_SIZE)
+_ledger_writer_lock = threading.Lock()
+_ledger_writer_state = {'thread': None}
+
+
+def start_ledger_writer():
+    """
+    Starts the ledger writer thread if this process has none running (e.g. after a
+    fork), replaying the ledger journal first if this process hasn't yet.
+    """
+    with _ledger_writer_lock:
+        thread = _ledger_writer_state['thread']
+        if thread is None and LEDGER_BACKEND == 'csv':
+            stats = recover_ledger()
+            if stats['replayed'] or stats['torn']:
+                print(f"Ledger journal: replayed {stats['replayed']} appends from {stats['batches']} batches, "
+                      f"dropped {stats['torn']} torn batches")
+        if thread is None or not thread.is_alive():
+            thread = threading.Thread(target=_ledger_writer_loop, name='ledger-writer', daemon=True)
+            _ledger_writer_state['thread'] = thread
+            thread.start()
+
+
+def submit_order_to_ledger(order_data):
+    """
+    Queues an order for the ledger writer and returns a Future that resolves once it is
+    durable. The order is stamped and turned into CSV rows here, so a malformed order
+    raises in the caller. Raises RuntimeError if the queue stays full.
+    """
+    now = datetime.now()
+    timestamp = now.strftime("%Y-%m-%d %H:%M:%S")
+    payment_method = "CARD" if order_data.get('payByCard') else "CASH"
+    rows = _order_rows(order_data, timestamp, payment_method)
+    entry = {
+        'order': order_data,
+        'day': now.strftime("%Y-%m-%d"),
+        'time': timestamp,
+        'payment_method': payment_method,
+        'rows': rows,
+        'tally': _tally_order(rows),
+        'future': Future(),
+    }
+    start_ledger_writer()
+    try:
+        _ledger_queue.put(entry, timeout=LEDGER_SUBMIT_TIMEOUT)
+    except queue.Full:
+        raise RuntimeError('The order ledger is not keeping up; please try again') from None
+    return entry['future']
+
+
+def _commit_ledger_batch(entries):
+    """Writes a batch and resolves its Futures with the outcome."""
+    try:
+        _write_ledger_entries(entries)
+    except Exception as e:
+        if LEDGER_BACKEND == 'sqlite' and len(entries) > 1:
+            # The transaction was rolled back; retry one by one so only the bad order fails
+            for entry in entries:
+                _commit_ledger_batch([entry])
+            return
+        for entry in entries:
+            entry['future'].set_exception(e)
+        return
+    for entry in entries:
+        entry['future'].set_result(None)
+
+
+def _ledger_writer_loop():
+    while True:
+        entries = [_ledger_queue.get()]
+        deadline = time.monotonic() + LEDGER_COMMIT_WINDOW
+        while len(entries) < LEDGER_COMMIT_BATCH:
+            remaining = deadline - time.monotonic()
+            try:
+                entries.append(_ledger_queue.get(timeout=remaining) if remaining > 0 else _ledger_queue.get_nowait())
+            except queue.Empty:
+                break
+        _commit_ledger_batch(entries)
 
 
 HTML_TEMPLATE = '''
@@ -216,8 +2193,13 @@ HTML_TEMPLATE = '''
 <head>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    {% if assets %}
+    <link rel="stylesheet" href="{{ url_for('static', filename=assets['tailwind.css']) }}">
+    <link rel="stylesheet" href="{{ url_for('static', filename=assets['icons.css']) }}">
+    {% else %}
     <script src="https://cdn.tailwindcss.com"></script>
     <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css">
+    {% endif %}
     <style>
         .seat { transition: all 0.2s ease; }
         .seat.selected { transform: scale(1.1); box-shadow: 0 0 10px rgba(251, 191, 36, 0.7); }
@@ -360,11 +2342,11 @@ HTML_TEMPLATE = '''
         }
 
         // Category functions
-        function selectCategory(category) {
+        function selectCategory(category, button) {
             document.querySelectorAll('.category-btn').forEach(btn => {
                 btn.classList.remove('active');
             });
-            event.currentTarget.classList.add('active');
+            (button || event.currentTarget).classList.add('active');
             
             document.querySelectorAll('.category-content').forEach(content => {
                 content.classList.add('hidden');
@@ -415,13 +2397,13 @@ HTML_TEMPLATE = '''
             const finalPrice = baseItem.basePrice + option.priceAdjustment;
             const itemNameWithOptions = `${baseItem.name} (${option.label})`;
 
-            addToOrder(itemNameWithOptions, finalPrice, baseItem.description);
+            addToOrder(itemNameWithOptions, finalPrice, baseItem.description, baseItem.category, baseItem.id, option.id);
             closeOptionsModal();
         }
 
 
         // Order functions
-        function addToOrder(name, price, description) {
+        function addToOrder(name, price, description, category, itemId, optionId) {
             if (!currentSeat) {
                 alert("Please select your seat first!");
                 return;
@@ -437,7 +2419,10 @@ HTML_TEMPLATE = '''
                     price, 
                     quantity: 1,
                     customText: "",
-                    description: description || ""
+                    description: description || "",
+                    category: category || "",
+                    itemId: itemId || null,
+                    optionId: optionId || null
                 });
             }
             
@@ -453,7 +2438,7 @@ HTML_TEMPLATE = '''
             if (item.options && item.options.length > 0) {
                 showOptionsModal(item);
             } else {
-                addToOrder(item.name, item.basePrice, item.description);
+                addToOrder(item.name, item.basePrice, item.description, item.category, item.id);
             }
         }
 
@@ -546,6 +2531,22 @@ HTML_TEMPLATE = '''
             }
         }
 
+        // Resending the same order after a network error reuses its id, so the
+        // server replays the first result instead of logging/printing it again.
+        // Any change to the order gets a fresh id.
+        let pendingOrder = null;
+
+        function orderIdFor(orderData) {
+            const fingerprint = JSON.stringify(orderData);
+            if (!pendingOrder || pendingOrder.fingerprint !== fingerprint) {
+                const id = (window.crypto && crypto.randomUUID)
+                    ? crypto.randomUUID()
+                    : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+                pendingOrder = { id, fingerprint };
+            }
+            return pendingOrder.id;
+        }
+
         function submitOrder() {
             if (!currentSeat || orderItems.length === 0) return;
 
@@ -565,15 +2566,23 @@ HTML_TEMPLATE = '''
                 notes: notes,
                 payByCard: payByCard
             };
+            orderData.orderId = orderIdFor(orderData);
             
             fetch('/print', {
                 method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
+                headers: { 'Content-Type': 'application/json', 'Idempotency-Key': orderData.orderId },
                 body: JSON.stringify(orderData)
             })
             .then(response => response.json())
             .then(data => {
                 if (data.status === 'success') {
+                    pendingOrder = null;
+                    if (data.priceCheck && data.priceCheck.clientTotal !== data.total) {
+                        // This tablet's menu is out of date; the ticket shows the server's prices
+                        alert(`Prices were updated from the current menu: the total is €${data.total} (this tablet had €${data.priceCheck.clientTotal}).`);
+                        reloadMenu();
+                    }
+                    (data.jobs || [{ job_id: data.job_id }]).forEach(job => watchPrintJob(job.job_id, orderData.seat, job.station));
                     orderItems = [];
                     total = 0;
                     
@@ -595,8 +2604,81 @@ HTML_TEMPLATE = '''
             });
         }
         
+        // The ticket is printed in the background; follow the job and only
+        // bother the waiter if the printer never accepted it.
+        async function watchPrintJob(jobId, seat, station) {
+            if (!jobId) return;
+            for (let i = 0; i < 20; i++) {
+                try {
+                    const response = await fetch(`/print/status/${jobId}?wait=25`);
+                    if (response.status === 404) return;
+                    const job = await response.json();
+                    if (job.status === 'done') return;
+                    if (job.status === 'failed') {
+                        const where = station ? ` (${station})` : '';
+                        alert(`Ticket for seat ${seat}${where} could not be printed: ${job.error || 'Unknown error'}`);
+                        return;
+                    }
+                } catch (error) {
+                    await new Promise(resolve => setTimeout(resolve, 3000));
+                }
+            }
+        }
+
         // --- MENU MANAGEMENT ---
-        let currentEditItem = { category: null, index: -1, options: [] };
+        let currentEditItem = { category: null, index: -1, id: null, options: [] };
+
+        // Menu writes carry the ETag of the menu they were based on. If another
+        // tablet changed it in the meantime the server answers 409 and the
+        // manager redoes the change on the reloaded menu.
+        async function menuWrite(url, method, body, failureMessage) {
+            const headers = { 'Content-Type': 'application/json' };
+            if (menuEtag) headers['If-Match'] = `"${menuEtag}"`;
+            const response = await fetch(url, {
+                method: method,
+                headers: headers,
+                body: body === undefined ? undefined : JSON.stringify(body)
+            });
+            if (response.status === 409) {
+                throw new Error('The menu was changed on another device. It has been reloaded, please try again.');
+            }
+            if (!response.ok) throw new Error((await response.json()).message || failureMessage);
+            return response;
+        }
+
+        // All management changes go through /api/menu/batch. Quick repeated edits
+        // (reordering categories, deleting items) are applied to the local menu
+        // at once and sent together after a short pause; any other change takes
+        // the queued ones along. The saved batch comes back as one menu stream delta.
+        let pendingMenuOps = [];
+        let menuFlushTimer = null;
+
+        function queueMenuOp(op) {
+            pendingMenuOps.push(op);
+            clearTimeout(menuFlushTimer);
+            menuFlushTimer = setTimeout(() => {
+                commitMenuOps().catch(error => alert('Error: ' + error.message));
+            }, 800);
+        }
+
+        async function commitMenuOps(...ops) {
+            clearTimeout(menuFlushTimer);
+            const operations = pendingMenuOps.concat(ops);
+            pendingMenuOps = [];
+            if (operations.length === 0) return;
+            let version = null;
+            try {
+                const response = await menuWrite('/api/menu/batch', 'POST', { operations: operations }, 'Failed to save menu changes');
+                version = (await response.json()).version;
+            } catch (error) {
+                // Drop the local edits: reload from the last menu the server sent
+                menuEtag = null;
+                throw error;
+            } finally {
+                // Our own change comes back over the menu stream; refetch only if it doesn't
+                if (version === null || !(await waitForMenuVersion(version, 3000))) await reloadMenu();
+            }
+        }
         
         function openManagementModal() {
             document.getElementById('management-modal').classList.add('active');
@@ -650,28 +2732,17 @@ HTML_TEMPLATE = '''
             const defaultColor = Object.keys(colorOptions)[0];
 
             try {
-                const response = await fetch('/api/menu/category', {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ name: newCategoryName, color: defaultColor })
-                });
-                if (!response.ok) throw new Error((await response.json()).message || 'Failed to add category');
-                await loadAndRenderAll();
+                await commitMenuOps({ op: 'add_category', name: newCategoryName, color: defaultColor });
             } catch (error) { alert('Error: ' + error.message); }
         }
 
-        async function reorderCategory(categoryName, direction) {
-            try {
-                const response = await fetch('/api/menu/category/reorder', {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ name: categoryName, direction: direction })
-                });
-                if (!response.ok) throw new Error((await response.json()).message || 'Failed to reorder');
-                await loadAndRenderAll();
-            } catch (error) {
-                alert('Error reordering category: ' + error.message);
-            }
+        function reorderCategory(categoryName, direction) {
+            const index = menuData.findIndex(c => c.name === categoryName);
+            const target = direction === 'up' ? index - 1 : index + 1;
+            if (index < 0 || target < 0 || target >= menuData.length) return;
+            menuData.splice(target, 0, menuData.splice(index, 1)[0]);
+            renderManagementCategories();
+            queueMenuOp({ op: 'reorder_category', name: categoryName, direction: direction });
         }
         
         // Category Edit Modal
@@ -720,16 +2791,8 @@ HTML_TEMPLATE = '''
             const newColor = selectedSwatch.dataset.color;
 
             try {
-                const response = await fetch(`/api/menu/category/${encodeURIComponent(currentEditingCategory)}`, {
-                    method: 'PUT',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ new_name: newName, color: newColor })
-                });
-                if (!response.ok) throw new Error((await response.json()).message || 'Failed to update category');
-                
+                await commitMenuOps({ op: 'update_category', name: currentEditingCategory, new_name: newName, color: newColor });
                 closeCategoryEditModal();
-                await loadAndRenderAll();
-
             } catch (error) { alert('Error: ' + error.message); }
         }
 
@@ -737,9 +2800,7 @@ HTML_TEMPLATE = '''
         async function deleteCategory(categoryName) {
             if (!confirm(`Are you sure you want to delete the category "${categoryName}"? This will also delete all items within it.`)) return;
             try {
-                const response = await fetch(`/api/menu/category/${encodeURIComponent(categoryName)}`, { method: 'DELETE' });
-                if (!response.ok) throw new Error((await response.json()).message || 'Failed to delete category');
-                await loadAndRenderAll();
+                await commitMenuOps({ op: 'delete_category', name: categoryName });
                 // If the deleted category was selected, select the first one
                 if (!menuData.some(c => c.name === document.querySelector('.category-btn.active')?.dataset.category)) {
                     document.querySelector('.category-btn')?.click();
@@ -794,7 +2855,7 @@ HTML_TEMPLATE = '''
                 document.getElementById('item-price-input').value = '';
                 document.getElementById('item-desc-input').value = '';
                 document.getElementById('item-icon-input').value = '';
-                currentEditItem = { category: categoryName, index: -1, options: [] };
+                currentEditItem = { category: categoryName, index: -1, id: null, options: [] };
             } else { // Editing existing item
                 const category = menuData.find(c => c.name === categoryName);
                 if (!category) return;
@@ -804,7 +2865,7 @@ HTML_TEMPLATE = '''
                 document.getElementById('item-price-input').value = item.basePrice;
                 document.getElementById('item-desc-input').value = item.description || '';
                 document.getElementById('item-icon-input').value = item.icon || '';
-                currentEditItem = { category: categoryName, index: index, options: JSON.parse(JSON.stringify(item.options || [])) };
+                currentEditItem = { category: categoryName, index: index, id: item.id, options: JSON.parse(JSON.stringify(item.options || [])) };
             }
             
             renderItemOptionsEditor();
@@ -859,6 +2920,8 @@ HTML_TEMPLATE = '''
             }
 
             const itemData = {
+                op: currentEditItem.id ? 'update_item' : 'add_item',
+                id: currentEditItem.id,
                 category: category,
                 name: name,
                 description: document.getElementById('item-desc-input').value,
@@ -866,52 +2929,176 @@ HTML_TEMPLATE = '''
                 icon: document.getElementById('item-icon-input').value,
                 options: currentEditItem.options
             };
-            
-            let url = '/api/menu/item';
-            let method = 'POST';
-            if (currentEditItem.index > -1) {
-                method = 'PUT';
-                itemData.index = currentEditItem.index;
-            }
 
             try {
-                const response = await fetch(url, {
-                    method: method,
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify(itemData)
-                });
-                if (!response.ok) throw new Error((await response.json()).message || 'Failed to save item');
+                await commitMenuOps(itemData);
                 closeItemEditModal();
-                await loadAndRenderAll();
-
             } catch (error) {
                 console.error('Error saving item:', error);
                 alert('Error: ' + error.message);
             }
         }
 
-        async function deleteItem(categoryName, index) {
+        function deleteItem(categoryName, index) {
             const category = menuData.find(c => c.name === categoryName);
             if (!category) return;
-            if (!confirm(`Are you sure you want to delete "${category.items[index].name}"?`)) return;
+            const item = category.items[index];
+            if (!confirm(`Are you sure you want to delete "${item.name}"?`)) return;
 
-            try {
-                const response = await fetch('/api/menu/item', {
-                    method: 'DELETE',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ category: categoryName, index: index })
-                });
-                if (!response.ok) throw new Error((await response.json()).message || 'Failed to delete item');
-                await loadAndRenderAll();
-            } catch (error) { alert('Error: ' + error.message); }
+            category.items.splice(index, 1);
+            renderManagementItems();
+            queueMenuOp({ op: 'delete_item', id: item.id });
         }
         
+        // --- QUICK FIND ---
+        // The same prefix/trigram index and ranking as MenuSearchIndex on the server
+        // (GET /api/menu/search), rebuilt from menuData whenever the menu is rendered,
+        // so results show up as the waiter types without a round trip.
+        const SEARCH_FIELD_WEIGHTS = { name: 4, option: 2, category: 1.5, description: 1 };
+        let searchIndex = { entries: [], grams: new Map() };
+
+        function searchWords(text) {
+            return (text || '').normalize('NFKD').replace(/[\\u0300-\\u036f]/g, '').toLowerCase()
+                .match(/[\\p{L}\\p{N}_]+/gu) || [];
+        }
+
+        function searchGrams(word) {
+            const grams = new Set(['^' + word.slice(0, 1), '^' + word.slice(0, 2)]);
+            for (let i = 0; i + 3 <= word.length; i++) grams.add(word.slice(i, i + 3));
+            return grams;
+        }
+
+        function buildSearchIndex() {
+            const entries = [];
+            const grams = new Map();
+            menuData.forEach(category => {
+                const categoryWords = searchWords(category.name);
+                category.items.forEach(item => {
+                    const fields = [{ kind: 'name', words: searchWords(item.name), option: null }];
+                    (item.options || []).forEach(option => fields.push({ kind: 'option', words: searchWords(option.label), option }));
+                    fields.push({ kind: 'category', words: categoryWords, option: null });
+                    fields.push({ kind: 'description', words: searchWords(item.description), option: null });
+                    const keys = new Set();
+                    fields.forEach(field => field.words.forEach(word => searchGrams(word).forEach(key => keys.add(key))));
+                    keys.forEach(key => {
+                        if (!grams.has(key)) grams.set(key, []);
+                        grams.get(key).push(entries.length);
+                    });
+                    entries.push({ item: { ...item, category: category.name }, fields });
+                });
+            });
+            searchIndex = { entries, grams };
+        }
+
+        function searchCandidates(word) {
+            if (word.length < 3) return new Set(searchIndex.grams.get('^' + word) || []);
+            const postings = [];
+            for (let i = 0; i + 3 <= word.length; i++) postings.push(searchIndex.grams.get(word.slice(i, i + 3)) || []);
+            postings.sort((a, b) => a.length - b.length);
+            let candidates = new Set(postings[0]);
+            postings.slice(1).forEach(posting => {
+                const next = new Set(posting);
+                candidates = new Set([...candidates].filter(position => next.has(position)));
+            });
+            return candidates;
+        }
+
+        function searchMenu(query, limit = 20) {
+            const queryWords = searchWords(query);
+            if (queryWords.length === 0) return [];
+            let candidates = null;
+            for (const word of [...new Set(queryWords)].sort((a, b) => b.length - a.length)) {
+                const found = searchCandidates(word);
+                candidates = candidates === null ? found : new Set([...candidates].filter(position => found.has(position)));
+                if (candidates.size === 0) return [];
+            }
+
+            const phrase = queryWords.join(' ');
+            const results = [];
+            candidates.forEach(position => {
+                const { item, fields } = searchIndex.entries[position];
+                let score = 0, matchedOption = null;
+                for (const word of queryWords) {
+                    let best = 0, bestOption = null;
+                    for (const field of fields) {
+                        for (const candidate of field.words) {
+                            let quality;
+                            if (candidate === word) quality = 1;
+                            else if (candidate.startsWith(word)) quality = 0.8;
+                            else if (word.length >= 3 && candidate.includes(word)) quality = 0.4;
+                            else continue;
+                            if (quality * SEARCH_FIELD_WEIGHTS[field.kind] > best) {
+                                best = quality * SEARCH_FIELD_WEIGHTS[field.kind];
+                                bestOption = field.option;
+                            }
+                        }
+                    }
+                    if (!best) return;
+                    score += best;
+                    matchedOption = matchedOption || bestOption;
+                }
+                if (fields[0].words.join(' ').startsWith(phrase)) score += 2;
+                results.push({ score, position, item, option: matchedOption });
+            });
+            results.sort((a, b) => b.score - a.score || a.position - b.position);
+            return results.slice(0, limit);
+        }
+
+        function renderSearchResults(query) {
+            const container = document.getElementById('menu-search-results');
+            if (!query.trim()) {
+                container.classList.add('hidden');
+                container.innerHTML = '';
+                return;
+            }
+            const results = searchMenu(query, 12);
+            container.innerHTML = results.length ? '' : '<p class="p-3 text-sm text-blue-500">No matches</p>';
+            results.forEach(({ item, option }) => {
+                const button = document.createElement('button');
+                button.className = 'flex justify-between items-center w-full p-2 text-left hover:bg-blue-50 border-b border-blue-100 last:border-0';
+                const price = item.basePrice + (option ? option.priceAdjustment : 0);
+                button.innerHTML = `
+                    <div class="truncate">
+                        <h4 class="font-medium text-blue-800 text-sm truncate">${item.name}${option ? ` (${option.label})` : ''}</h4>
+                        <p class="text-xs text-blue-500 truncate">${item.category}${item.description ? ' · ' + item.description : ''}</p>
+                    </div>
+                    <span class="font-bold text-blue-700 text-sm ml-2">€${price.toFixed(2)}</span>
+                `;
+                button.onclick = () => pickSearchResult(item, option);
+                container.appendChild(button);
+            });
+            container.classList.remove('hidden');
+        }
+
+        function pickSearchResult(item, option) {
+            if (option) {
+                currentItemWithOptions = item;
+                selectOption(option);
+            } else {
+                handleItemClick(item);
+            }
+            document.getElementById('menu-search').value = '';
+            renderSearchResults('');
+        }
+
+        function handleSearchKey(event) {
+            if (event.key === 'Enter') {
+                const first = searchMenu(event.target.value, 1)[0];
+                if (first) pickSearchResult(first.item, first.option);
+            } else if (event.key === 'Escape') {
+                event.target.value = '';
+                renderSearchResults('');
+            }
+        }
+
         // --- DATA LOADING AND RENDERING ---
         
         async function loadAndRenderAll() {
+            const selected = document.querySelector('.category-btn.active');
             await loadMenuData();
             renderCategoryTabs();
             renderMenu();
+            reselectCategory(selected && selected.dataset.category);
             // Also re-render management views if they are open
             if(document.getElementById('management-modal').classList.contains('active')) {
                 renderManagementCategories();
@@ -922,40 +3109,45 @@ HTML_TEMPLATE = '''
         function renderMenu() {
             const menuContainer = document.getElementById('menu-items');
             menuContainer.innerHTML = '';
+            buildSearchIndex();
+            const searchInput = document.getElementById('menu-search');
+            if (searchInput && searchInput.value) renderSearchResults(searchInput.value);
 
-            menuData.forEach(category => {
-                const categoryDiv = document.createElement('div');
-                categoryDiv.className = 'category-content hidden';
-                categoryDiv.id = category.name;
-                
-                const itemsGrid = document.createElement('div');
-                itemsGrid.className = 'grid grid-cols-1 gap-1';
+            menuData.forEach(category => menuContainer.appendChild(renderCategoryContent(category)));
+        }
 
-                category.items.forEach(item => {
-                    const itemButton = document.createElement('button');
-                    itemButton.className = 'flex justify-between items-center p-2 bg-blue-50 hover:bg-blue-100 rounded-lg transition text-left w-full';
-                    const hasOptions = item.options && item.options.length > 0;
-                    itemButton.innerHTML = `
-                        <div class="flex items-center truncate">
-                            ${item.icon ? `<i class="${item.icon} mr-2 text-blue-500"></i>` : ''}
-                            <div class="truncate">
-                                <h4 class="font-medium text-blue-800 text-sm truncate">${item.name}</h4>
-                                <p class="text-xs text-blue-600 truncate">${item.description || ''}</p>
-                            </div>
-                        </div>
-                        <div class="flex items-center">
-                          <span class="font-bold text-blue-700 text-sm ml-2">€${item.basePrice.toFixed(2)}</span>
-                          ${hasOptions ? '<i class="fas fa-ellipsis-v ml-3 text-blue-400"></i>' : ''}
-                        </div>
-                    `;
-                    
-                    itemButton.onclick = () => handleItemClick(item);
-                    itemsGrid.appendChild(itemButton);
-                });
+        function renderCategoryContent(category) {
+            const categoryDiv = document.createElement('div');
+            categoryDiv.className = 'category-content hidden';
+            categoryDiv.id = category.name;
+            
+            const itemsGrid = document.createElement('div');
+            itemsGrid.className = 'grid grid-cols-1 gap-1';
 
-                categoryDiv.appendChild(itemsGrid);
-                menuContainer.appendChild(categoryDiv);
+            category.items.forEach(item => {
+                const itemButton = document.createElement('button');
+                itemButton.className = 'flex justify-between items-center p-2 bg-blue-50 hover:bg-blue-100 rounded-lg transition text-left w-full';
+                const hasOptions = item.options && item.options.length > 0;
+                itemButton.innerHTML = `
+                    <div class="flex items-center truncate">
+                        ${item.icon ? `<i class="${item.icon} mr-2 text-blue-500"></i>` : ''}
+                        <div class="truncate">
+                            <h4 class="font-medium text-blue-800 text-sm truncate">${item.name}</h4>
+                            <p class="text-xs text-blue-600 truncate">${item.description || ''}</p>
+                        </div>
+                    </div>
+                    <div class="flex items-center">
+                      <span class="font-bold text-blue-700 text-sm ml-2">€${item.basePrice.toFixed(2)}</span>
+                      ${hasOptions ? '<i class="fas fa-ellipsis-v ml-3 text-blue-400"></i>' : ''}
+                    </div>
+                `;
+                
+                itemButton.onclick = () => handleItemClick({ ...item, category: category.name });
+                itemsGrid.appendChild(itemButton);
             });
+
+            categoryDiv.appendChild(itemsGrid);
+            return categoryDiv;
         }
         
         function renderCategoryTabs() {
@@ -963,28 +3155,231 @@ HTML_TEMPLATE = '''
             container.innerHTML = '';
             menuData.forEach(category => {
                 const button = document.createElement('button');
+                button.dataset.category = category.name;
                 button.onclick = function() { selectCategory(category.name, this) };
                 button.className = `category-btn px-3 py-3 rounded-lg ${category.color} text-blue-800 font-medium whitespace-nowrap text-sm border-2 border-transparent`;
                 button.innerHTML = `<i class="fas fa-tag mr-2"></i>${category.name}`;
                 container.appendChild(button);
             });
         }
-        
-        // Load menu data from server
+
+        // Shows category `name` again after the tabs were re-rendered, or the first one if it is gone
+        function reselectCategory(name) {
+            const buttons = [...document.querySelectorAll('#category-tabs-container .category-btn')];
+            const button = buttons.find(candidate => candidate.dataset.category === name) || buttons[0];
+            if (button) selectCategory(button.dataset.category, button);
+        }
+        
+        // Load menu data from server. The last menu, its ETag and version are kept in
+        // localStorage so a reload only costs a 304 when nothing has changed, and
+        // otherwise just the changes since that version (/api/menu?since=).
+        const MENU_CACHE_KEY = 'beachMenuCache';
+        let menuEtag = null;
+        let menuVersion = null;
+
+        function storeCachedMenu() {
+            try {
+                localStorage.setItem(MENU_CACHE_KEY, JSON.stringify({ etag: menuEtag, version: menuVersion, data: menuData }));
+            } catch (e) { /* storage full or disabled */ }
+        }
+
+        function readCachedMenu() {
+            try {
+                const cached = JSON.parse(localStorage.getItem(MENU_CACHE_KEY));
+                if (cached && cached.etag && Array.isArray(cached.data)) return cached;
+            } catch (e) { /* ignore corrupt cache */ }
+            return null;
+        }
+
         async function loadMenuData() {
+            const cached = menuEtag ? { etag: menuEtag, version: menuVersion, data: menuData } : readCachedMenu();
             try {
-                const response = await fetch('/api/menu');
+                const headers = cached ? { 'If-None-Match': `"${cached.etag}"` } : {};
+                const since = cached && Number.isInteger(cached.version) ? `?since=${cached.version}` : '';
+                let response = await fetch(`/api/menu${since}`, { headers, cache: 'no-store' });
+                if (response.status === 304 && cached) {
+                    menuData = cached.data;
+                    menuEtag = cached.etag;
+                    menuVersion = Number(response.headers.get('X-Menu-Version') || cached.version);
+                    return;
+                }
                 if (!response.ok) throw new Error('Failed to load menu data');
-                menuData = await response.json();
+                let body = await response.json();
+                if (!Array.isArray(body)) {
+                    const patched = patchMenuData(JSON.parse(JSON.stringify(cached.data)), body);
+                    if (patched) {
+                        body = patched.data;
+                    } else {
+                        response = await fetch('/api/menu', { cache: 'no-store' });
+                        if (!response.ok) throw new Error('Failed to load menu data');
+                        body = await response.json();
+                    }
+                }
+                menuData = body;
+                menuEtag = (response.headers.get('ETag') || '').replace(/^W\\//, '').replace(/"/g, '') || null;
+                menuVersion = Number(response.headers.get('X-Menu-Version'));
+                storeCachedMenu();
             } catch (error) {
+                if (cached) {
+                    // Offline: keep working from the last menu we saw
+                    menuData = cached.data;
+                    menuEtag = cached.etag;
+                    menuVersion = cached.version === undefined ? null : cached.version;
+                    return;
+                }
                 console.error('Error loading menu:', error);
                 alert('Failed to load menu. Please try again.');
             }
         }
         
+        // --- LIVE MENU UPDATES ---
+        // /api/menu/stream pushes every menu change as a delta against the version
+        // before it. A delta that follows on from our version is patched into
+        // menuData and only the categories it touches are re-rendered; anything
+        // else (a missed version, or a change too big for a delta) refetches the menu.
+        // If the server has no stream to spare it answers 503; then we poll
+        // /api/menu?since= and ask for a stream again every MENU_POLL_MS.
+        const MENU_POLL_MS = 30000;
+        let menuStreamOpen = false;
+        let menuReload = null;
+        let menuVersionWaiters = [];
+
+        function reloadMenu() {
+            if (!menuReload) {
+                menuReload = loadAndRenderAll().finally(() => {
+                    menuReload = null;
+                    notifyMenuVersion();
+                });
+            }
+            return menuReload;
+        }
+
+        function notifyMenuVersion() {
+            menuVersionWaiters = menuVersionWaiters.filter(waiter => {
+                if (menuVersion === null || menuVersion < waiter.version) return true;
+                waiter.resolve(true);
+                return false;
+            });
+        }
+
+        // Resolves true once menuData is at `version` or later, false if the stream
+        // is down or has not brought it within `timeout` ms.
+        function waitForMenuVersion(version, timeout) {
+            if (menuVersion !== null && menuVersion >= version) return Promise.resolve(true);
+            if (!menuStreamOpen) return Promise.resolve(false);
+            return new Promise(resolve => {
+                const waiter = { version, resolve };
+                menuVersionWaiters.push(waiter);
+                setTimeout(() => {
+                    menuVersionWaiters = menuVersionWaiters.filter(other => other !== waiter);
+                    resolve(false);
+                }, timeout);
+            });
+        }
+
+        // Applies a delta to a menu list (changing it in place). Returns the new list and
+        // the names of the categories whose content changed, or null if the delta
+        // doesn't fit the list, in which case the whole menu has to be fetched.
+        function patchMenuData(data, delta) {
+            if (delta.reload) return null;
+            const byName = new Map(data.map(category => [category.name, category]));
+            const touched = new Set(delta.categories.map(category => category.name));
+            delta.removed.forEach(name => byName.delete(name));
+            delta.categories.forEach(category => byName.set(category.name, category));
+            for (const { category: name, ...item } of delta.items) {
+                const category = byName.get(name);
+                const index = category ? category.items.findIndex(existing => existing.id === item.id) : -1;
+                if (index < 0) return null;
+                category.items[index] = item;
+                touched.add(name);
+            }
+            if (!delta.order.every(([name]) => byName.has(name))) return null;
+            return {
+                data: delta.order.map(([name, order]) => Object.assign(byName.get(name), { order })),
+                touched,
+            };
+        }
+
+        function applyMenuDelta(delta) {
+            if (menuVersion !== null && delta.version <= menuVersion) return;
+            const tabs = () => JSON.stringify(menuData.map(category => [category.name, category.color]));
+            const tabsBefore = tabs();
+            const patched = delta.from === menuVersion ? patchMenuData(menuData, delta) : null;
+            if (!patched) {
+                reloadMenu();
+                return;
+            }
+            const { touched } = patched;
+            menuData = patched.data;
+            menuVersion = delta.version;
+            menuEtag = delta.etag;
+            storeCachedMenu();
+
+            const container = document.getElementById('menu-items');
+            delta.removed.forEach(name => {
+                const panel = document.getElementById(name);
+                if (panel && panel.classList.contains('category-content')) panel.remove();
+            });
+            touched.forEach(name => {
+                const panel = renderCategoryContent(menuData.find(category => category.name === name));
+                const current = document.getElementById(name);
+                if (current && current.classList.contains('category-content')) {
+                    panel.classList.toggle('hidden', current.classList.contains('hidden'));
+                    current.replaceWith(panel);
+                } else {
+                    container.appendChild(panel);
+                }
+            });
+            if (tabs() !== tabsBefore) {
+                const selected = document.querySelector('.category-btn.active');
+                renderCategoryTabs();
+                reselectCategory(selected && selected.dataset.category);
+            }
+
+            buildSearchIndex();
+            const searchInput = document.getElementById('menu-search');
+            if (searchInput && searchInput.value) renderSearchResults(searchInput.value);
+            if (document.getElementById('management-modal').classList.contains('active')) {
+                renderManagementCategories();
+                renderManagementItems();
+            }
+            notifyMenuVersion();
+        }
+
+        async function pollMenu() {
+            if (menuVersion === null) return reloadMenu();
+            try {
+                const headers = menuEtag ? { 'If-None-Match': `"${menuEtag}"` } : {};
+                const response = await fetch(`/api/menu?since=${menuVersion}`, { headers, cache: 'no-store' });
+                if (!response.ok) return;  // includes 304: nothing changed
+                const body = await response.json();
+                if (Array.isArray(body)) reloadMenu();
+                else applyMenuDelta(body);
+            } catch (error) { /* offline: try again next time */ }
+        }
+
+        function connectMenuStream() {
+            if (!window.EventSource) return;
+            // On reconnect the browser sends Last-Event-ID, which the server prefers over ?since
+            const stream = new EventSource(menuVersion === null ? '/api/menu/stream' : `/api/menu/stream?since=${menuVersion}`);
+            stream.onopen = () => { menuStreamOpen = true; };
+            stream.onerror = () => {
+                menuStreamOpen = false;
+                // CLOSED means the browser won't retry by itself (e.g. a 503)
+                if (stream.readyState === EventSource.CLOSED) {
+                    setTimeout(() => pollMenu().finally(connectMenuStream), MENU_POLL_MS);
+                }
+            };
+            stream.addEventListener('menu', event => applyMenuDelta(JSON.parse(event.data)));
+            stream.addEventListener('reload', event => {
+                if (JSON.parse(event.data).version !== menuVersion) reloadMenu();
+            });
+        }
+        
         // Initialize
         window.onload = async function() {
             await loadMenuData();
+            connectMenuStream();
             
             generateSeatMap('A');
             document.querySelector('[data-row="A"]').classList.add('bg-blue-100', 'font-medium');
@@ -1136,6 +3531,11 @@ HTML_TEMPLATE = '''
                 </div>
                 <div class="bg-white rounded-xl shadow-md p-4 border border-blue-200">
                     <h2 class="text-lg font-semibold text-blue-800 mb-3 flex items-center"><i class="fas fa-concierge-bell text-blue-500 mr-2"></i>Menu</h2>
+                    <div class="relative mb-3">
+                        <i class="fas fa-magnifying-glass absolute left-3 top-3 text-blue-400 text-sm"></i>
+                        <input id="menu-search" type="search" autocomplete="off" placeholder="Quick find (e.g. no3 juice)" oninput="renderSearchResults(this.value)" onkeydown="handleSearchKey(event)" class="w-full pl-9 pr-3 py-2 border border-blue-200 rounded-lg text-sm focus:outline-none focus:ring-2 focus:ring-blue-300">
+                        <div id="menu-search-results" class="hidden absolute z-30 left-0 right-0 mt-1 bg-white border border-blue-200 rounded-lg shadow-lg max-h-80 overflow-y-auto"></div>
+                    </div>
                     <div id="category-tabs-container" class="mb-4 flex flex-wrap gap-2"></div>
                     <div id="menu-items" class="mb-4 max-h-[60vh] overflow-y-auto pr-1"></div>
                 </div>
@@ -1169,229 +3569,996 @@ HTML_TEMPLATE = '''
 </html>
 '''
 
+# Built by build_assets.py; without it the page falls back to the Tailwind/Font Awesome CDNs
+ASSET_MANIFEST = Path(app.static_folder) / 'dist' / 'manifest.json'
+# The built files and the /assets/ bundles have a content hash in their names, so
+# they can be cached for a year; the rest of /static keeps Flask's default.
+ASSET_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+@app.after_request
+def cache_hashed_assets(response):
+    filename = (request.view_args or {}).get('filename', '')
+    if (request.endpoint == 'static' and response.status_code in (200, 304)
+            and filename.startswith('dist/') and filename != 'dist/manifest.json'):
+        response.headers['Cache-Control'] = ASSET_CACHE_CONTROL
+    return response
+
+
+def load_asset_manifest():
+    """Returns the logical -> hashed static file mapping, or None if the assets are not built."""
+    try:
+        with open(ASSET_MANIFEST, mode='r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
 def encode_escpos(text):
     # Standard ESC/POS euro sign for code page 858
     return text.replace("€", "\xD5").encode('cp858', errors='replace')
 
+# --- POS shell ---
+# HTML_TEMPLATE has no per-request variables, so it is rendered once per process.
+# Its inline <style> and <script> blocks are split out into content-addressed
+# bundles under /assets/ that browsers can cache indefinitely; the remaining HTML
+# is served with an ETag/Last-Modified so a reload costs a 304.
+_shell_cache = {'html': None, 'etag': None, 'last_modified': None, 'bundles': {}}
+_shell_lock = threading.Lock()
+_INLINE_BLOCK_RE = {
+    'css': re.compile(r'<style>(.*?)</style>', re.S),
+    'js': re.compile(r'<script>(.*?)</script>', re.S),
+}
+_BUNDLE_MIMETYPES = {'css': 'text/css', 'js': 'application/javascript'}
+
+
+def _split_inline_bundle(html, kind):
+    """Moves every inline block of one kind into a single hashed bundle and links it."""
+    match = _INLINE_BLOCK_RE[kind]
+    sources = match.findall(html)
+    if not sources:
+        return html
+    body = '\n'.join(sources).encode('utf-8')
+    name = f"pos.{hashlib.sha256(body).hexdigest()[:12]}.{kind}"
+    _shell_cache['bundles'][name] = body
+    if kind == 'css':
+        tag = f'<link rel="stylesheet" href="/assets/{name}">'
+    else:
+        tag = f'<script src="/assets/{name}" defer></script>'
+    # The first block becomes the link, any later ones are dropped
+    first = match.search(html)
+    return html[:first.start()] + tag + match.sub('', html[first.end():])
+
+
+def get_pos_shell():
+    """Renders and splits the POS page on first use; later calls return the cached result."""
+    with _shell_lock:
+        if _shell_cache['html'] is None:
+            html = render_template_string(HTML_TEMPLATE, assets=load_asset_manifest())
+            for kind in ('css', 'js'):
+                html = _split_inline_bundle(html, kind)
+            body = html.encode('utf-8')
+            _shell_cache['html'] = body
+            _shell_cache['etag'] = hashlib.sha256(body).hexdigest()[:32]
+            _shell_cache['last_modified'] = datetime.fromtimestamp(os.path.getmtime(__file__)).astimezone()
+        return _shell_cache
+
+
 @app.route('/')
 def index():
-    return render_template_string(HTML_TEMPLATE)
+    shell = get_pos_shell()
+    response = app.response_class(shell['html'], mimetype='text/html')
+    response.set_etag(shell['etag'])
+    response.last_modified = shell['last_modified']
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+@app.route('/assets/<name>')
+def pos_bundle(name):
+    body = get_pos_shell()['bundles'].get(name)
+    if body is None:
+        return jsonify({'status': 'error', 'message': 'Asset not found'}), 404
+    response = app.response_class(body, mimetype=_BUNDLE_MIMETYPES[name.rsplit('.', 1)[-1]])
+    response.headers['Cache-Control'] = ASSET_CACHE_CONTROL
+    return response
 
 @app.route('/api/menu', methods=['GET'])
 def api_get_menu():
-    return jsonify(get_menu_data())
+    """
+    The whole menu as a list of categories. With ?since=<version> a client holding
+    that version gets a merged delta object instead (see merge_menu_deltas()) when the
+    changelog still covers it; either way the ETag is that of the resulting menu.
+    """
+    snapshot = get_menu_snapshot()
+    since = request.args.get('since', '')
+    body = snapshot.json
+    if since.isdigit() and int(since) != snapshot.version:
+        chain = menu_changes_since(int(since))
+        delta = merge_menu_deltas(chain) if chain else None
+        if delta is not None and delta['version'] == snapshot.version:
+            body = json.dumps(delta, ensure_ascii=False, separators=(',', ':'))
+    response = app.response_class(body, mimetype='application/json')
+    response.set_etag(snapshot.etag)
+    response.headers['X-Menu-Version'] = str(snapshot.version)
+    # Let clients keep a copy but always revalidate it; a match costs only a 304
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+@app.route('/api/menu/stream', methods=['GET'])
+def api_menu_stream():
+    since = request.headers.get('Last-Event-ID') or request.args.get('since')
+    version = int(since) if since and since.isdigit() else get_menu_version()
+    with _menu_streams_lock:
+        if _menu_streams['open'] >= MENU_STREAM_MAX:
+            response = jsonify({'status': 'error',
+                                'message': 'Too many live menu streams; poll /api/menu?since= instead'})
+            response.status_code = 503
+            response.headers['Retry-After'] = str(MENU_STREAM_REFUSED_RETRY)
+            return response
+        _menu_streams['open'] += 1
+    released = []
+
+    def release():
+        # call_on_close runs even if the body was never iterated
+        with _menu_streams_lock:
+            if not released:
+                released.append(True)
+                _menu_streams['open'] -= 1
+
+    def events(version):
+        yield f"retry: {MENU_STREAM_RETRY_MS}\n\n"
+        deadline = time.monotonic() + MENU_STREAM_LIFETIME
+        while time.monotonic() < deadline:
+            deltas = wait_for_menu_events(version, MENU_STREAM_KEEPALIVE)
+            if deltas is None:
+                version = get_menu_version()
+                deltas = [{'version': version, 'reload': True}]
+            elif not deltas:
+                yield ": keep-alive\n\n"
+                continue
+            for delta in deltas:
+                version = delta['version']
+                data = json.dumps(delta, ensure_ascii=False, separators=(',', ':'))
+                yield f"id: {version}\nevent: {'reload' if delta.get('reload') else 'menu'}\ndata: {data}\n\n"
+
+    response = app.response_class(events(version), mimetype='text/event-stream')
+    response.call_on_close(release)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # don't let a reverse proxy hold events back
+    return response
+
+@app.route('/api/menu/cache', methods=['GET'])
+def api_menu_cache_stats():
+    return jsonify(get_menu_cache_stats())
+
+@app.errorhandler(MenuVersionConflict)
+def menu_version_conflict(e):
+    response = jsonify({'status': 'error', 'message': 'The menu was changed by someone else; reload and try again',
+                        'version': e.version})
+    response.set_etag(e.etag)
+    return response, 409
+
+@app.errorhandler(MenuEditError)
+def menu_edit_error(e):
+    return jsonify({'status': 'error', 'message': e.message}), e.status
+
+def menu_preconditions(data=None):
+    """The optimistic-concurrency arguments for locked_menu() from If-Match / expected_version."""
+    return {
+        'expected_version': (data or {}).get('expected_version'),
+        'if_match': request.if_match if 'If-Match' in request.headers else None,
+    }
+
+def menu_saved(version, **fields):
+    """The success response for a menu write, carrying the new version and ETag."""
+    response = jsonify({'status': 'success', 'version': version, **fields})
+    response.set_etag(get_menu_json()[1])
+    return response
+
+def apply_menu_change(data, op):
+    """Runs one menu operation for a single-change endpoint and commits it."""
+    with locked_menu(**menu_preconditions(data)) as menu_data:
+        result = apply_menu_operation(menu_data, dict(data or {}, op=op))
+        return menu_saved(save_menu_data(menu_data), **result)
 
 @app.route('/api/menu/category', methods=['POST'])
 def api_add_category():
-    data = request.json
-    name = data.get('name')
-    color = data.get('color')
-    if not name or not color:
-        return jsonify({'status': 'error', 'message': 'Name and color are required'}), 400
-    
-    menu_data = get_menu_data()
-    if any(c['name'] == name for c in menu_data):
-        return jsonify({'status': 'error', 'message': 'Category already exists'}), 400
-    
-    menu_data.append({'name': name, 'color': color, 'items': []})
-    save_menu_data(menu_data)
-    return jsonify({'status': 'success'})
+    return apply_menu_change(request.json, 'add_category')
 
 @app.route('/api/menu/category/<name>', methods=['PUT'])
 def api_update_category(name):
-    data = request.json
-    new_name = data.get('new_name')
-    color = data.get('color')
-    menu_data = get_menu_data()
-    
-    cat_to_update = next((c for c in menu_data if c['name'] == name), None)
-    if not cat_to_update:
-        return jsonify({'status': 'error', 'message': 'Category not found'}), 404
-        
-    if new_name and new_name != name and any(c['name'] == new_name for c in menu_data):
-        return jsonify({'status': 'error', 'message': 'New category name already exists'}), 400
-    
-    if new_name:
-        cat_to_update['name'] = new_name
-    if color:
-        cat_to_update['color'] = color
-
-    save_menu_data(menu_data)
-    return jsonify({'status': 'success'})
+    return apply_menu_change(dict(request.json, name=name), 'update_category')
 
 @app.route('/api/menu/category/<name>', methods=['DELETE'])
 def api_delete_category(name):
-    menu_data = get_menu_data()
-    
-    initial_len = len(menu_data)
-    menu_data = [c for c in menu_data if c['name'] != name]
-    
-    if len(menu_data) == initial_len:
-        return jsonify({'status': 'error', 'message': 'Category not found'}), 404
-        
-    save_menu_data(menu_data)
-    return jsonify({'status': 'success'})
+    return apply_menu_change(dict(request.get_json(silent=True) or {}, name=name), 'delete_category')
 
 @app.route('/api/menu/category/reorder', methods=['POST'])
 def api_reorder_category():
-    data = request.json
-    name = data.get('name')
-    direction = data.get('direction')
-    
-    menu_data = get_menu_data()
-    
-    try:
-        index = next(i for i, c in enumerate(menu_data) if c['name'] == name)
-    except StopIteration:
-        return jsonify({'status': 'error', 'message': 'Category not found'}), 404
-
-    if direction == 'up' and index > 0:
-        menu_data.insert(index - 1, menu_data.pop(index))
-    elif direction == 'down' and index < len(menu_data) - 1:
-        menu_data.insert(index + 1, menu_data.pop(index))
-    else:
-        return jsonify({'status': 'error', 'message': 'Invalid move'}), 400
-
-    save_menu_data(menu_data)
-    return jsonify({'status': 'success'})
+    return apply_menu_change(request.json, 'reorder_category')
 
 @app.route('/api/menu/item', methods=['POST'])
 def api_add_item():
-    data = request.json
-    category_name = data.get('category')
-    menu_data = get_menu_data()
-    
-    category = next((c for c in menu_data if c['name'] == category_name), None)
-    if not category:
-        return jsonify({'status': 'error', 'message': 'Category not found'}), 404
-    
-    new_item = {
-        'name': data.get('name'),
-        'description': data.get('description'),
-        'basePrice': data.get('price'),
-        'icon': data.get('icon'),
-        'options': data.get('options', [])
-    }
-    category['items'].append(new_item)
-    save_menu_data(menu_data)
-    return jsonify({'status': 'success'})
+    return apply_menu_change(request.json, 'add_item')
 
+@app.route('/api/menu/item/<item_id>', methods=['GET'])
+def api_get_item(item_id):
+    item = get_menu_item(item_id)
+    if item is None:
+        return jsonify({'status': 'error', 'message': 'Item not found'}), 404
+    return jsonify(item)
+
+@app.route('/api/menu/search', methods=['GET'])
+def api_menu_search():
+    menu = get_menu_snapshot()
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    results = []
+    for score, item, option in menu.search.search(request.args.get('q', ''), limit):
+        results.append({
+            'id': item.id, 'name': item.name, 'category': item.category, 'description': item.description,
+            'basePrice': item.base_price, 'price': item.display_price, 'score': round(score, 2),
+            'option': option and {'id': option.id, 'label': option.label, 'price': option.display_price},
+        })
+    return jsonify({'query': request.args.get('q', ''), 'version': menu.version, 'results': results})
+
+@app.route('/api/menu/item/<item_id>', methods=['PUT'])
+def api_update_item_by_id(item_id):
+    return apply_menu_change(dict(request.json, id=item_id), 'update_item')
+
+@app.route('/api/menu/item/<item_id>', methods=['DELETE'])
+def api_delete_item_by_id(item_id):
+    return apply_menu_change(dict(request.get_json(silent=True) or {}, id=item_id), 'delete_item')
+
+# Compatibility: the pre-id API addresses items by category name and list index
+# (or by 'id' in the body)
 @app.route('/api/menu/item', methods=['PUT'])
 def api_update_item():
-    data = request.json
-    category_name = data.get('category')
-    index = data.get('index')
-    menu_data = get_menu_data()
-    
-    category = next((c for c in menu_data if c['name'] == category_name), None)
-    if not category or not isinstance(index, int):
-        return jsonify({'status': 'error', 'message': 'Invalid category or item index'}), 400
-    
-    items = category['items']
-    if index < 0 or index >= len(items):
-        return jsonify({'status': 'error', 'message': 'Item index out of bounds'}), 400
-    
-    items[index] = {
-        'name': data.get('name'),
-        'description': data.get('description'),
-        'basePrice': data.get('price'),
-        'icon': data.get('icon'),
-        'options': data.get('options', [])
-    }
-    save_menu_data(menu_data)
-    return jsonify({'status': 'success'})
+    return apply_menu_change(request.json, 'update_item')
 
 @app.route('/api/menu/item', methods=['DELETE'])
 def api_delete_item():
-    data = request.json
-    category_name = data.get('category')
-    index = data.get('index')
-    menu_data = get_menu_data()
-    
-    category = next((c for c in menu_data if c['name'] == category_name), None)
-    if not category or not isinstance(index, int):
-        return jsonify({'status': 'error', 'message': 'Invalid category or item index'}), 400
-    
-    items = category['items']
-    if index < 0 or index >= len(items):
-        return jsonify({'status': 'error', 'message': 'Item index out of bounds'}), 400
-    
-    del items[index]
-    save_menu_data(menu_data)
-    return jsonify({'status': 'success'})
+    return apply_menu_change(request.json, 'delete_item')
 
-@app.route('/print', methods=['POST'])
-def print_receipt():
-    try:
-        order_data = request.json
-        seat = order_data['seat']
-        pay_by_card = order_data.get('payByCard', False)
-
-        log_order_to_csv(order_data)
-
-        ESC = b'\x1B'
-        RESET = ESC + b'!\x00'
-        BOLD_LARGE = ESC + b'!\x38'
-        BOLD = ESC + b'!\x08'
-        SMALL = ESC + b'!\x01' # Using small font for descriptions
-        SET_CP_858 = ESC + b'\x74\x13' # Code Page 858 for euro symbol
-
-        pure_text = "PURE"
-        spacing = 32 - len(pure_text) - len(seat)
-
-        receipt_lines = [
-            SET_CP_858,
-            encode_escpos(pure_text + ' ' * spacing),
-            BOLD_LARGE + encode_escpos(seat) + RESET,
-            encode_escpos("\n" + "="*32),
-            encode_escpos(f"\nTime: {datetime.now().strftime('%d-%m-%Y %H:%M:%S')}"),
-            encode_escpos("\n\nITEMS:\n------")
-        ]
-
-        for item in order_data['items']:
-            qty = item.get('quantity', 1)
-            line = f"\n{qty}x {item['name']}"
-            
-            if item.get('customText'):
-                line += f" [{item['customText']}]"
-            
-            price_str = f"EUR{item['price'] * qty:.2f}"
-            line_spacing = 32 - len(line) - len(price_str)
-            line += ' ' * line_spacing + price_str
+@app.route('/api/menu/export', methods=['GET'])
+def api_menu_export():
+    fmt = request.args.get('format', 'csv')
+    if fmt not in MENU_EXPORT_FORMATS:
+        return jsonify({'status': 'error', 'message': f'Unknown format: {fmt}'}), 400
+    response = app.response_class(iter_menu_export(fmt), mimetype=MENU_EXPORT_FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename=menu.{fmt}'
+    return response
 
-            receipt_lines.append(encode_escpos(line))
+@app.route('/api/menu/import', methods=['POST'])
+def api_menu_import():
+    """Replaces the menu with the request body, e.g. POST /api/menu/import?format=jsonl&expected_version=7."""
+    fmt = request.args.get('format', 'csv')
+    if fmt not in MENU_EXPORT_FORMATS:
+        return jsonify({'status': 'error', 'message': f'Unknown format: {fmt}'}), 400
+    stream = io.TextIOWrapper(request.stream, encoding='utf-8-sig', newline='' if fmt == 'csv' else None)
+    result = import_menu(iter_menu_import(stream, fmt), **menu_preconditions(request.args))
+    return menu_saved(result.pop('version'), **result)
 
-        payment_text = "CARD" if pay_by_card else "CASH"
-        total_str = f"TOTAL: EUR{order_data['total']:.2f}"
-        
-        receipt_lines.extend([
-            encode_escpos("\n\n" + "-"*32),
-            BOLD + encode_escpos("\n" + ' ' * (32 - len(total_str)) + total_str) + RESET,
-            encode_escpos(f"\n\nPAYMENT: {payment_text}"),
-        ])
+@app.route('/api/menu/batch', methods=['POST'])
+def api_menu_batch():
+    """
+    Applies an ordered list of operations, e.g.
+      {"operations": [{"op": "add_category", "name": "Wines", "color": "bg-red-100"},
+                      {"op": "add_item", "category": "Wines", "name": "Retsina", "price": 4.5},
+                      {"op": "reorder_category", "name": "Wines", "direction": "up"}],
+       "expected_version": 12}
+    All of them are validated and applied in memory first; the menu is written once,
+    or not at all if any operation fails.
+    """
+    data = request.json or {}
+    operations = data.get('operations')
+    if not isinstance(operations, list) or not operations:
+        return jsonify({'status': 'error', 'message': 'operations must be a non-empty list'}), 400
+    if len(operations) > MENU_BATCH_MAX_OPERATIONS:
+        return jsonify({'status': 'error',
+                        'message': f'At most {MENU_BATCH_MAX_OPERATIONS} operations per batch'}), 400
+
+    with locked_menu(**menu_preconditions(data)) as menu_data:
+        results = []
+        for number, op in enumerate(operations):
+            try:
+                if not isinstance(op, dict):
+                    raise MenuEditError('Operation must be an object')
+                results.append(apply_menu_operation(menu_data, op))
+            except MenuEditError as e:
+                return jsonify({'status': 'error', 'message': e.message, 'operation': number}), e.status
+        return menu_saved(save_menu_data(menu_data), results=results)
+
+def build_receipt(order_data, items=None, station=None):
+    """
+    Renders an order as the ESC/POS byte stream sent to the printer. When the order is
+    split across stations, `items` is that station's share and `station` is printed
+    under the header; the order total and payment are printed on every ticket.
+    """
+    seat = order_data['seat']
+    pay_by_card = order_data.get('payByCard', False)
+
+    ESC = b'\x1B'
+    RESET = ESC + b'!\x00'
+    BOLD_LARGE = ESC + b'!\x38'
+    BOLD = ESC + b'!\x08'
+    SMALL = ESC + b'!\x01' # Using small font for descriptions
+    SET_CP_858 = ESC + b'\x74\x13' # Code Page 858 for euro symbol
+
+    pure_text = "PURE"
+    spacing = 32 - len(pure_text) - len(seat)
+
+    receipt_lines = [
+        SET_CP_858,
+        encode_escpos(pure_text + ' ' * spacing),
+        BOLD_LARGE + encode_escpos(seat) + RESET,
+        encode_escpos("\n" + "="*32),
+        encode_escpos(f"\nTime: {datetime.now().strftime('%d-%m-%Y %H:%M:%S')}"),
+    ]
+    if station:
+        receipt_lines.append(BOLD + encode_escpos(f"\n{station.upper()} TICKET") + RESET)
+    receipt_lines.append(encode_escpos("\n\nITEMS:\n------"))
+
+    for item in (order_data['items'] if items is None else items):
+        qty = item.get('quantity', 1)
+        line = f"\n{qty}x {item['name']}"
+
+        if item.get('customText'):
+            line += f" [{item['customText']}]"
+
+        price_str = f"EUR{item['price'] * qty:.2f}"
+        line_spacing = 32 - len(line) - len(price_str)
+        line += ' ' * line_spacing + price_str
+
+        receipt_lines.append(encode_escpos(line))
+
+    payment_text = "CARD" if pay_by_card else "CASH"
+    total_str = f"TOTAL: EUR{order_data['total']:.2f}"
+
+    receipt_lines.extend([
+        encode_escpos("\n\n" + "-"*32),
+        BOLD + encode_escpos("\n" + ' ' * (32 - len(total_str)) + total_str) + RESET,
+        encode_escpos(f"\n\nPAYMENT: {payment_text}"),
+    ])
+
+    if order_data.get('notes'):
+        receipt_lines.append(encode_escpos(f"\n\nNotes: {order_data.get('notes')}"))
 
-        if order_data.get('notes'):
-            receipt_lines.append(encode_escpos(f"\n\nNotes: {order_data.get('notes')}"))
+    receipt_lines.extend([
+        encode_escpos("\n" + "="*32),
+        encode_escpos("\nThank you!\n")
+    ])
 
-        receipt_lines.extend([
-            encode_escpos("\n" + "="*32),
-            encode_escpos("\nThank you!\n")
-        ])
+    return b"".join(receipt_lines) + (LINE_FEED * 3) + CUT_PAPER
 
-        data = b"".join(receipt_lines) + (LINE_FEED * 3) + CUT_PAPER
 
+def send_to_printer(data, host=None, port=None):
+    """
+    Sends raw ESC/POS bytes to a network printer. Raises OSError on failure.
+    sendall() returning only means the bytes reached our socket buffer, so after it
+    the connection is watched for up to PRINTER_DRAIN_TIMEOUT: a reset in that time
+    raises, while a printer that closes cleanly or keeps the socket open has the
+    ticket. With PRINTER_STATUS_CHECK the paper sensor is queried first and an empty
+    roll raises before anything is sent; no answer means the status is unknown.
+    """
+    host = host or PRINTER_IP
+    port = port or PRINTER_PORT
+    try:
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.settimeout(5)
-            s.connect((PRINTER_IP, PRINTER_PORT))
+            s.settimeout(PRINTER_TIMEOUT)
+            s.connect((host, port))
+            if PRINTER_STATUS_CHECK:
+                s.sendall(PAPER_STATUS)
+                s.settimeout(PRINTER_STATUS_TIMEOUT)
+                try:
+                    status = s.recv(1)
+                except socket.timeout:
+                    status = None  # a printer that doesn't answer DLE EOT
+                if status == b'':
+                    raise OSError(f'Printer ({host}) closed the connection.')
+                if status and status[0] & PAPER_END:
+                    raise OSError(f'Printer ({host}) is out of paper.')
+                s.settimeout(PRINTER_TIMEOUT)
             s.sendall(data)
+            s.shutdown(socket.SHUT_WR)
+            deadline = time.monotonic() + PRINTER_DRAIN_TIMEOUT
+            try:
+                while time.monotonic() < deadline:
+                    s.settimeout(max(deadline - time.monotonic(), 0.001))
+                    if not s.recv(1024):
+                        break  # closed cleanly
+            except socket.timeout:
+                pass  # still open: many printers keep the connection until we close it
+    except socket.timeout:
+        raise OSError(f'Connection to printer ({host}) timed out.')
 
-        return jsonify({'status': 'success'})
 
-    except socket.timeout:
-        return jsonify({'status': 'error', 'message': f'Connection to printer ({PRINTER_IP}) timed out.'}), 500
+# --- Printer routing ---
+# Stations (bar, kitchen, ...) map to printers, and menu categories map to stations.
+# The registry is read from PRINTER_CONFIG_FILE when present, e.g.
+#   {"printers": {"bar": {"host": "192.168.2.218"}, "kitchen": {"host": "192.168.2.219"}},
+#    "routes": {"Coffees": "bar", "Cocktails": "bar", "Beers": "bar",
+#               "Snacks": "kitchen", "Salads": "kitchen", "Baguets": "kitchen"},
+#    "default": "bar"}
+# Without it every order prints as one receipt on PRINTER_IP, as before.
+PRINTER_CONFIG_FILE = 'printers.json'
+_printer_config = {}
+
+
+def get_printer_config():
+    """Returns the printer registry, loading PRINTER_CONFIG_FILE once per process."""
+    if not _printer_config:
+        config = {'printers': {'main': {'host': PRINTER_IP, 'port': PRINTER_PORT}},
+                  'routes': {}, 'default': 'main'}
+        if os.path.exists(PRINTER_CONFIG_FILE):
+            with open(PRINTER_CONFIG_FILE, mode='r', encoding='utf-8') as f:
+                config.update(json.load(f))
+        for printer in config['printers'].values():
+            printer.setdefault('port', PRINTER_PORT)
+        if config['default'] not in config['printers']:
+            config['default'] = next(iter(config['printers']))
+        _printer_config.update(config)
+    return _printer_config
+
+
+def _item_category(item, menu):
+    """The menu category of an order line: as sent by the tablet, else looked up by name."""
+    if item.get('category'):
+        return item['category']
+    name = item.get('name', '')
+    if name not in menu.items_by_name and name.endswith(')') and ' (' in name:
+        name = name[:name.rindex(' (')]  # "Frappe (Sweet)" -> "Frappe"
+    menu_item = menu.items_by_name.get(name)
+    return menu_item.category if menu_item else None
+
+
+def route_order(order_data, menu=None):
+    """Splits an order's items into {station: items}, preserving their order."""
+    config = get_printer_config()
+    if len(config['printers']) == 1:
+        return {config['default']: order_data['items']}
+
+    if menu is None and not all(item.get('category') for item in order_data['items']):
+        menu = get_menu_snapshot()
+
+    tickets = OrderedDict()
+    for item in order_data['items']:
+        station = config['routes'].get(_item_category(item, menu), config['default'])
+        if station not in config['printers']:
+            station = config['default']
+        tickets.setdefault(station, []).append(item)
+    return tickets
+
+
+def build_order_tickets(order_data, menu=None):
+    """Renders one ticket per station for an order without queueing it: [(station, printer, data), ...]."""
+    config = get_printer_config()
+    tickets = route_order(order_data, menu)
+    split = len(tickets) > 1
+    return [(station, config['printers'][station], build_receipt(order_data, items, station if split else None))
+            for station, items in tickets.items()]
+
+
+def enqueue_order_tickets(order_data, menu=None, tickets=None):
+    """
+    Queues one ticket per station for an order; returns [{'station', 'job_id'}, ...].
+    `tickets` are the ones build_order_tickets() rendered, if the caller already has them.
+    """
+    if tickets is None:
+        tickets = build_order_tickets(order_data, menu)
+    jobs = []
+    for station, printer, data in tickets:
+        job_id = enqueue_print_job(data, seat=order_data['seat'], host=printer['host'],
+                                   port=printer['port'], station=station)
+        jobs.append({'station': station, 'job_id': job_id})
+    return jobs
+
+
+# --- Print queue ---
+# /print only logs the order and enqueues the tickets; each printer has its own
+# worker thread that owns its socket, so tickets for different printers go out in
+# parallel while tickets for the same printer stay in order. Pending jobs are kept as JSON files under PRINT_QUEUE_DIR so
+# they survive a restart, and failed sends are retried with exponential backoff.
+# Any worker process may queue a job by writing its file, but only one process
+# drains the queue: the one holding PRINT_QUEUE_LOCK_FILE, which picks up files
+# written by the others every PRINT_QUEUE_POLL seconds. If it exits, the next
+# process to queue a job takes over. Finished jobs are moved to PRINT_FINISHED_DIR
+# so every process can answer the status endpoint.
+PRINT_QUEUE_DIR = Path("print_queue")
+PRINT_QUEUE_LOCK_FILE = PRINT_QUEUE_DIR / ".lock"
+PRINT_FINISHED_DIR = PRINT_QUEUE_DIR / "finished"
+PRINT_QUEUE_POLL = 0.5  # seconds
+PRINT_MAX_ATTEMPTS = 8
+PRINT_RETRY_BASE = 1.0   # seconds before the first retry, doubled per attempt
+PRINT_RETRY_MAX = 60.0
+PRINT_JOB_HISTORY = 500  # finished jobs kept for the status endpoint
+
+_print_jobs = {}
+_print_cond = threading.Condition()
+_print_workers = {}  # (host, port) -> worker thread
+_print_state = {'lock_file': None, 'scanned': 0, 'finished_files': None}
+
+
+def _public_job(job):
+    """The job fields reported to clients (everything except the payload)."""
+    return {k: v for k, v in job.items() if k != 'payload'}
+
+
+def _write_json_file(path, record):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_file = path.with_suffix(f'.{os.getpid()}.tmp')
+    with open(temp_file, mode='w', encoding='utf-8') as f:
+        json.dump(record, f)
+    os.replace(temp_file, path)
+
+
+def _persist_print_job(job):
+    _write_json_file(PRINT_QUEUE_DIR / f"{job['id']}.json",
+                     dict(job, payload=base64.b64encode(job['payload']).decode('ascii')))
+
+
+def _forget_print_job(job):
+    """
+    Moves a finished job's file to PRINT_FINISHED_DIR and trims the history in memory
+    and on disk. Caller holds _print_cond.
+    """
+    _write_json_file(PRINT_FINISHED_DIR / f"{job['id']}.json", _public_job(job))
+    try:
+        (PRINT_QUEUE_DIR / f"{job['id']}.json").unlink()
+    except FileNotFoundError:
+        pass
+    finished = [j for j in _print_jobs.values() if j['status'] in ('done', 'failed')]
+    for old in sorted(finished, key=lambda j: j['updated'])[:-PRINT_JOB_HISTORY]:
+        del _print_jobs[old['id']]
+
+    if _print_state['finished_files'] is None:
+        _print_state['finished_files'] = len(os.listdir(PRINT_FINISHED_DIR))
+    _print_state['finished_files'] += 1
+    if _print_state['finished_files'] > 2 * PRINT_JOB_HISTORY:
+        files = sorted(PRINT_FINISHED_DIR.glob('*.json'), key=lambda path: path.stat().st_mtime)
+        for path in files[:-PRINT_JOB_HISTORY]:
+            path.unlink()
+        _print_state['finished_files'] = min(len(files), PRINT_JOB_HISTORY)
+
+
+def _scan_print_queue():
+    """
+    Loads the job files this process doesn't know yet: the ones left pending when the
+    last owner stopped and the ones other processes queued. Caller holds _print_cond.
+    """
+    _print_state['scanned'] = time.time()
+    if not PRINT_QUEUE_DIR.exists():
+        return
+    for job_file in sorted(PRINT_QUEUE_DIR.glob('*.json')):
+        if job_file.stem in _print_jobs:
+            continue
+        try:
+            with open(job_file, mode='r', encoding='utf-8') as f:
+                record = json.load(f)
+            record['payload'] = base64.b64decode(record['payload'])
+        except FileNotFoundError:
+            continue  # finished in the meantime
+        except (ValueError, KeyError) as e:
+            print(f"Warning: Skipping unreadable print job {job_file}: {e}")
+            continue
+        record.setdefault('station', None)
+        record.update(status='queued', next_attempt=0)
+        _print_jobs[record['id']] = record
+        _ensure_printer_worker(record['host'], record['port'])
+
+
+def _read_print_job_file(job_id):
+    """The public view of a job from its file, finished or pending, or None."""
+    for job_file in (PRINT_FINISHED_DIR / f"{job_id}.json", PRINT_QUEUE_DIR / f"{job_id}.json"):
+        try:
+            with open(job_file, mode='r', encoding='utf-8') as f:
+                return _public_job(json.load(f))
+        except (FileNotFoundError, ValueError):
+            continue
+    return None
+
+
+def _ensure_printer_worker(host, port):
+    """Starts the worker for one printer if it is not running. Caller holds _print_cond."""
+    target = (host, port)
+    worker = _print_workers.get(target)
+    if worker is not None:
+        if worker.is_alive():
+            return
+        # The worker died; put back the job it was printing so the new one picks it up
+        for job in _print_jobs.values():
+            if job['status'] == 'printing' and (job['host'], job['port']) == target:
+                job.update(status='retrying', next_attempt=0)
+    worker = threading.Thread(target=_print_worker_loop, args=target,
+                              name=f'print-worker-{host}:{port}', daemon=True)
+    _print_workers[target] = worker
+    worker.start()
+
+
+def claim_print_queue():
+    """
+    Returns whether this process drains the print queue, claiming it if no running
+    process does. Once claimed it stays claimed until the process exits. Without
+    fcntl every process counts as the owner.
+    """
+    with _print_cond:
+        if fcntl is None or _print_state['lock_file'] is not None:
+            return True
+        PRINT_QUEUE_DIR.mkdir(exist_ok=True)
+        lock_file = open(PRINT_QUEUE_LOCK_FILE, mode='a')
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        _print_state['lock_file'] = lock_file
+        return True
+
+
+def start_print_worker():
+    """
+    If this process drains the print queue (see claim_print_queue()), loads the
+    pending jobs and starts a worker per configured printer. Returns whether it does.
+    """
+    if not claim_print_queue():
+        return False
+    with _print_cond:
+        if not _print_state['scanned']:
+            _scan_print_queue()
+        targets = {(j['host'], j['port']) for j in _print_jobs.values()}
+        targets.update((p['host'], p['port']) for p in get_printer_config()['printers'].values())
+        for host, port in targets:
+            _ensure_printer_worker(host, port)
+    return True
+
+
+def enqueue_print_job(data, seat='', host=None, port=None, station=None):
+    """Queues an ESC/POS payload for printing and returns the job id."""
+    owner = start_print_worker()
+    now = time.time()
+    job = {
+        'id': uuid.uuid4().hex,
+        'seat': seat,
+        'station': station,
+        'host': host or PRINTER_IP,
+        'port': port or PRINTER_PORT,
+        'status': 'queued',
+        'attempts': 0,
+        'error': None,
+        'created': now,
+        'updated': now,
+        'next_attempt': 0,
+        'payload': data,
+    }
+    with _print_cond:
+        _persist_print_job(job)
+        if owner:
+            _print_jobs[job['id']] = job
+            _ensure_printer_worker(job['host'], job['port'])
+            _print_cond.notify_all()
+    return job['id']
+
+
+def get_print_job(job_id, wait=0):
+    """
+    Returns the public view of a print job, or None if unknown. With wait > 0 this
+    blocks until the job is done/failed or the timeout passes (long polling). Jobs
+    this process isn't printing are read from their files.
+    """
+    if not job_id.isalnum():
+        return None
+    deadline = time.time() + wait
+    while True:
+        with _print_cond:
+            job = _print_jobs.get(job_id)
+            if job is not None:
+                remaining = deadline - time.time()
+                if job['status'] in ('done', 'failed') or remaining <= 0:
+                    return _public_job(job)
+                _print_cond.wait(remaining)
+                continue
+        job = _read_print_job_file(job_id)
+        remaining = deadline - time.time()
+        if job is None or job['status'] in ('done', 'failed') or remaining <= 0:
+            return job
+        time.sleep(min(remaining, PRINT_QUEUE_POLL))
+
+
+def _next_print_job(host, port):
+    """Waits for the oldest due job for one printer and marks it as printing."""
+    with _print_cond:
+        while True:
+            now = time.time()
+            if now - _print_state['scanned'] >= PRINT_QUEUE_POLL:
+                _scan_print_queue()
+            pending = [j for j in _print_jobs.values()
+                       if j['status'] in ('queued', 'retrying') and j['host'] == host and j['port'] == port]
+            due = [j for j in pending if j['next_attempt'] <= now]
+            if due:
+                job = min(due, key=lambda j: j['created'])
+                job.update(status='printing', updated=now)
+                _print_cond.notify_all()
+                return job
+            timeout = min((j['next_attempt'] for j in pending), default=now + 60) - now
+            _print_cond.wait(min(max(timeout, 0.05), PRINT_QUEUE_POLL))
+
+
+def _print_worker_loop(host, port):
+    while True:
+        job = _next_print_job(host, port)
+        try:
+            send_to_printer(job['payload'], job['host'], job['port'])
+            error = None
+        except Exception as e:  # anything, e.g. a bad host in printers.json, must not kill the worker
+            error = str(e) or type(e).__name__
+
+        with _print_cond:
+            job['attempts'] += 1
+            job['updated'] = time.time()
+            if error is None:
+                job.update(status='done', error=None)
+                _forget_print_job(job)
+            elif job['attempts'] >= PRINT_MAX_ATTEMPTS:
+                job.update(status='failed', error=error)
+                _forget_print_job(job)
+            else:
+                delay = min(PRINT_RETRY_BASE * 2 ** (job['attempts'] - 1), PRINT_RETRY_MAX)
+                job.update(status='retrying', error=error, next_attempt=job['updated'] + delay)
+                _persist_print_job(job)
+            _print_cond.notify_all()
+
+
+# --- Idempotent order submission ---
+# Tablets send an Idempotency-Key (or orderId) with each order and reuse it when
+# retrying after a network error. The first successful result per key is kept for
+# IDEMPOTENCY_TTL and replayed, so a retry never logs or prints the order twice.
+# As soon as the order is in the ledger the key is stored as 'logged' with the priced
+# order, so if queueing the tickets fails after that, a retry only queues them again.
+# Results are appended to IDEMPOTENCY_FILE, which every worker process reads the new
+# lines of under IDEMPOTENCY_LOCK_FILE before it looks a key up, so a retry that
+# lands on another process is still recognised. A request holds its key's stripe
+# (a thread lock plus a byte-range lock on IDEMPOTENCY_KEYS_FILE) from lookup to
+# result, so a concurrent retry in any process waits for the first attempt.
+IDEMPOTENCY_FILE = LEDGER_DIR / "idempotency.jsonl"
+IDEMPOTENCY_LOCK_FILE = LEDGER_DIR / "idempotency.lock"
+IDEMPOTENCY_KEYS_FILE = LEDGER_DIR / "idempotency.keys.lock"
+IDEMPOTENCY_TTL = 24 * 3600
+IDEMPOTENCY_MAX_KEYS = 5000
+IDEMPOTENCY_STRIPES = 64
+IDEMPOTENCY_KEY_MAX = 200  # characters
+
+_idempotency_results = OrderedDict()  # key -> (timestamp, result), oldest first
+_idempotency_lock = threading.Lock()
+_idempotency_stripes = [threading.Lock() for _ in range(IDEMPOTENCY_STRIPES)]
+# offset/inode: how much of which IDEMPOTENCY_FILE is in _idempotency_results
+_idempotency_state = {'offset': 0, 'inode': None, 'torn': False, 'file_lines': 0, 'keys_file': None}
+
+
+@contextmanager
+def _idempotency_file_lock():
+    """Exclusive access to IDEMPOTENCY_FILE and _idempotency_results, across threads and processes."""
+    with _idempotency_lock:
+        LEDGER_DIR.mkdir(exist_ok=True)
+        with open(IDEMPOTENCY_LOCK_FILE, 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            yield
+
+
+def _lock_idempotency_key(key, lock):
+    """Takes (lock=True) or releases the stripe a key belongs to."""
+    stripe = zlib.crc32(key.encode('utf-8')) % IDEMPOTENCY_STRIPES
+    if lock:
+        _idempotency_stripes[stripe].acquire()
+    if fcntl is not None:
+        with _idempotency_lock:
+            if _idempotency_state['keys_file'] is None:
+                LEDGER_DIR.mkdir(exist_ok=True)
+                # Kept open: closing any descriptor of the file would drop this process's lockf locks
+                _idempotency_state['keys_file'] = open(IDEMPOTENCY_KEYS_FILE, 'a')
+            keys_file = _idempotency_state['keys_file']
+        # Only one thread per process holds a stripe, so the per-process lockf lock is enough here
+        fcntl.lockf(keys_file.fileno(), fcntl.LOCK_EX if lock else fcntl.LOCK_UN, 1, stripe)
+    if not lock:
+        _idempotency_stripes[stripe].release()
+
+
+def _prune_idempotency_keys(now):
+    """Drops expired keys and enforces the size bound. Caller holds _idempotency_file_lock()."""
+    while _idempotency_results:
+        key, (stamp, _) = next(iter(_idempotency_results.items()))
+        if now - stamp <= IDEMPOTENCY_TTL and len(_idempotency_results) <= IDEMPOTENCY_MAX_KEYS:
+            break
+        del _idempotency_results[key]
+
+
+def _refresh_idempotency_keys():
+    """
+    Reads the lines other processes (or an earlier run) appended since the last call,
+    or the whole file again if it was compacted. Caller holds _idempotency_file_lock().
+    """
+    state = _idempotency_state
+    try:
+        st = os.stat(IDEMPOTENCY_FILE)
+    except FileNotFoundError:
+        st = None
+    if st is None or st.st_ino != state['inode'] or st.st_size < state['offset']:
+        _idempotency_results.clear()
+        state.update(offset=0, inode=st and st.st_ino, torn=False, file_lines=0)
+    if st is None or st.st_size == state['offset']:
+        return
+    with open(IDEMPOTENCY_FILE, mode='rb') as f:
+        f.seek(state['offset'])
+        data = f.read()
+    end = data.rfind(b'\n') + 1
+    for line in data[:end].splitlines():
+        state['file_lines'] += 1
+        try:
+            record = json.loads(line)
+            _idempotency_results[record['key']] = (record['time'], record['result'])
+            _idempotency_results.move_to_end(record['key'])
+        except (ValueError, KeyError):
+            continue  # a line torn by a crash
+    state['offset'] += end
+    state['torn'] = end < len(data)  # the rest of a line a crash cut short
+    _prune_idempotency_keys(time.time())
+
+
+def _store_idempotency_result(key, result):
+    """
+    Stores and appends one result; rewrites the file from memory once it holds mostly
+    stale lines. Caller holds _idempotency_file_lock().
+    """
+    _refresh_idempotency_keys()
+    stamp = time.time()
+    _idempotency_results[key] = (stamp, result)
+    _idempotency_results.move_to_end(key)
+    _prune_idempotency_keys(stamp)
+    state = _idempotency_state
+    if state['file_lines'] >= 2 * IDEMPOTENCY_MAX_KEYS:
+        temp_file = IDEMPOTENCY_FILE.with_suffix(f'.{os.getpid()}.tmp')
+        with open(temp_file, mode='w', encoding='utf-8') as f:
+            for k, (t, r) in _idempotency_results.items():
+                f.write(json.dumps({'key': k, 'time': t, 'result': r}) + '\n')
+        os.replace(temp_file, IDEMPOTENCY_FILE)
+        st = os.stat(IDEMPOTENCY_FILE)
+        state.update(offset=st.st_size, inode=st.st_ino, torn=False, file_lines=len(_idempotency_results))
+        return
+    line = json.dumps({'key': key, 'time': stamp, 'result': result}) + '\n'
+    if state['torn']:
+        line = '\n' + line  # end the torn line, or this one would be lost with it
+    with open(IDEMPOTENCY_FILE, mode='a', encoding='utf-8') as f:
+        f.write(line)
+    # Read back by the next refresh, which is harmless: it stores the same result
+
+
+def begin_idempotent_request(key):
+    """
+    Returns the stored result if this key already succeeded. Otherwise holds the key
+    and returns None, or the {'status': 'logged', 'order'} record if an earlier
+    attempt logged the order but did not finish; finish_idempotent_request() releases
+    it. A concurrent retry with the same key, in any process, waits here for the
+    first attempt to finish instead of running in parallel.
+    """
+    _lock_idempotency_key(key, True)
+    try:
+        with _idempotency_file_lock():
+            _refresh_idempotency_keys()
+            cached = _idempotency_results.get(key)
+    except BaseException:
+        _lock_idempotency_key(key, False)
+        raise
+    if cached is not None and cached[1]['status'] != 'logged':
+        _lock_idempotency_key(key, False)
+        return cached[1]
+    return None if cached is None else cached[1]
+
+
+def mark_idempotent_order_logged(key, order_data):
+    """Records that the key's order is in the ledger, so no retry logs it again. The key stays held."""
+    with _idempotency_file_lock():
+        _store_idempotency_result(key, {'status': 'logged', 'order': order_data})
+
+
+def finish_idempotent_request(key, result):
+    """Releases the key; a successful result is stored for replays, a failure (None) is not."""
+    try:
+        if result is not None:
+            with _idempotency_file_lock():
+                _store_idempotency_result(key, result)
+    finally:
+        _lock_idempotency_key(key, False)
+
+
+@app.route('/print', methods=['POST'])
+def print_receipt():
+    order_data = request.json or {}
+    if not isinstance(order_data, dict):
+        return jsonify({'status': 'error', 'message': 'The order must be a JSON object'}), 400
+    key = request.headers.get('Idempotency-Key') or order_data.get('orderId')
+    if key is not None and not (isinstance(key, str) and 0 < len(key) <= IDEMPOTENCY_KEY_MAX):
+        return jsonify({'status': 'error', 'message': f'Idempotency-Key (or orderId) must be a string of '
+                                                      f'1 to {IDEMPOTENCY_KEY_MAX} characters'}), 400
+    try:
+        cached = begin_idempotent_request(key) if key else None
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+    if cached is not None and cached['status'] != 'logged':
+        return jsonify(dict(cached, replayed=True))
+
+    result = None
+    try:
+        if cached is not None:
+            # An earlier attempt logged this order and then failed: only queue the tickets
+            order_data = cached['order']
+            tickets = build_order_tickets(order_data)
+        else:
+            menu = get_menu_snapshot()
+            order_data, price_check = price_order(order_data, menu)
+            if price_check:
+                order_data['priceCheck'] = price_check
+            # Render every ticket first, so a bad line or printer config fails before the ledger write
+            tickets = build_order_tickets(order_data, menu)
+            log_order_to_csv(order_data)
+            if key:
+                mark_idempotent_order_logged(key, order_data)
+        jobs = enqueue_order_tickets(order_data, tickets=tickets)
+
+        result = {'status': 'success', 'job_id': jobs[0]['job_id'], 'jobs': jobs,
+                  'total': f"{order_data['total']:.2f}"}
+        if order_data.get('priceCheck'):
+            result['priceCheck'] = order_data['priceCheck']
+        return jsonify(result)
+
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
+    finally:
+        if key:
+            finish_idempotent_request(key, result)
+
+@app.route('/api/reports/daily', methods=['GET'])
+def api_daily_report():
+    day = request.args.get('date') or datetime.now().strftime("%Y-%m-%d")
+    try:
+        datetime.strptime(day, "%Y-%m-%d")
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'date must be YYYY-MM-DD'}), 400
+    return jsonify(get_daily_report(day))
+
+@app.route('/api/orders', methods=['GET'])
+def api_orders():
+    if LEDGER_BACKEND != 'sqlite':
+        return jsonify({'status': 'error', 'message': 'Order queries need the sqlite ledger backend'}), 400
+    orders = query_orders(day=request.args.get('date'), seat=request.args.get('seat'),
+                          payment_method=request.args.get('payment'),
+                          start=request.args.get('from'), end=request.args.get('to'))
+    total_cents = sum(order['total_cents'] for order in orders)
+    return jsonify({'orders': orders, 'count': len(orders), 'total': f"{total_cents / 100:.2f}"})
+
+@app.route('/api/orders/export', methods=['GET'])
+def api_orders_export():
+    if LEDGER_BACKEND != 'sqlite':
+        return jsonify({'status': 'error', 'message': 'CSV export needs the sqlite ledger backend'}), 400
+    day = request.args.get('date') or datetime.now().strftime("%Y-%m-%d")
+    out = io.StringIO(newline='')
+    export_day_csv(day, out)
+    response = app.response_class(out.getvalue(), mimetype='text/csv')
+    response.headers['Content-Disposition'] = f'attachment; filename=orders_{day}.csv'
+    return response
+
+@app.route('/print/status/<job_id>', methods=['GET'])
+def api_print_status(job_id):
+    wait = min(request.args.get('wait', 0, type=float), 30)
+    job = get_print_job(job_id, wait=wait)
+    if job is None:
+        return jsonify({'status': 'error', 'message': 'Print job not found'}), 404
+    return jsonify(job)
 
 if __name__ == '__main__':
-    ensure_menu_file_has_order() # Check/update menu file on startup
+    migrate_menu_file() # Bring an older menu.xml up to the current schema once, before serving
+    recover_ledger() # Finish ledger appends a crash or power cut cut short
+    # With the debug reloader only the serving child process should drain the print queue
+    if is_running_from_reloader():
+        start_print_worker()
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,131 @@
+"""
+Load benchmark for /print against the bundled printer emulator.
+
+    python bench_print.py [--orders 500] [--concurrency 8] [--latency 0.05]
+                          [--disconnect-rate 0.1] [--paper-out-for 2] [--ledger csv|sqlite]
+
+Runs app31.py in-process (Flask test client) in a scratch directory, with the
+printer pointed at a PrinterEmulator on a free local port. Reports the /print
+request latency and throughput, and how long the print queue took to get every
+ticket out, including retries caused by the emulated failures. Every ticket should
+be printed exactly once: a reset connection or an empty paper roll makes the app
+retry the ticket rather than count it as printed.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from printer_emulator import PrinterEmulator
+
+ROOT = Path(__file__).resolve().parent
+
+SAMPLE_ITEMS = [
+    {'name': 'Freddo Espresso', 'price': 3.5, 'quantity': 2, 'category': 'Coffees'},
+    {'name': 'Frappe (Sweet)', 'price': 3.0, 'quantity': 1, 'category': 'Coffees'},
+    {'name': 'Club Sandwich', 'price': 7.5, 'quantity': 1, 'category': 'Snacks', 'customText': 'no mayo'},
+]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def wait_for_queue(app31, timeout):
+    """Waits until every print job is done or failed; returns whether that happened in time."""
+    deadline = time.time() + timeout
+    with app31._print_cond:
+        while any(job['status'] not in ('done', 'failed') for job in app31._print_jobs.values()):
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            app31._print_cond.wait(remaining)
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark /print against the printer emulator.')
+    parser.add_argument('--orders', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.0, help='Emulated seconds per ticket')
+    parser.add_argument('--disconnect-rate', type=float, default=0.0, help='Emulated connection resets (0-1)')
+    parser.add_argument('--paper-out-for', type=float, default=0.0,
+                        help='Start out of paper and load it after this many seconds')
+    parser.add_argument('--ledger', choices=('csv', 'sqlite'), default='csv')
+    parser.add_argument('--timeout', type=float, default=120.0, help='Seconds to wait for all tickets')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='bench_print_')
+    os.chdir(workdir)
+    sys.path.insert(0, str(ROOT))
+    import app31
+
+    app31.MENU_FILE = str(ROOT / 'menu.xml')
+    app31.LEDGER_BACKEND = args.ledger
+    app31.PRINT_RETRY_BASE = 0.05
+    app31.PRINT_RETRY_MAX = 1.0
+    app31.PRINT_MAX_ATTEMPTS = 50
+
+    emulator = PrinterEmulator(port=0, latency=args.latency, disconnect_rate=args.disconnect_rate,
+                               paper=not args.paper_out_for, seed=1)
+    emulator.start()
+    app31.PRINTER_IP, app31.PRINTER_PORT = emulator.address
+    if args.paper_out_for:
+        threading.Timer(args.paper_out_for, emulator.set_paper, args=(True,)).start()
+
+    client = app31.app.test_client()
+    latencies, errors = [], []
+    counter = iter(range(args.orders))
+    counter_lock = threading.Lock()
+
+    def worker():
+        while True:
+            with counter_lock:
+                n = next(counter, None)
+            if n is None:
+                return
+            order = {'seat': f"{'ABCD'[n % 4]}{n % 25 + 1}", 'items': SAMPLE_ITEMS, 'total': 17.5,
+                     'payByCard': n % 3 == 0, 'orderId': f'bench-{n}'}
+            started = time.perf_counter()
+            response = client.post('/print', json=order)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                errors.append(response.get_json())
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(args.concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    submitted = time.perf_counter() - started
+    drained_queue = wait_for_queue(app31, args.timeout)
+    drained = time.perf_counter() - started
+    # The last tickets may still be in the emulator's socket buffer
+    printed_all = emulator.wait_for_tickets(args.orders, timeout=2)
+    emulator.stop()
+    statuses = {}
+    for job in app31._print_jobs.values():
+        statuses[job['status']] = statuses.get(job['status'], 0) + 1
+    retries = sum(job['attempts'] - 1 for job in app31._print_jobs.values() if job['attempts'])
+
+    print(f"workdir          {workdir}")
+    print(f"orders           {args.orders} ({len(errors)} failed) with {args.concurrency} clients, ledger={args.ledger}")
+    print(f"/print           {args.orders / submitted:.1f} req/s; latency p50 {percentile(latencies, 50) * 1000:.1f} ms, "
+          f"p95 {percentile(latencies, 95) * 1000:.1f} ms, max {max(latencies) * 1000:.1f} ms, "
+          f"mean {statistics.mean(latencies) * 1000:.1f} ms")
+    print(f"print queue      drained in {drained:.2f} s" + ('' if drained_queue else ' (timed out)')
+          + f"; jobs {statuses}, {retries} retries")
+    print(f"tickets printed  {len(emulator.tickets)}/{args.orders}"
+          + ('' if printed_all else f" ({args.orders - len(emulator.tickets)} lost or still pending)"))
+    print(f"emulator         {emulator.stats}")
+    return 0 if printed_all and not errors else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,227 @@
+"""
+Builds the self-hosted CSS and icon assets used by app31.py.
+
+    python build_assets.py [--tailwind PATH] [--fontawesome-dir DIR] [--icon fa-xyz ...]
+
+Produces, under static/dist/:
+  - tailwind.<hash>.css   purged Tailwind build for the classes in the POS template,
+                          plus the category colour palette (safelisted because those
+                          class names are only assembled in JavaScript / menu.xml)
+  - icons.<hash>.css      Font Awesome base rules and only the icons actually used
+  - fa-*.<hash>.woff2     the Font Awesome fonts subset to those glyphs
+  - manifest.json         logical name -> hashed file name, read by the app at startup
+
+Requirements: the Tailwind CSS v3 standalone CLI (or `npx tailwindcss`), a local
+Font Awesome 6 Free distribution (the `fontawesomefree` pip package works), and
+fontTools + brotli for the woff2 subsetting. Re-run after adding new icons to menu.xml.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+APP_FILE = ROOT / 'app31.py'
+MENU_FILE = ROOT / 'menu.xml'
+DIST_DIR = ROOT / 'static' / 'dist'
+
+# Icons worth having without a rebuild when a manager sets an item icon from the UI
+EXTRA_ICONS = {
+    'fa-coffee', 'fa-mug-hot', 'fa-cube', 'fa-beer', 'fa-beer-mug-empty', 'fa-wine-glass',
+    'fa-martini-glass', 'fa-martini-glass-citrus', 'fa-whiskey-glass', 'fa-glass-water',
+    'fa-lemon', 'fa-apple-whole', 'fa-ice-cream', 'fa-pizza-slice', 'fa-burger',
+    'fa-hotdog', 'fa-bowl-food', 'fa-leaf', 'fa-carrot', 'fa-fish', 'fa-bread-slice',
+    'fa-cookie', 'fa-blender', 'fa-seedling', 'fa-star',
+}
+
+# fa-* classes that are modifiers, not icons
+FA_MODIFIERS = {
+    'fa-solid', 'fa-regular', 'fa-brands', 'fa-fw', 'fa-spin', 'fa-pulse', 'fa-lg',
+    'fa-xs', 'fa-sm', 'fa-xl', 'fa-2xl', 'fa-1x', 'fa-2x', 'fa-3x', 'fa-4x', 'fa-5x',
+}
+
+FONTS = {
+    # file stem: (font-family, font-weight)
+    'fa-solid-900': ('Font Awesome 6 Free', 900),
+    'fa-regular-400': ('Font Awesome 6 Free', 400),
+    'fa-brands-400': ('Font Awesome 6 Brands', 400),
+}
+
+ICON_BASE_CSS = (
+    '.fa,.fas,.fa-solid,.far,.fa-regular,.fab,.fa-brands{-moz-osx-font-smoothing:grayscale;'
+    '-webkit-font-smoothing:antialiased;display:inline-block;font-style:normal;'
+    'font-variant:normal;line-height:1;text-rendering:auto}'
+    '.fa,.fas,.fa-solid{font-family:"Font Awesome 6 Free";font-weight:900}'
+    '.far,.fa-regular{font-family:"Font Awesome 6 Free";font-weight:400}'
+    '.fab,.fa-brands{font-family:"Font Awesome 6 Brands";font-weight:400}'
+)
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def write_hashed(stem, suffix, data):
+    """Writes data to static/dist/<stem>.<hash><suffix> and returns the file name."""
+    name = f"{stem}.{content_hash(data)}{suffix}"
+    (DIST_DIR / name).write_bytes(data)
+    return name
+
+
+def menu_xml_values():
+    """Returns (category colours, item icon class strings) found in menu.xml."""
+    if not MENU_FILE.exists():
+        return set(), set()
+    root = ET.parse(MENU_FILE).getroot()
+    colors = {c.get('color') for c in root.iter('category') if c.get('color')}
+    icons = {i.text for i in root.iter('icon') if i.text}
+    return colors, icons
+
+
+def palette_classes(app_source):
+    """The category colour classes offered in the template's colorOptions."""
+    block = re.search(r'const colorOptions = \{(.*?)\};', app_source, re.S)
+    return set(re.findall(r"'(bg-[a-z]+-\d+)'", block.group(1))) if block else set()
+
+
+def used_icons(app_source, menu_icons, extra):
+    icons = set(re.findall(r'\bfa-[a-z0-9-]+', app_source))
+    for value in menu_icons:
+        icons.update(re.findall(r'\bfa-[a-z0-9-]+', value))
+    icons.update(EXTRA_ICONS)
+    icons.update(extra)
+    return icons - FA_MODIFIERS
+
+
+def build_tailwind(tailwind_cmd, safelist):
+    """Runs the Tailwind CLI over app31.py with the palette safelisted; returns the CSS bytes."""
+    with tempfile.TemporaryDirectory() as tmp:
+        config = Path(tmp) / 'tailwind.config.js'
+        config.write_text(
+            'module.exports = ' + json.dumps({
+                'content': [str(APP_FILE)],
+                'safelist': sorted(safelist),
+                'theme': {'extend': {}},
+                'plugins': [],
+            }, indent=2) + ';\n',
+            encoding='utf-8')
+        source = Path(tmp) / 'input.css'
+        source.write_text('@tailwind base;\n@tailwind components;\n@tailwind utilities;\n', encoding='utf-8')
+        output = Path(tmp) / 'tailwind.css'
+        subprocess.run(tailwind_cmd + ['-c', str(config), '-i', str(source), '-o', str(output), '--minify'],
+                       check=True)
+        return output.read_bytes()
+
+
+def icon_codepoints(fa_css, icons):
+    """Maps each requested icon class to its codepoint using Font Awesome's own CSS."""
+    codepoints = {}
+    for selectors, code in re.findall(r'((?:\.fa-[a-z0-9-]+::?before\s*,?\s*)+)\{\s*content:\s*"\\([0-9a-f]+)"', fa_css):
+        for name in re.findall(r'\.(fa-[a-z0-9-]+)::?before', selectors):
+            if name in icons:
+                codepoints[name] = int(code, 16)
+    return codepoints
+
+
+def build_icons(fa_dir, icons):
+    """Writes the subset fonts and returns the icons.css bytes."""
+    from fontTools import subset
+
+    fa_css = (fa_dir / 'css' / 'all.css').read_text(encoding='utf-8')
+    codepoints = icon_codepoints(fa_css, icons)
+    missing = sorted(icons - codepoints.keys())
+    if missing:
+        print(f"Warning: no Font Awesome glyph for: {', '.join(missing)}")
+
+    css = [ICON_BASE_CSS]
+    for stem, (family, weight) in FONTS.items():
+        font_file = fa_dir / 'webfonts' / f'{stem}.ttf'
+        if not font_file.exists():
+            continue
+        options = subset.Options()
+        options.flavor = 'woff2'
+        options.layout_features = ['*']
+        font = subset.load_font(str(font_file), options)
+        available = set(font.getBestCmap())
+        wanted = sorted(set(codepoints.values()) & available)
+        if not wanted:
+            continue
+        subsetter = subset.Subsetter(options)
+        subsetter.populate(unicodes=wanted)
+        subsetter.subset(font)
+        with tempfile.NamedTemporaryFile(suffix='.woff2', delete=False) as tmp:
+            tmp_name = tmp.name
+        try:
+            subset.save_font(font, tmp_name, options)
+            font_name = write_hashed(stem, '.woff2', Path(tmp_name).read_bytes())
+        finally:
+            os.unlink(tmp_name)
+        css.append(f'@font-face{{font-family:"{family}";font-style:normal;font-weight:{weight};'
+                   f'font-display:block;src:url("{font_name}") format("woff2")}}')
+
+    for name, code in sorted(codepoints.items()):
+        css.append(f'.{name}::before{{content:"\\{code:x}"}}')
+    return '\n'.join(css).encode('utf-8')
+
+
+def default_fontawesome_dir():
+    try:
+        import fontawesomefree
+    except ImportError:
+        return None
+    return Path(fontawesomefree.__file__).parent / 'static' / 'fontawesomefree'
+
+
+def default_tailwind_cmd():
+    if os.environ.get('TAILWIND_BIN'):
+        return [os.environ['TAILWIND_BIN']]
+    if shutil.which('tailwindcss'):
+        return ['tailwindcss']
+    if shutil.which('npx'):
+        return ['npx', '--yes', 'tailwindcss@3']
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build self-hosted CSS and icon assets for the POS.')
+    parser.add_argument('--tailwind', help='Tailwind CSS v3 CLI executable (default: $TAILWIND_BIN, tailwindcss, npx)')
+    parser.add_argument('--fontawesome-dir', type=Path, default=default_fontawesome_dir(),
+                        help='Font Awesome 6 Free distribution containing css/ and webfonts/')
+    parser.add_argument('--icon', action='append', default=[], help='Extra icon class to keep, e.g. fa-anchor')
+    args = parser.parse_args(argv)
+
+    tailwind_cmd = [args.tailwind] if args.tailwind else default_tailwind_cmd()
+    if tailwind_cmd is None:
+        parser.error('Tailwind CLI not found; install the standalone binary or pass --tailwind')
+    if args.fontawesome_dir is None or not (args.fontawesome_dir / 'css' / 'all.css').exists():
+        parser.error('Font Awesome distribution not found; pip install fontawesomefree or pass --fontawesome-dir')
+
+    app_source = APP_FILE.read_text(encoding='utf-8')
+    menu_colors, menu_icons = menu_xml_values()
+
+    if DIST_DIR.exists():
+        shutil.rmtree(DIST_DIR)
+    DIST_DIR.mkdir(parents=True)
+
+    manifest = {
+        'tailwind.css': 'dist/' + write_hashed(
+            'tailwind', '.css', build_tailwind(tailwind_cmd, palette_classes(app_source) | menu_colors)),
+        'icons.css': 'dist/' + write_hashed(
+            'icons', '.css', build_icons(args.fontawesome_dir, used_icons(app_source, menu_icons, args.icon))),
+    }
+    (DIST_DIR / 'manifest.json').write_text(json.dumps(manifest, indent=2), encoding='utf-8')
+    for logical, built in manifest.items():
+        size = (ROOT / 'static' / built).stat().st_size
+        print(f"{logical:>14} -> static/{built} ({size / 1024:.1f} KiB)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
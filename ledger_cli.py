@@ -0,0 +1,112 @@
+"""
+Maintenance commands for the order ledger used by app31.py.
+
+    python ledger_cli.py import [--csv-dir DIR]           load existing orders_*.csv days
+    python ledger_cli.py export [--date YYYY-MM-DD] [-o FILE] [--force]
+                                                          write a day in the CSV format
+    python ledger_cli.py recover                          replay the journal after a crash
+    python ledger_cli.py check [--date YYYY-MM-DD | --file FILE] [--rebuild-totals]
+                                                          report corrupt rows and the day's totals
+
+import and export are for the SQLite order store (LEDGER_BACKEND = 'sqlite'). The
+importer skips days that already have orders in the database, so it is safe to
+re-run. The exporter writes the same bytes log_order_to_csv() writes in 'append'
+mode; without -o it writes order_logs/export_<date>.csv, next to the live
+day file rather than over it. It will not overwrite an existing file unless
+--force is given.
+
+recover and check are for the CSV day files. The server replays the journal by
+itself when it starts, so recover is only needed to repair a copy of order_logs
+before reading it. check streams through a day file, so it runs in constant memory
+however big the file; it lists every torn or unreadable row and an order cut off
+at the end, and prints the totals of the intact orders. With --rebuild-totals
+those also replace the day's totals sidecar, and a day file written in 'rewrite'
+mode loses its trailing totals rows. It exits with 1 if it found problems.
+"""
+import argparse
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import app31
+
+
+def cmd_import(args):
+    results = app31.import_csv_ledger(args.csv_dir)
+    if not results:
+        print(f"No orders_*.csv files found in {args.csv_dir or app31.LEDGER_DIR}")
+    for day, count in results.items():
+        print(f"{day}: {count} orders imported" if count else f"{day}: already in the database, skipped")
+    return 0
+
+
+def cmd_export(args):
+    day = args.date or datetime.now().strftime("%Y-%m-%d")
+    out_file = args.output or app31.LEDGER_DIR / f"export_{day}.csv"
+    try:
+        with open(out_file, mode='w' if args.force else 'x', newline='', encoding='utf-8') as f:
+            app31.export_day_csv(day, f)
+    except FileExistsError:
+        print(f"{out_file} already exists; use --force to overwrite it", file=sys.stderr)
+        return 1
+    print(f"{day} -> {out_file}")
+    return 0
+
+
+def cmd_recover(args):
+    stats = app31.recover_ledger()
+    print(f"{stats['batches']} journalled batches, {stats['replayed']} appends replayed, "
+          f"{stats['torn']} torn batches dropped")
+    return 0
+
+
+def cmd_check(args):
+    csv_file = args.file or app31.LEDGER_DIR / f"orders_{args.date or datetime.now().strftime('%Y-%m-%d')}.csv"
+    problems = []
+
+    def report(line_number, message):
+        problems.append(line_number)
+        print(f"{csv_file}:{line_number}: {message}")
+
+    totals = app31.check_day_file(csv_file, report, rebuild_totals=args.rebuild_totals)
+    cash, card = totals['cash_cents'], totals['card_cents']
+    print(f"{csv_file}: {len(problems)} problems; {totals['orders']} orders, cash {cash / 100:.2f}, "
+          f"card {card / 100:.2f}, total {(cash + card) / 100:.2f}"
+          + (" (totals rebuilt)" if args.rebuild_totals else ""))
+    return 1 if problems else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Maintain the order ledger.')
+    parser.add_argument('--db', type=Path, help=f'Database file (default: {app31.LEDGER_DB})')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    importer = commands.add_parser('import', help='Import daily CSV files into the database')
+    importer.add_argument('--csv-dir', type=Path, help=f'Directory with orders_*.csv (default: {app31.LEDGER_DIR})')
+    importer.set_defaults(func=cmd_import)
+
+    exporter = commands.add_parser('export', help='Export one day as CSV')
+    exporter.add_argument('--date', help='Day to export (default: today)')
+    exporter.add_argument('-o', '--output', type=Path,
+                          help=f'Output file (default: {app31.LEDGER_DIR}/export_<date>.csv)')
+    exporter.add_argument('--force', action='store_true', help='Overwrite the output file if it exists')
+    exporter.set_defaults(func=cmd_export)
+
+    recover = commands.add_parser('recover', help='Replay the CSV ledger journal after a crash')
+    recover.set_defaults(func=cmd_recover)
+
+    checker = commands.add_parser('check', help='Report corrupt rows in a CSV day file and its totals')
+    day = checker.add_mutually_exclusive_group()
+    day.add_argument('--date', help='Day to check (default: today)')
+    day.add_argument('--file', type=Path, help='Day file to check')
+    checker.add_argument('--rebuild-totals', action='store_true', help="Rewrite the day's totals sidecar")
+    checker.set_defaults(func=cmd_check)
+
+    args = parser.parse_args(argv)
+    if args.db:
+        app31.LEDGER_DB = args.db
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
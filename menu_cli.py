@@ -0,0 +1,98 @@
+"""
+Import and export the menu of app31.py.
+
+    python menu_cli.py export [--format csv|jsonl] [-o FILE]
+    python menu_cli.py import FILE [--format csv|jsonl] [--expected-version N]
+    python menu_cli.py migrate                     upgrade menu.xml to the current schema
+
+Records are one item per CSV row / JSON line with the fields
+category, color, id, name, description, price, icon, options (a JSON list of
+{"label", "priceAdjustment"} in the CSV). Import replaces the whole menu; items and
+options keep the ids given in the file, others get new ones. Both directions stream,
+so large catalogs do not need to fit in memory.
+
+app31.py runs the migration itself when started directly; run `migrate` before
+serving it any other way (e.g. under gunicorn) or after copying in an old menu.xml.
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import app31
+
+
+def format_for(path, fmt):
+    if fmt:
+        return fmt
+    return 'jsonl' if path and Path(path).suffix in ('.jsonl', '.ndjson', '.json') else 'csv'
+
+
+def cmd_export(args):
+    fmt = format_for(args.output, args.format)
+    out = open(args.output, mode='w', newline='', encoding='utf-8') if args.output else sys.stdout
+    try:
+        for chunk in app31.iter_menu_export(fmt):
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+    return 0
+
+
+def cmd_import(args):
+    fmt = format_for(args.file, args.format)
+    started = time.perf_counter()
+    with open(args.file, mode='r', newline='' if fmt == 'csv' else None, encoding='utf-8-sig') as f:
+        try:
+            result = app31.import_menu(app31.iter_menu_import(f, fmt), expected_version=args.expected_version)
+        except app31.MenuEditError as e:
+            print(f"Import failed: {e.message}", file=sys.stderr)
+            return 1
+        except app31.MenuVersionConflict as e:
+            print(f"Import failed: the menu is at version {e.version}", file=sys.stderr)
+            return 1
+    print(f"Imported {result['items']} items in {result['categories']} categories "
+          f"as version {result['version']} ({time.perf_counter() - started:.2f} s)")
+    return 0
+
+
+def cmd_migrate(args):
+    steps = app31.migrate_menu_file()
+    if steps:
+        print(f"Migrated {app31.MENU_FILE} from schema {steps[0] - 1} to {steps[-1]} "
+              f"(version {app31.get_menu_version()})")
+    else:
+        print(f"{app31.MENU_FILE} is already at schema {app31.MENU_SCHEMA_VERSION} (or missing)")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Import and export the POS menu.')
+    parser.add_argument('--menu', help=f'Menu file (default: {app31.MENU_FILE})')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    exporter = commands.add_parser('export', help='Write the menu as CSV or JSON Lines')
+    exporter.add_argument('--format', choices=sorted(app31.MENU_EXPORT_FORMATS), help='Default: from -o, else csv')
+    exporter.add_argument('-o', '--output', help='Output file (default: stdout)')
+    exporter.set_defaults(func=cmd_export)
+
+    importer = commands.add_parser('import', help='Replace the menu from CSV or JSON Lines')
+    importer.add_argument('file')
+    importer.add_argument('--format', choices=sorted(app31.MENU_EXPORT_FORMATS), help='Default: from the file name')
+    importer.add_argument('--expected-version', type=int, help='Fail unless the menu is still at this version')
+    importer.set_defaults(func=cmd_import)
+
+    migrator = commands.add_parser('migrate', help='Upgrade menu.xml to the current schema')
+    migrator.set_defaults(func=cmd_migrate)
+
+    args = parser.parse_args(argv)
+    if args.menu:
+        app31.MENU_FILE = args.menu
+        app31.MENU_LOCK_FILE = args.menu + '.lock'
+        app31.MENU_CHANGELOG_FILE = args.menu + '.changes.jsonl'
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,402 @@
+"""
+A stand-in for the port-9100 receipt printer, for tests and load benchmarks.
+
+    python printer_emulator.py [--port 9100] [--out-dir tickets] [--format text|json]
+                               [--latency 0.5] [--disconnect-rate 0.1] [--paper-out]
+
+Point app31.py at it with PRINTER_IP = '127.0.0.1' and PRINTER_PORT = <port> (or a
+printers.json entry). Like the real printer it serves one connection at a time. The
+ESC/POS stream is decoded (ESC ! print mode, ESC t code page, GS V cut, cp858 text)
+and every cut produces one ticket, written to --out-dir as decoded text or JSON.
+
+Failure modes:
+  --latency SECONDS      time spent "printing" each ticket; with a small --rcvbuf the
+                         sender feels it as back-pressure, as with the real printer
+  --disconnect-rate P    probability that a connection is reset as soon as it arrives
+  --paper-out            start without paper: tickets are held and printed once paper
+                         is loaded (send SIGUSR1 to toggle); DLE EOT 4 reports paper end
+While running, SIGUSR2 takes the printer offline / online (connections are refused).
+"""
+import argparse
+import json
+import random
+import signal
+import socket
+import struct
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+ESC, GS, DLE, LF = 0x1B, 0x1D, 0x10, 0x0A
+
+# ESC t n -> Python codec. The app selects n=19 (PC858, with the euro sign).
+CODE_PAGES = {0: 'cp437', 2: 'cp850', 3: 'cp860', 4: 'cp863', 5: 'cp865', 16: 'cp1252', 19: 'cp858'}
+
+# ESC ! n bits
+MODE_SMALL, MODE_BOLD, MODE_DOUBLE_HEIGHT, MODE_DOUBLE_WIDTH, MODE_UNDERLINE = 0x01, 0x08, 0x10, 0x20, 0x80
+
+# DLE EOT 4 replies (paper roll sensor)
+STATUS_PAPER_OK = 0x12
+STATUS_PAPER_END = 0x72
+
+
+def mode_flags(mode):
+    """The ESC ! bits as a list of names, for the JSON output."""
+    names = [(MODE_SMALL, 'small'), (MODE_BOLD, 'bold'), (MODE_DOUBLE_HEIGHT, 'double_height'),
+             (MODE_DOUBLE_WIDTH, 'double_width'), (MODE_UNDERLINE, 'underline')]
+    return [name for bit, name in names if mode & bit]
+
+
+class EscPosParser:
+    """
+    Incremental ESC/POS decoder. feed() bytes as they arrive; every GS V cut completes
+    a ticket, returned as {'lines': [[{'text', 'mode'}, ...], ...], 'cut', 'codepage'}.
+    Unknown ESC/GS commands are skipped using their documented argument length.
+    """
+
+    # Argument byte counts for the commands we skip without interpreting
+    ESC_ARGS = {ord('-'): 1, ord('2'): 0, ord('3'): 1, ord('a'): 1, ord('d'): 1, ord('E'): 1,
+                ord('G'): 1, ord('J'): 1, ord('M'): 1, ord('R'): 1, ord('p'): 3, ord('{'): 1}
+    GS_ARGS = {ord('!'): 1, ord('B'): 1, ord('H'): 1, ord('L'): 2, ord('W'): 2, ord('f'): 1,
+               ord('h'): 1, ord('w'): 1}
+
+    def __init__(self, status_reply=None):
+        self.buffer = bytearray()
+        self.status_reply = status_reply  # callable(n) -> int, for DLE EOT n
+        self.replies = bytearray()        # bytes to send back to the host
+        self.codepage = 'cp437'
+        self.mode = 0
+        self._reset_ticket()
+
+    def _reset_ticket(self):
+        self.lines = [[]]
+        self.ticket_codepage = self.codepage
+
+    def _text(self, raw):
+        text = bytes(raw).decode(self.codepage, errors='replace')
+        line = self.lines[-1]
+        if line and line[-1]['mode'] == self.mode:
+            line[-1]['text'] += text
+        else:
+            line.append({'text': text, 'mode': self.mode})
+
+    def feed(self, data):
+        """Consumes bytes and returns the tickets completed by them."""
+        self.buffer += data
+        tickets = []
+        i, buf = 0, self.buffer
+        while i < len(buf):
+            b = buf[i]
+            if b == ESC or b == GS or b == DLE:
+                needed = self._command_length(buf, i)
+                if needed is None or i + needed > len(buf):
+                    break  # wait for the rest of the command
+                ticket = self._command(buf[i:i + needed])
+                if ticket is not None:
+                    tickets.append(ticket)
+                i += needed
+            elif b == LF:
+                self.lines.append([])
+                i += 1
+            elif b < 0x20:
+                i += 1  # other control characters (CR, HT, ...) carry no text
+            else:
+                end = i
+                while end < len(buf) and buf[end] >= 0x20:
+                    end += 1
+                self._text(buf[i:end])
+                i = end
+        del self.buffer[:i]
+        return tickets
+
+    def _command_length(self, buf, i):
+        """Total length of the command at buf[i], or None if more bytes are needed to tell."""
+        if i + 1 >= len(buf):
+            return None
+        prefix, cmd = buf[i], buf[i + 1]
+        if prefix == DLE:
+            return 3  # DLE EOT n
+        if prefix == ESC:
+            if cmd in (ord('!'), ord('t')):
+                return 3
+            if cmd == ord('@'):
+                return 2
+            return 2 + self.ESC_ARGS.get(cmd, 0)
+        if cmd == ord('V'):
+            if i + 2 >= len(buf):
+                return None
+            return 4 if buf[i + 2] in (65, 66) else 3  # GS V m n for feed-and-cut modes
+        return 2 + self.GS_ARGS.get(cmd, 0)
+
+    def _command(self, cmd):
+        prefix, op = cmd[0], cmd[1]
+        if prefix == DLE:
+            if op == 0x04 and self.status_reply is not None:
+                self.replies.append(self.status_reply(cmd[2]))
+        elif prefix == ESC:
+            if op == ord('!'):
+                self.mode = cmd[2]
+            elif op == ord('t'):
+                self.codepage = CODE_PAGES.get(cmd[2], 'cp437')
+                if not any(self.lines):
+                    self.ticket_codepage = self.codepage
+            elif op == ord('@'):
+                self.mode = 0
+                self.codepage = 'cp437'
+        elif prefix == GS and op == ord('V'):
+            lines = self.lines
+            while lines and not lines[-1]:
+                lines = lines[:-1]
+            ticket = {
+                'lines': lines,
+                'cut': 'partial' if cmd[2] in (1, 49, 66) else 'full',
+                'codepage': self.ticket_codepage,
+            }
+            self._reset_ticket()
+            return ticket
+        return None
+
+    def pending(self):
+        """Text received since the last cut (a ticket the host never cut), if any."""
+        if any(self.lines):
+            ticket = {'lines': self.lines, 'cut': None, 'codepage': self.ticket_codepage}
+            self._reset_ticket()
+            return ticket
+        return None
+
+
+def ticket_text(ticket):
+    return '\n'.join(''.join(span['text'] for span in line) for line in ticket['lines'])
+
+
+def ticket_json(ticket):
+    return {
+        'received': ticket['received'],
+        'peer': ticket['peer'],
+        'cut': ticket['cut'],
+        'codepage': ticket['codepage'],
+        'text': ticket_text(ticket),
+        'lines': [[{'text': span['text'], 'style': mode_flags(span['mode'])} for span in line]
+                  for line in ticket['lines']],
+    }
+
+
+class PrinterEmulator:
+    """
+    A TCP server that behaves like a port-9100 printer. Use as a context manager in
+    tests and benchmarks; printed tickets are collected in .tickets (and written to
+    out_dir when given). port=0 picks a free port, see .address.
+    """
+
+    def __init__(self, host='127.0.0.1', port=9100, out_dir=None, fmt='text', latency=0.0,
+                 disconnect_rate=0.0, paper=True, rcvbuf=None, seed=None):
+        self.host, self.port = host, port
+        self.out_dir = Path(out_dir) if out_dir else None
+        self.fmt = fmt
+        self.latency = latency
+        self.disconnect_rate = disconnect_rate
+        self.rcvbuf = rcvbuf
+        self.tickets = []
+        self.held = []  # tickets received while out of paper
+        self.stats = {'connections': 0, 'disconnects': 0, 'bytes': 0}
+        self._paper = paper
+        self._online = True
+        self._random = random.Random(seed)
+        self._lock = threading.Condition()
+        self._sock = None
+        self._thread = None
+        self._stopping = False
+
+    # -- control --
+
+    @property
+    def address(self):
+        return self._sock.getsockname()[:2] if self._sock else (self.host, self.port)
+
+    def set_paper(self, loaded):
+        """Paper out / loaded. Loading paper prints everything that was held."""
+        with self._lock:
+            self._paper = loaded
+            held, self.held = (self.held, []) if loaded else ([], self.held)
+        for ticket in held:
+            self._emit(ticket)
+
+    def set_online(self, online):
+        """Offline closes the listening socket, so senders get 'connection refused'."""
+        with self._lock:
+            if online == self._online:
+                return
+            self._online = online
+            if not online and self._sock is not None:
+                self._sock.close()
+                self._sock = None
+        if online:
+            self._listen()
+
+    def wait_for_tickets(self, count, timeout=10.0):
+        """Blocks until at least `count` tickets were printed; returns whether they were."""
+        deadline = time.time() + timeout
+        with self._lock:
+            while len(self.tickets) < count:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._lock.wait(remaining)
+            return True
+
+    def start(self):
+        self._stopping = False
+        self._listen()
+        return self
+
+    def stop(self):
+        self._stopping = True
+        with self._lock:
+            if self._sock is not None:
+                self._sock.close()
+                self._sock = None
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # -- server --
+
+    def _listen(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.rcvbuf:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.rcvbuf)
+        sock.bind((self.host, self.port))
+        # A generous backlog: with the emulator in-process it can fall behind a burst, and a
+        # full backlog drops SYNs, which costs the sender a 1 s retransmit per connection
+        sock.listen(128)
+        sock.settimeout(0.2)
+        self.port = sock.getsockname()[1]  # keep the port across offline/online
+        with self._lock:
+            self._sock = sock
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._serve, name='printer-emulator', daemon=True)
+            self._thread.start()
+
+    def _serve(self):
+        while not self._stopping:
+            sock = self._sock
+            if sock is None:
+                time.sleep(0.05)
+                continue
+            try:
+                conn, peer = sock.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                continue  # listening socket closed by set_online(False)/stop()
+            with conn:
+                self._handle(conn, f"{peer[0]}:{peer[1]}")
+
+    def _handle(self, conn, peer):
+        self.stats['connections'] += 1
+        if self._random.random() < self.disconnect_rate:
+            # Close with RST instead of FIN, like a printer dropping the link
+            conn.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+            self.stats['disconnects'] += 1
+            return
+
+        parser = EscPosParser(status_reply=self._status)
+        conn.settimeout(30)
+        while True:
+            try:
+                data = conn.recv(4096)
+            except (socket.timeout, OSError):
+                break
+            if not data:
+                break
+            self.stats['bytes'] += len(data)
+            for ticket in parser.feed(data):
+                self._print(ticket, peer)
+            if parser.replies:
+                try:
+                    conn.sendall(bytes(parser.replies))
+                except OSError:
+                    break
+                parser.replies.clear()
+        leftover = parser.pending()
+        if leftover is not None:
+            self._print(leftover, peer)
+
+    def _status(self, n):
+        if n == 4:
+            return STATUS_PAPER_OK if self._paper else STATUS_PAPER_END
+        return 0x12  # printer/offline/error status: all clear
+
+    def _print(self, ticket, peer):
+        ticket.update(received=datetime.now().isoformat(timespec='milliseconds'), peer=peer)
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            if not self._paper:
+                self.held.append(ticket)
+                return
+        self._emit(ticket)
+
+    def _emit(self, ticket):
+        with self._lock:
+            self.tickets.append(ticket)
+            number = len(self.tickets)
+            self._lock.notify_all()
+        if self.out_dir is not None:
+            self.out_dir.mkdir(parents=True, exist_ok=True)
+            if self.fmt == 'json':
+                path = self.out_dir / f"ticket-{number:05d}.json"
+                path.write_text(json.dumps(ticket_json(ticket), ensure_ascii=False, indent=2), encoding='utf-8')
+            else:
+                path = self.out_dir / f"ticket-{number:05d}.txt"
+                path.write_text(ticket_text(ticket) + '\n', encoding='utf-8')
+        if self.fmt == 'stdout':
+            print(f"--- ticket {number} from {ticket['peer']} ({ticket['cut']} cut) ---")
+            print(ticket_text(ticket))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Emulate a port-9100 ESC/POS receipt printer.')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=9100, help='TCP port (default: 9100)')
+    parser.add_argument('--out-dir', type=Path, help='Write each ticket here (default: print to stdout)')
+    parser.add_argument('--format', choices=('text', 'json'), default='text', help='Ticket file format')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds spent printing each ticket')
+    parser.add_argument('--disconnect-rate', type=float, default=0.0,
+                        help='Probability (0-1) of resetting a connection on arrival')
+    parser.add_argument('--paper-out', action='store_true', help='Start out of paper (SIGUSR1 toggles)')
+    parser.add_argument('--rcvbuf', type=int, help='Socket receive buffer size in bytes')
+    args = parser.parse_args(argv)
+
+    emulator = PrinterEmulator(args.host, args.port, out_dir=args.out_dir,
+                               fmt=args.format if args.out_dir else 'stdout', latency=args.latency,
+                               disconnect_rate=args.disconnect_rate, paper=not args.paper_out,
+                               rcvbuf=args.rcvbuf)
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, lambda *_: emulator.set_paper(not emulator._paper))
+        signal.signal(signal.SIGUSR2, lambda *_: emulator.set_online(not emulator._online))
+
+    emulator.start()
+    host, port = emulator.address
+    print(f"Printer emulator listening on {host}:{port}" + (" (out of paper)" if args.paper_out else ""))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        emulator.stop()
+        print(f"{len(emulator.tickets)} tickets printed, {len(emulator.held)} held; {emulator.stats}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
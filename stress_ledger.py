@@ -0,0 +1,159 @@
+"""
+Stress test for the order ledger with several writer processes.
+
+    python stress_ledger.py [--processes 4] [--threads 8] [--orders 4000]
+                            [--ledger csv|sqlite] [--mode append|rewrite] [--no-fsync]
+
+Starts --processes fresh Python processes, each importing app31.py on its own as a
+gunicorn worker would, all sharing one scratch LEDGER_DIR. Each process logs its
+share of --orders with log_order_to_csv() from --threads threads at once. Then it
+reads the ledger back and checks that every order and item row is there exactly
+once, that the cents add up to what was sent, and that get_daily_totals() agrees.
+"""
+import argparse
+import csv
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+
+ITEMS = [('Freddo Espresso', 350), ('Frappe (Sweet)', 300), ('Club Sandwich', 750), ('Mojito', 900)]
+
+
+def make_order(n):
+    """A deterministic order; its lines and total differ from one n to the next."""
+    lines = [(name, n % 3 + 1, cents + n % 7) for name, cents in ITEMS[:n % len(ITEMS) + 1]]
+    total = sum(quantity * cents for _, quantity, cents in lines)
+    return {'seat': f"{'ABCD'[n % 4]}{n % 25 + 1}", 'payByCard': n % 3 == 0, 'orderId': f'stress-{n}',
+            'items': [{'name': name, 'quantity': quantity, 'price': cents / 100} for name, quantity, cents in lines],
+            'total': total / 100}
+
+
+def import_app(workdir, args):
+    os.chdir(workdir)
+    sys.path.insert(0, str(ROOT))
+    import app31
+    app31.LEDGER_BACKEND = args.ledger
+    app31.LEDGER_MODE = args.mode
+    app31.LEDGER_FSYNC = not args.no_fsync
+    return app31
+
+
+def run_worker(workdir, args, worker, start):
+    """One 'gunicorn worker': logs orders worker, worker + processes, ... from its threads."""
+    import threading
+    app31 = import_app(workdir, args)
+    start.wait()
+    numbers = iter(range(worker, args.orders, args.processes))
+    numbers_lock = threading.Lock()
+    errors = []
+
+    def log_orders():
+        while True:
+            with numbers_lock:
+                n = next(numbers, None)
+            if n is None:
+                return
+            try:
+                app31.log_order_to_csv(make_order(n))
+            except Exception as e:
+                errors.append(f"order {n}: {e!r}")
+
+    threads = [threading.Thread(target=log_orders) for _ in range(args.threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    for error in errors:
+        print(f"worker {worker}: {error}", file=sys.stderr)
+    sys.exit(1 if errors else 0)
+
+
+def read_csv_ledger(app31):
+    """Returns (orders, item_rows, total_cents, sidecar_cents, problems) for every day file."""
+    orders = item_rows = total_cents = sidecar_cents = 0
+    problems = []
+    for csv_file in sorted(app31.LEDGER_DIR.glob('orders_*.csv')):
+        with open(csv_file, mode='r', newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                if None in row or None in row.values():
+                    problems.append(f"{csv_file.name}: malformed row {row}")
+                elif row['item_name'] == 'ORDER TOTAL':
+                    orders += 1
+                    total_cents += app31._to_cents(row['price'])
+                elif row['item_name'] not in app31.SUMMARY_ITEM_NAMES:
+                    item_rows += 1
+        totals = app31.get_daily_totals(csv_file.stem[len('orders_'):])
+        sidecar_cents += app31._to_cents(totals['total'])
+    return orders, item_rows, total_cents, sidecar_cents, problems
+
+
+def read_db_ledger(app31):
+    conn = app31.get_ledger_db()
+    orders, total_cents = conn.execute('SELECT COUNT(*), COALESCE(SUM(total_cents), 0) FROM orders').fetchone()
+    item_rows = conn.execute('SELECT COUNT(*) FROM order_items').fetchone()[0]
+    duplicates = conn.execute('SELECT COUNT(*) - COUNT(DISTINCT order_id) FROM orders').fetchone()[0]
+    days = [row[0] for row in conn.execute('SELECT DISTINCT substr(timestamp, 1, 10) FROM orders')]
+    sidecar_cents = sum(app31._to_cents(app31.get_daily_totals(day)['total']) for day in days)
+    return orders, item_rows, total_cents, sidecar_cents, [f"{duplicates} duplicate orders"] if duplicates else []
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Log orders from several processes at once and audit the ledger.')
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=8, help='Concurrent orders per process')
+    parser.add_argument('--orders', type=int, default=4000)
+    parser.add_argument('--ledger', choices=('csv', 'sqlite'), default='csv')
+    parser.add_argument('--mode', choices=('append', 'rewrite'), default='append')
+    parser.add_argument('--no-fsync', action='store_true', help='Set LEDGER_FSYNC = False')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='stress_ledger_')
+    context = multiprocessing.get_context('spawn')  # independent interpreters, like gunicorn workers
+    start = context.Event()
+    workers = [context.Process(target=run_worker, args=(workdir, args, worker, start))
+               for worker in range(args.processes)]
+    for process in workers:
+        process.start()
+    time.sleep(1)  # let every process import app31 before the first order
+    started = time.perf_counter()
+    start.set()
+    for process in workers:
+        process.join()
+    elapsed = time.perf_counter() - started
+
+    app31 = import_app(workdir, args)
+    expected = [make_order(n) for n in range(args.orders)]
+    expected_items = sum(len(order['items']) for order in expected)
+    expected_cents = sum(app31._to_cents(order['total']) for order in expected)
+    reader = read_db_ledger if args.ledger == 'sqlite' else read_csv_ledger
+    orders, item_rows, total_cents, sidecar_cents, problems = reader(app31)
+    if orders != args.orders:
+        problems.append(f"{orders} orders in the ledger, {args.orders} sent")
+    if item_rows != expected_items:
+        problems.append(f"{item_rows} item rows in the ledger, {expected_items} sent")
+    if total_cents != expected_cents:
+        problems.append(f"ledger totals {total_cents / 100:.2f}, orders sent {expected_cents / 100:.2f}")
+    if sidecar_cents != expected_cents:
+        problems.append(f"get_daily_totals() says {sidecar_cents / 100:.2f}, orders sent {expected_cents / 100:.2f}")
+    failed = sum(process.exitcode != 0 for process in workers)
+
+    print(f"workdir     {workdir}")
+    print(f"orders      {args.orders} from {args.processes} processes x {args.threads} threads, "
+          f"ledger={args.ledger}, mode={args.mode}, fsync={'off' if args.no_fsync else 'on'}")
+    print(f"throughput  {args.orders / elapsed:.0f} orders/s ({elapsed:.2f} s)")
+    print(f"ledger      {orders} orders, {item_rows} item rows, {total_cents / 100:.2f} total")
+    for problem in problems:
+        print(f"PROBLEM     {problem}")
+    if failed:
+        print(f"PROBLEM     {failed} worker processes reported errors")
+    print('OK' if not problems and not failed else 'FAILED')
+    return 0 if not problems and not failed else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,22 @@
+import shutil
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import app31  # noqa: E402
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Runs a test in an empty directory holding a copy of menu.xml, with app31's in-memory state reset."""
+    shutil.copy(ROOT / 'menu.xml', tmp_path / 'menu.xml')
+    monkeypatch.chdir(tmp_path)
+    app31.invalidate_menu_cache()
+    app31._menu_changelog.update(signature=None, deltas=(), lines=0)
+    app31._idempotency_results.clear()
+    app31._idempotency_state.update(offset=0, inode=None, torn=False, file_lines=0, keys_file=None)
+    return tmp_path
@@ -0,0 +1,19 @@
+import app31
+
+
+def test_only_hashed_static_files_are_cached_for_a_year(workdir, monkeypatch):
+    (workdir / 'static' / 'dist').mkdir(parents=True)
+    (workdir / 'static' / 'dist' / 'tailwind.0123abcd.css').write_text('body{}')
+    (workdir / 'static' / 'dist' / 'manifest.json').write_text('{}')
+    (workdir / 'static' / 'logo.png').write_bytes(b'png')
+    monkeypatch.setattr(app31.app, 'static_folder', str(workdir / 'static'))
+    client = app31.app.test_client()
+
+    hashed = client.get('/static/dist/tailwind.0123abcd.css')
+    assert hashed.headers['Cache-Control'] == app31.ASSET_CACHE_CONTROL
+    for path in ('/static/dist/manifest.json', '/static/logo.png'):
+        response = client.get(path)
+        assert response.status_code == 200
+        assert 'max-age=31536000' not in response.headers.get('Cache-Control', '')
+        response.close()
+    hashed.close()
@@ -0,0 +1,63 @@
+import pytest
+
+import app31
+
+ORDER = {'seat': 'B2', 'payByCard': True, 'orderId': 'tablet-1-0001', 'total': 11.5,
+         'items': [{'name': 'Homemade Pizza Margherita', 'quantity': 1, 'price': 9.5},
+                   {'name': 'Coca Cola', 'quantity': 1, 'price': 2}]}
+
+
+@pytest.fixture
+def printed(workdir, monkeypatch):
+    """Stubs out the print queue; returns the list of queued tickets."""
+    monkeypatch.setattr(app31, 'LEDGER_FSYNC', False)
+    queued = []
+
+    def enqueue_print_job(data, seat='', host=None, port=None, station=None):
+        queued.append(station)
+        return f'job{len(queued)}'
+
+    monkeypatch.setattr(app31, 'enqueue_print_job', enqueue_print_job)
+    return queued
+
+
+def logged_orders():
+    (day_file,) = app31.LEDGER_DIR.glob('orders_*.csv')
+    return app31.check_day_file(day_file)['orders']
+
+
+def test_retry_replays_the_first_result(printed):
+    client = app31.app.test_client()
+    first = client.post('/print', json=ORDER)
+    retry = client.post('/print', json=ORDER)
+
+    assert first.status_code == retry.status_code == 200
+    assert retry.get_json()['replayed'] is True
+    assert retry.get_json()['jobs'] == first.get_json()['jobs']
+    assert len(printed) == len(first.get_json()['jobs'])
+    assert logged_orders() == 1
+
+
+def test_retry_after_a_failed_enqueue_only_queues_the_tickets(printed, monkeypatch):
+    def broken_enqueue(*args, **kwargs):
+        raise OSError('disk full')
+
+    working_enqueue = app31.enqueue_print_job
+    monkeypatch.setattr(app31, 'enqueue_print_job', broken_enqueue)
+    client = app31.app.test_client()
+    failed = client.post('/print', json=ORDER)
+    assert failed.status_code == 500
+    assert app31._idempotency_results[ORDER['orderId']][1]['status'] == 'logged'
+
+    monkeypatch.setattr(app31, 'enqueue_print_job', working_enqueue)
+    retry = client.post('/print', json=ORDER)
+    assert retry.status_code == 200 and 'replayed' not in retry.get_json()
+    assert printed and logged_orders() == 1
+
+
+@pytest.mark.parametrize('order_id', [['x'], {'id': 1}, 7, '', 'x' * (app31.IDEMPOTENCY_KEY_MAX + 1)])
+def test_malformed_key_is_a_json_400(printed, order_id):
+    response = app31.app.test_client().post('/print', json=dict(ORDER, orderId=order_id))
+    assert response.status_code == 400
+    assert response.get_json()['status'] == 'error'
+    assert not printed
@@ -0,0 +1,39 @@
+import app31
+
+
+def order(n):
+    return {'seat': f'A{n}', 'payByCard': False, 'orderId': f'journal-{n}',
+            'items': [{'name': 'Pizza', 'quantity': n, 'price': 4.5}], 'total': n * 4.5}
+
+
+def test_recover_replays_lost_appends_and_drops_a_torn_journal_line(workdir, monkeypatch):
+    monkeypatch.setattr(app31, 'LEDGER_FSYNC', False)
+    app31.log_order_to_csv(order(1))
+    app31.log_order_to_csv(order(2))
+    (day_file,) = app31.LEDGER_DIR.glob('orders_*.csv')
+    logged = day_file.read_bytes()
+
+    # A power cut: the second order's journal line made it to disk, its write to the
+    # day file only partly; a third batch was cut off while being journalled
+    day_file.write_bytes(logged[:len(logged) - 10])
+    with open(app31.LEDGER_JOURNAL_FILE, mode='ab') as f:
+        f.write(b'[["orders_')
+
+    stats = app31.recover_ledger()
+    assert stats['replayed'] == 1 and stats['torn'] == 1
+    assert day_file.read_bytes() == logged
+    assert app31.LEDGER_JOURNAL_FILE.read_bytes() == b''
+
+    problems = []
+    totals = app31.check_day_file(day_file, lambda line, message: problems.append(message))
+    assert not problems and totals['orders'] == 2
+
+
+def test_recover_leaves_an_intact_ledger_alone(workdir, monkeypatch):
+    monkeypatch.setattr(app31, 'LEDGER_FSYNC', False)
+    app31.log_order_to_csv(order(1))
+    (day_file,) = app31.LEDGER_DIR.glob('orders_*.csv')
+    logged = day_file.read_bytes()
+
+    assert app31.recover_ledger()['replayed'] == 0
+    assert day_file.read_bytes() == logged
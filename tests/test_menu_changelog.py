@@ -0,0 +1,72 @@
+import app31
+
+
+def rename_item(position, name):
+    """Renames one item and commits it as a new menu version; returns the version."""
+    with app31.locked_menu() as menu_data:
+        menu_data[0]['items'][position]['name'] = name
+        return app31.save_menu_data(menu_data)
+
+
+def changelog_lines():
+    with open(app31.MENU_CHANGELOG_FILE, mode='rb') as f:
+        return f.readlines()
+
+
+def write_changelog(lines):
+    with open(app31.MENU_CHANGELOG_FILE, mode='wb') as f:
+        f.writelines(lines)
+
+
+def test_since_merges_the_chain(workdir):
+    start = rename_item(0, 'Nuggets')
+    rename_item(1, 'Pizza')
+    rename_item(2, 'Cured Pizza')
+
+    client = app31.app.test_client()
+    delta = client.get(f'/api/menu?since={start}').get_json()
+    assert delta['from'] == start and delta['version'] == start + 2
+    assert {item['name'] for item in delta['items']} == {'Pizza', 'Cured Pizza'}
+
+
+def test_gap_in_changelog_forces_a_reload(workdir):
+    start = rename_item(0, 'Nuggets')
+    rename_item(1, 'Pizza')
+    rename_item(2, 'Cured Pizza')
+    rename_item(3, 'Club')
+    lines = changelog_lines()
+    write_changelog(lines[:-2] + lines[-1:])  # lose the 'Cured Pizza' change
+
+    assert app31.menu_changes_since(start) is None
+    body = app31.app.test_client().get(f'/api/menu?since={start}').get_json()
+    assert isinstance(body, list)  # the whole menu, not a delta
+    assert [item['name'] for item in body[0]['items'][:4]] == ['Nuggets', 'Pizza', 'Cured Pizza', 'Club']
+    assert len(app31.menu_changes_since(start + 2)) == 1  # from after the gap the chain is intact
+
+
+def test_torn_last_line_does_not_swallow_the_next_change(workdir):
+    start = rename_item(0, 'Nuggets')
+    torn = rename_item(1, 'Pizza')
+    lines = changelog_lines()
+    write_changelog(lines[:-1] + [lines[-1][:len(lines[-1]) // 2]])  # crash halfway through the append
+
+    rename_item(2, 'Cured Pizza')
+    assert app31.menu_changes_since(start) is None
+    chain = app31.menu_changes_since(torn)
+    assert [(delta['from'], delta['version']) for delta in chain] == [(torn, torn + 1)]
+
+
+def test_streams_beyond_the_cap_are_refused(workdir, monkeypatch):
+    monkeypatch.setattr(app31, 'MENU_STREAM_MAX', 2)
+    client = app31.app.test_client()
+    streams = [client.get('/api/menu/stream', buffered=False) for _ in range(2)]
+    refused = client.get('/api/menu/stream')
+    assert refused.status_code == 503 and refused.headers['Retry-After']
+    assert refused.get_json()['status'] == 'error'
+
+    streams[0].close()
+    again = client.get('/api/menu/stream', buffered=False)
+    assert again.status_code == 200
+    for stream in streams[1:] + [again]:
+        stream.close()
+    assert app31._menu_streams['open'] == 0
@@ -0,0 +1,53 @@
+import app31
+
+
+def current_menu(client):
+    response = client.get('/api/menu')
+    return int(response.headers['X-Menu-Version']), response.headers['ETag']
+
+
+def category_names(client):
+    return [category['name'] for category in client.get('/api/menu').get_json()]
+
+
+def test_stale_expected_version_is_a_409(workdir):
+    client = app31.app.test_client()
+    version, _ = current_menu(client)
+    saved = client.post('/api/menu/category', json={'name': 'Wines', 'color': 'bg-red-100',
+                                                    'expected_version': version})
+    assert saved.status_code == 200 and saved.get_json()['version'] == version + 1
+
+    stale = client.post('/api/menu/category', json={'name': 'Teas', 'color': 'bg-green-100',
+                                                    'expected_version': version})
+    assert stale.status_code == 409
+    assert stale.get_json()['version'] == version + 1
+    assert stale.headers['ETag'] == current_menu(client)[1]
+    assert 'Teas' not in category_names(client)
+
+
+def test_stale_if_match_is_a_409(workdir):
+    client = app31.app.test_client()
+    _, etag = current_menu(client)
+    client.post('/api/menu/category', json={'name': 'Wines', 'color': 'bg-red-100'})
+
+    stale = client.put('/api/menu/category/Wines', json={'color': 'bg-blue-100'}, headers={'If-Match': etag})
+    assert stale.status_code == 409
+    version, etag = current_menu(client)
+    assert stale.get_json()['version'] == version
+
+    fresh = client.put('/api/menu/category/Wines', json={'color': 'bg-blue-100'}, headers={'If-Match': etag})
+    assert fresh.status_code == 200
+
+
+def test_stale_batch_applies_none_of_its_operations(workdir):
+    client = app31.app.test_client()
+    version, _ = current_menu(client)
+    client.post('/api/menu/category', json={'name': 'Wines', 'color': 'bg-red-100'})
+
+    stale = client.post('/api/menu/batch', json={
+        'operations': [{'op': 'add_category', 'name': 'Teas', 'color': 'bg-green-100'},
+                       {'op': 'delete_category', 'name': 'Wines'}],
+        'expected_version': version})
+    assert stale.status_code == 409
+    names = category_names(client)
+    assert 'Wines' in names and 'Teas' not in names
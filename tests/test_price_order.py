@@ -0,0 +1,22 @@
+import pytest
+
+import app31
+
+
+def test_off_menu_string_price_is_stored_as_a_number():
+    order = {'seat': 'A1', 'payByCard': False, 'total': '7',
+             'items': [{'name': 'Special', 'quantity': 2, 'price': '3.5'}]}
+    priced, price_check = app31.price_order(order, app31.EMPTY_MENU)
+
+    assert priced['items'][0]['price'] == 3.5
+    assert priced['total'] == 7.0
+    assert price_check['lines'][0]['issue'] == 'unknown'
+    assert price_check['lines'][0]['clientPrice'] == '3.50'
+    assert b'EUR7.00' in app31.build_receipt(priced)
+
+
+@pytest.mark.parametrize('price', ['abc', 'inf', 'nan', [3.5]])
+def test_off_menu_unreadable_price_is_rejected(price):
+    order = {'seat': 'A1', 'items': [{'name': 'Special', 'quantity': 1, 'price': price}]}
+    with pytest.raises(ValueError, match='Invalid price for Special'):
+        app31.price_order(order, app31.EMPTY_MENU)